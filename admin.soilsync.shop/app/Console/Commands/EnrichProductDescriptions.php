@@ -241,6 +241,7 @@ class EnrichProductDescriptions extends Command
             
             $response = Http::timeout(60)->post('http://localhost:8005/ask-ollama', [
                 'question' => $prompt,
+                'lane' => 'background', // batch job: yields to admin and public chat in the LLM queue
                 'temperature' => 0.7,
                 'max_tokens' => 300
             ]);
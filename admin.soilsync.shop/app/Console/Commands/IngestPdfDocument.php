@@ -106,11 +106,13 @@ class IngestPdfDocument extends Command
         $ragConnection = DB::connection('pgsql_rag');
         $processed = 0;
 
+        // Embed all chunks up front in a few batched requests
+        $vectors = $embeddingService->embedBatch($chunks);
+
         foreach ($chunks as $index => $chunk) {
             $this->info("Processing chunk " . ($index + 1) . "/" . count($chunks));
 
-            // Generate embedding
-            $vector = $embeddingService->embed($chunk);
+            $vector = $vectors[$index] ?? null;
 
             if (!$vector) {
                 $this->warn("Failed to generate embedding for chunk {$index}");
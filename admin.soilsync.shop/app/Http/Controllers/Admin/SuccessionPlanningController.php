@@ -1398,20 +1398,17 @@ class SuccessionPlanningController extends Controller
     private function wakeUpAIService()
     {
         try {
-            // Send a quick wake-up ping to the AI service with minimal timeout
-            // Make it completely non-blocking to prevent any 502 issues
-            Http::timeout(1)->connectTimeout(1)->post(env('AI_SERVICE_URL', 'http://localhost:8005') . '/ask', [
-                'question' => 'wake up',
-                'context' => 'system_wake'
-            ]);
+            // Ask the AI service to preload its models (zero-token keep_alive requests).
+            // /warmup only queues the load and returns at once, so no prompt is generated here.
+            Http::timeout(1)->connectTimeout(1)->post(env('AI_SERVICE_URL', 'http://localhost:8005') . '/warmup');
             
-            Log::debug('AI service wake-up ping sent successfully');
+            Log::debug('AI service warm-up requested successfully');
             
         } catch (\Exception $e) {
             // Completely silent fail - don't even log unless in debug mode
             // This prevents any possibility of causing 502 errors
             if (config('app.debug')) {
-                Log::debug('AI wake-up ping failed (non-critical): ' . $e->getMessage());
+                Log::debug('AI warm-up request failed (non-critical): ' . $e->getMessage());
             }
         }
     }
@@ -1456,21 +1453,21 @@ class SuccessionPlanningController extends Controller
         try {
             $this->wakeUpAIService();
             
-            // Test if AI is responding after wake-up
-            $response = Http::timeout(5)->post(env('AI_SERVICE_URL', 'http://localhost:8005') . '/ask', [
-                'question' => 'test response',
-                'context' => 'wake_up_test'
-            ]);
+            // Ask which models are resident instead of running a test prompt
+            $response = Http::timeout(5)->get(env('AI_SERVICE_URL', 'http://localhost:8005') . '/readiness');
             
             if ($response->successful()) {
+                $readiness = $response->json();
+                $ready = $readiness['ready'] ?? false;
                 return response()->json([
                     'success' => true,
-                    'message' => 'AI service is now awake and responding',
-                    'status' => 'online',
-                    'model' => 'llama31-8b'
+                    'message' => $ready ? 'AI service is now awake and responding' : 'AI models are loading',
+                    'status' => $ready ? 'online' : 'warming',
+                    'model' => $readiness['primary_model'] ?? 'mistral:7b',
+                    'hot_models' => $readiness['hot'] ?? []
                 ]);
             } else {
-                throw new \Exception('AI test failed: ' . $response->status());
+                throw new \Exception('AI readiness check failed: ' . $response->status());
             }
             
         } catch (\Exception $e) {
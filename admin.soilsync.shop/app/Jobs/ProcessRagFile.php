@@ -165,11 +165,13 @@ class ProcessRagFile implements ShouldQueue
         $ragConnection = DB::connection('pgsql_rag');
         $processed = 0;
 
+        // Embed all chunks up front in a few batched requests
+        $vectors = $embeddingService->embedBatch($chunks);
+
         foreach ($chunks as $index => $chunk) {
             Log::info("Processing chunk " . ($index + 1) . "/" . count($chunks) . " for {$source}");
 
-            // Generate embedding
-            $vector = $embeddingService->embed($chunk);
+            $vector = $vectors[$index] ?? null;
 
             if (!$vector) {
                 $this->logError("Failed to generate embedding for chunk {$index} in {$source}");
@@ -10,12 +10,15 @@ class EmbeddingService
     protected $ollamaHost;
     protected $model;
     protected $ollamaAvailable = null; // Cache health check result
+    protected $aiServiceUrl;
 
     public function __construct()
     {
         // CORRECT PORT FOR EMBEDDINGS MODEL
         $this->ollamaHost = 'http://localhost:8007';
         $this->model = 'all-minilm:l6-v2';
+        // Batch endpoint: same all-MiniLM-L6-v2 384-d space, resident in the AI service
+        $this->aiServiceUrl = env('SYMBIOSIS_AI_URL', 'http://localhost:8000');
     }
 
     /**
@@ -101,4 +104,46 @@ class EmbeddingService
             return null;
         }
     }
+
+    /**
+     * Embed many texts in a few requests to the AI service's /api/v1/embed
+     *
+     * @param array $texts Texts to embed
+     * @param int $batchSize Texts per request
+     * @return array Vectors keyed like $texts (null where embedding failed)
+     */
+    public function embedBatch(array $texts, int $batchSize = 256): array
+    {
+        $vectors = [];
+        
+        foreach (array_chunk($texts, $batchSize, true) as $batch) {
+            try {
+                $response = Http::timeout(120)->post("{$this->aiServiceUrl}/api/v1/embed", [
+                    'texts' => array_values($batch),
+                ]);
+                
+                if ($response->successful()) {
+                    $embeddings = $response->json('embeddings') ?? [];
+                    Log::info('Embedded batch via AI service', [
+                        'count' => count($batch),
+                        'texts_per_second' => $response->header('X-Embedding-Texts-Per-Second'),
+                    ]);
+                    foreach (array_keys($batch) as $position => $key) {
+                        $vectors[$key] = $embeddings[$position] ?? null;
+                    }
+                    continue;
+                }
+                
+                Log::warning('Batch embedding failed, embedding one by one', ['status' => $response->status()]);
+            } catch (\Exception $e) {
+                Log::warning('Batch embedding unavailable, embedding one by one', ['error' => $e->getMessage()]);
+            }
+            
+            foreach ($batch as $key => $text) {
+                $vectors[$key] = $this->embed($text);
+            }
+        }
+        
+        return $vectors;
+    }
 }
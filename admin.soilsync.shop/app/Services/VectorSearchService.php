@@ -3,6 +3,7 @@
 namespace App\Services;
 
 use Illuminate\Support\Facades\DB;
+use Illuminate\Support\Facades\Http;
 use Illuminate\Support\Facades\Log;
 
 class VectorSearchService
@@ -24,6 +25,12 @@ class VectorSearchService
      */
     public function semanticSearch(string $query, int $limit = 10, array $filters = []): array
     {
+        // One embedding and one database round trip in the Python AI service
+        $federated = $this->federatedSearch($query, $limit, $filters);
+        if ($federated !== null) {
+            return $federated;
+        }
+        
         // Generate embedding for the query
         $queryEmbedding = $this->embeddingService->embed($query);
         
@@ -72,6 +79,36 @@ class VectorSearchService
         return array_slice($allResults, 0, $limit);
     }
     
+    /**
+     * Semantic search through the AI service's /api/v1/search/federated endpoint
+     *
+     * @return array|null Results in the same shape as searchTable(), or null if the service is unavailable
+     *                    or has none of the knowledge tables to search
+     */
+    protected function federatedSearch(string $query, int $limit, array $filters): ?array
+    {
+        try {
+            $response = Http::timeout(10)->post(
+                env('SYMBIOSIS_AI_URL', 'http://localhost:8000') . '/api/v1/search/federated',
+                ['query' => $query, 'limit' => $limit, 'filters' => (object) $filters]
+            );
+            
+            // An empty "searched" list means no table was searchable there, not that nothing matched
+            if ($response->successful() && !empty($response->json('searched'))) {
+                return $response->json('results') ?? [];
+            }
+            
+            Log::debug('Federated search failed, searching tables directly', [
+                'status' => $response->status(),
+                'skipped' => $response->json('skipped') ?? $response->json('detail.skipped'),
+            ]);
+        } catch (\Exception $e) {
+            Log::debug('Federated search unavailable, searching tables directly', ['error' => $e->getMessage()]);
+        }
+        
+        return null;
+    }
+    
     /**
      * Search within a specific knowledge type
      *
@@ -0,0 +1,53 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Support\Facades\DB;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    /**
+     * The RAG database, where general_knowledge lives.
+     */
+    protected $connection = 'pgsql_rag';
+
+    /**
+     * Run the migrations.
+     *
+     * Adds the generated full-text column and its GIN index used by the AI
+     * service's hybrid (vector + keyword) retrieval. The AI service only
+     * checks for the column at startup; it never alters the table itself.
+     */
+    public function up(): void
+    {
+        if (!Schema::connection($this->connection)->hasTable('general_knowledge')
+            || Schema::connection($this->connection)->hasColumn('general_knowledge', 'search_tsv')) {
+            return;
+        }
+
+        // Must match PGVECTOR_TEXT_SEARCH_CONFIG in the AI service, which builds its queries with it
+        $config = env('PGVECTOR_TEXT_SEARCH_CONFIG', 'english');
+        if (!preg_match('/^[a-z_]+$/', $config)) {
+            throw new InvalidArgumentException("Invalid text search configuration: {$config}");
+        }
+
+        $db = DB::connection($this->connection);
+        $db->statement("ALTER TABLE general_knowledge ADD COLUMN search_tsv tsvector GENERATED ALWAYS AS "
+            . "(to_tsvector('{$config}'::regconfig, coalesce(title, '') || ' ' || coalesce(content, ''))) STORED");
+        $db->statement('CREATE INDEX IF NOT EXISTS general_knowledge_search_tsv_gin_idx ON general_knowledge USING gin (search_tsv)');
+    }
+
+    /**
+     * Reverse the migrations.
+     */
+    public function down(): void
+    {
+        if (!Schema::connection($this->connection)->hasTable('general_knowledge')) {
+            return;
+        }
+
+        $db = DB::connection($this->connection);
+        $db->statement('DROP INDEX IF EXISTS general_knowledge_search_tsv_gin_idx');
+        $db->statement('ALTER TABLE general_knowledge DROP COLUMN IF EXISTS search_tsv');
+    }
+};
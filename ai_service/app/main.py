@@ -1,8 +1,9 @@
 # FastAPI main application with Symbiosis Agricultural Intelligence
 # Integrates sacred geometry, biodynamic principles, and energetic plant wisdom
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
 from datetime import datetime, date, timedelta
 from typing import Optional, List, Dict, Tuple
@@ -10,6 +11,10 @@ import json
 import math
 import os
 import glob
+import time
+import base64
+import asyncio
+import numpy as np
 from dotenv import load_dotenv
 
 # Load environment variables FIRST
@@ -19,7 +24,16 @@ from app.models.enhanced_crop_intelligence import EnhancedCropIntelligence
 from app.models.holistic_intelligence import SymbiosisFarmIntelligence
 from app.services.openfarm_sync import OpenFarmSyncService
 from app.services.rag_service import rag_service
-from app.services.llm_service import LLMService
+from app.services.llm_service import page_tags
+from app.services.embedding_service import embedding_engine
+from app.services.embedding_cache import embedding_cache
+from app.services.pg_pool import pg_pool
+from app.services.ollama_client import ollama_client, SSE_HEADERS, ClientDisconnected, cancel_on_disconnect
+from app.services.answer_cache import answer_cache
+from app.services.model_warmup import ModelWarmupScheduler
+from app.services.llm_admission import llm_admission
+from app.services.federated_search import federated_search
+from app.services.reranker import reranker
 
 app = FastAPI(
     title="Symbiosis Agricultural AI",
@@ -36,11 +50,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    """The caller hung up and its generation was cancelled; nobody reads this response"""
+    return Response(status_code=499)
+
 # Initialize AI services
 enhanced_ai = EnhancedCropIntelligence()
 symbiosis_ai = SymbiosisFarmIntelligence()
 openfarm_sync = OpenFarmSyncService()
-llm_service = LLMService()
+# Shares rag_service's store, so ingested docs are visible to retrieval immediately
+llm_service = rag_service.llm_service
+# Keeps the generation models resident in Ollama (replaces "wake up" prompts)
+model_warmup = ModelWarmupScheduler(ollama_client, primary_model=rag_service.pipeline.model)
+
+@app.on_event("startup")
+async def load_embedding_model():
+    """Load the embedding model once so requests never pay the model load"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, embedding_engine.load)
+    except Exception as e:
+        print(f"Warning: Embedding model preload failed: {e}")
+    # The cross-encoder (if enabled) loads on its own worker; requests fall back to vector order meanwhile
+    reranker.preload()
+
+@app.on_event("startup")
+async def start_model_warmup():
+    """Preload the Ollama models in the background and keep them hot"""
+    model_warmup.start()
+
+@app.on_event("shutdown")
+async def close_ollama_client():
+    """Release pooled keep-alive connections to Ollama"""
+    await model_warmup.stop()
+    await ollama_client.aclose()
+    # Anything a failed ingest batch left unpersisted
+    llm_service.flush()
 
 # Pydantic models for request/response
 class CropRecommendationRequest(BaseModel):
@@ -71,6 +116,18 @@ class ChatRequest(BaseModel):
     message: str
     conversation_history: Optional[List[ChatMessage]] = []
 
+class EmbedRequest(BaseModel):
+    texts: List[str]
+    dtype: str = "float32"  # float32 | float16
+    encoding: str = "json"  # json lists, or base64 of little-endian vectors
+
+class FederatedSearchRequest(BaseModel):
+    query: str
+    limit: int = 10
+    filters: Optional[Dict] = {}  # column -> value or list of values, e.g. {"crop_family": "Brassica"}
+    types: Optional[List[str]] = None  # companion, rotation, calendar, general (default all)
+    min_similarity: Optional[float] = None
+
 @app.get("/")
 async def root():
     return {
@@ -273,17 +330,16 @@ async def ingest_biodynamics():
     """Ingest biodynamic_principles_core.txt into local vector store for retrieval."""
     try:
         source_path = "/opt/sites/admin.middleworldfarms.org/ai_service/biodynamic_principles_core.txt"
-        with open(source_path, 'r') as f:
-            text = f.read()
-        chunks = LLMService.chunk_text(text, max_chars=1200, overlap=150)
-        count = llm_service.ingest_corpus(chunks, source=os.path.basename(source_path))
-        return {"success": True, "chunks": count, "source": os.path.basename(source_path)}
+        result = llm_service.ingest_file(source_path, source=os.path.basename(source_path),
+                                         metadata={"chunk_type": "knowledge"})
+        llm_service.flush()
+        return {"success": True, "source": os.path.basename(source_path), **result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(e)}")
 
 @app.post("/api/v1/ingest/admin-docs")
 async def ingest_admin_docs():
-    """Ingest all markdown documentation files from docs folder into vector store."""
+    """Incrementally sync markdown documentation files from docs folder into vector store."""
     try:
         docs_path = "/opt/sites/admin.soilsync.shop/docs"
         md_files = glob.glob(os.path.join(docs_path, "*.md"))
@@ -291,42 +347,165 @@ async def ingest_admin_docs():
         if not md_files:
             return {"success": False, "message": "No markdown files found in docs folder"}
         
-        total_chunks = 0
+        added_chunks = 0
+        deleted_chunks = 0
         processed_files = []
+        sources = []
         
         for md_file in md_files:
+            # Filename is the source key in the manifest
+            filename = os.path.basename(md_file)
+            source = f"admin-docs/{filename}"
+            sources.append(source)
             try:
-                with open(md_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Skip empty files
-                if not content.strip():
-                    continue
-                
-                # Chunk the content
-                chunks = LLMService.chunk_text(content, max_chars=1200, overlap=150)
-                
-                # Ingest with filename as source
-                filename = os.path.basename(md_file)
-                count = llm_service.ingest_corpus(chunks, source=f"admin-docs/{filename}")
-                total_chunks += count
-                processed_files.append({"file": filename, "chunks": count})
-                
+                # Filter fields for contextual help: doc type plus page keywords from the filename
+                result = llm_service.ingest_file(md_file, source=source, metadata={
+                    "chunk_type": "admin_doc", "page_tags": page_tags(os.path.splitext(filename)[0])})
+                added_chunks += result["added"]
+                deleted_chunks += result["deleted"]
+                processed_files.append({"file": filename, **result})
             except Exception as e:
                 print(f"Error processing {md_file}: {e}")
                 continue
         
+        # Docs removed from the folder take their chunks with them
+        removed = llm_service.prune_sources("admin-docs/", keep=sources)
+        deleted_chunks += sum(removed.values())
+        # One write of a local index for the whole batch
+        llm_service.flush()
+        
         return {
             "success": True, 
-            "total_chunks": total_chunks, 
+            "added_chunks": added_chunks,
+            "deleted_chunks": deleted_chunks,
             "files_processed": len(processed_files),
+            "files_changed": sum(1 for f in processed_files if f["status"] in ("new", "updated")),
+            "files_removed": list(removed),
             "files": processed_files
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Admin docs ingestion failed: {str(e)}")
 
+EMBED_MAX_TEXTS = int(os.getenv('EMBED_MAX_TEXTS', '2048'))
+
+@app.post("/api/v1/embed")
+async def embed(request: EmbedRequest, response: Response):
+    """Batch-embed texts with the resident model (same 384-d space as the pgvector tables)"""
+    if not request.texts:
+        raise HTTPException(status_code=400, detail="texts must not be empty")
+    if len(request.texts) > EMBED_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"At most {EMBED_MAX_TEXTS} texts per request")
+    if request.dtype not in ("float32", "float16") or request.encoding not in ("json", "base64"):
+        raise HTTPException(status_code=400, detail="dtype must be float32|float16, encoding json|base64")
+    try:
+        started = time.perf_counter()
+        # Cached texts skip the model; the rest share batched encode calls
+        vectors = await asyncio.get_running_loop().run_in_executor(None, llm_service.embed_texts, request.texts)
+        elapsed = time.perf_counter() - started
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Embedding failed: {str(e)}")
+
+    array = np.asarray(vectors, dtype='<f2' if request.dtype == "float16" else '<f4')
+    if request.encoding == "base64":
+        embeddings = [base64.b64encode(row.tobytes()).decode('ascii') for row in array]
+    elif request.dtype == "float16":
+        # float16 precision is ~4 decimals; rounding keeps the JSON as short as the data
+        embeddings = np.round(array.astype(np.float64), 4).tolist()
+    else:
+        embeddings = array.tolist()
+
+    response.headers["X-Embedding-Model"] = llm_service.embedding_model
+    response.headers["X-Embedding-Count"] = str(len(request.texts))
+    response.headers["X-Embedding-Seconds"] = f"{elapsed:.4f}"
+    response.headers["X-Embedding-Texts-Per-Second"] = f"{len(request.texts) / elapsed:.1f}" if elapsed > 0 else "inf"
+    return {
+        "success": True,
+        "model": llm_service.embedding_model,
+        "dimensions": int(array.shape[1]),
+        "dtype": request.dtype,
+        "encoding": request.encoding,
+        "embeddings": embeddings
+    }
+
+@app.get("/api/v1/embeddings/stats")
+async def get_embedding_stats():
+    """Throughput, queue-depth and cache hit-rate counters for embeddings"""
+    return {"success": True, "stats": embedding_engine.get_stats(), "cache": embedding_cache.get_stats()}
+
+@app.get("/api/v1/vector-store/stats")
+async def get_vector_store_stats():
+    """Connection pool metrics (wait time, in-use, errors) for the vector store and knowledge database"""
+    return {"success": True, "pool": pg_pool.get_stats(), "knowledge_pool": federated_search.pool.get_stats()}
+
+@app.get("/api/v1/llm/stats")
+async def get_llm_stats():
+    """In-flight, retry, latency and admission-queue counters for the shared Ollama client"""
+    pipeline = rag_service.pipeline
+    return {
+        "success": True,
+        "ollama": ollama_client.get_stats(),
+        "answer_cache": answer_cache.get_stats(),
+        "admission": llm_admission.get_stats(),
+        "reranker": reranker.get_stats(),
+        "pipeline": {"backend": pipeline.backend, "model": pipeline.model, "timeout": pipeline.timeout}
+    }
+
+@app.post("/warmup")
+async def warmup_models():
+    """Queue zero-token keep_alive loads and return immediately with what is hot now"""
+    queued = model_warmup.schedule()
+    return {"success": True, "queued": queued, **await model_warmup.readiness()}
+
+@app.get("/readiness")
+async def readiness():
+    """Which models are resident in Ollama; ready means the primary model is hot"""
+    return await model_warmup.readiness()
+
+@app.post("/api/v1/vector-store/reindex")
+async def reindex_vector_store(payload: Optional[Dict] = None):
+    """Rebuild the ANN index on a vector table after a bulk load"""
+    try:
+        table = (payload or {}).get("table", "vectors")
+        if table not in ("vectors", "general_knowledge"):
+            raise HTTPException(status_code=400, detail=f"Unknown vector table: {table}")
+        # general_knowledge lives in the RAG database, vectors in the document store
+        store = rag_service.vector_store if table == "general_knowledge" else llm_service.store
+        if not store or not store.available:
+            raise HTTPException(status_code=503, detail="Vector store not available")
+        result = await asyncio.get_running_loop().run_in_executor(None, store.reindex, table)
+        if table == "general_knowledge":
+            rag_service.index_ready = True
+        return {"success": True, **result}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reindex failed: {str(e)}")
+
+@app.post("/api/v1/search/federated")
+async def federated_knowledge_search(request: FederatedSearchRequest):
+    """Semantic search over all knowledge tables: one embedding, one round trip, merged top-k"""
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    if not federated_search.available:
+        raise HTTPException(status_code=503, detail="Knowledge database not available")
+    try:
+        loop = asyncio.get_running_loop()
+        embedding = (await loop.run_in_executor(None, llm_service.embed_texts, [request.query]))[0]
+        result = await loop.run_in_executor(None, lambda: federated_search.search(
+            embedding, limit=max(1, min(request.limit, 100)), filters=request.filters,
+            types=request.types, min_similarity=request.min_similarity))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Federated search failed: {str(e)}")
+    if not result["searched"]:
+        # Nothing searchable here is not "no matches": let the caller fall back
+        raise HTTPException(status_code=503, detail={"message": "No searchable knowledge tables",
+                                                     "skipped": result["skipped"]})
+    return {"success": True, "query": request.query, **result}
+
 @app.post("/api/v1/contextual-help")
-async def get_contextual_help(request: dict):
+async def get_contextual_help(request: dict, http_request: Request):
     """Get contextual help based on current page and user query."""
     try:
         page_context = request.get("page_context", "")
@@ -345,7 +524,7 @@ async def get_contextual_help(request: dict):
         query = " ".join(context_parts)
         
         # Get RAG-enhanced response
-        response = rag_service.get_contextual_help(query, page_context)
+        response = await cancel_on_disconnect(http_request, rag_service.get_contextual_help(query, page_context))
         
         return {
             "success": True,
@@ -356,11 +535,13 @@ async def get_contextual_help(request: dict):
                 "query": query
             }
         }
+    except ClientDisconnected:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Contextual help failed: {str(e)}")
 
 @app.post("/api/v1/chat")
-async def chat_with_rag(request: ChatRequest):
+async def chat_with_rag(request: ChatRequest, http_request: Request):
     """Advanced chat endpoint with RAG-enhanced responses"""
     try:
         # Convert conversation history to dict format
@@ -368,11 +549,11 @@ async def chat_with_rag(request: ChatRequest):
         for msg in request.conversation_history:
             conversation_history.append({"role": msg.role, "content": msg.content})
         
-        # Get RAG-enhanced response
-        response = rag_service.get_augmented_response(
+        # Get RAG-enhanced response (abandoned if the caller hangs up)
+        response = await cancel_on_disconnect(http_request, rag_service.get_augmented_response(
             user_message=request.message,
             conversation_history=conversation_history
-        )
+        ))
         
         if response:
             return {
@@ -391,6 +572,8 @@ async def chat_with_rag(request: ChatRequest):
                 "biodynamic_knowledge": False
             }
             
+    except ClientDisconnected:
+        raise
     except Exception as e:
         # Final fallback
         fallback_response = rag_service.get_fallback_wisdom(request.message)
@@ -402,27 +585,37 @@ async def chat_with_rag(request: ChatRequest):
             "biodynamic_knowledge": False
         }
 
+@app.post("/api/v1/chat/stream")
+async def chat_with_rag_stream(request: ChatRequest, http_request: Request):
+    """Streaming variant of /api/v1/chat: tokens are relayed as Server-Sent Events"""
+    conversation_history = [{"role": msg.role, "content": msg.content} for msg in request.conversation_history]
+    return StreamingResponse(
+        rag_service.stream_augmented_response(request.message, conversation_history, http_request),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+def build_ask_message(payload: Dict) -> str:
+    """Prefix the legacy /ask question with its crop and season context"""
+    question = payload.get("question", "")
+    context_parts = []
+    if payload.get("crop_type"):
+        context_parts.append(f"Crop: {payload['crop_type']}")
+    if payload.get("season"):
+        context_parts.append(f"Season: {payload['season']}")
+    if context_parts:
+        return f"{' | '.join(context_parts)} | {question}"
+    return question
+
 @app.post("/ask")
-async def ask_compatibility(payload: Dict):
+async def ask_compatibility(payload: Dict, http_request: Request):
     """Backward-compatible endpoint for existing UI"""
     try:
         question = payload.get("question", "")
-        crop = payload.get("crop_type", "")
-        season = payload.get("season", "")
-        
-        # Build enhanced message with context
-        context_parts = []
-        if crop:
-            context_parts.append(f"Crop: {crop}")
-        if season:
-            context_parts.append(f"Season: {season}")
-        
-        enhanced_message = question
-        if context_parts:
-            enhanced_message = f"{' | '.join(context_parts)} | {question}"
+        enhanced_message = build_ask_message(payload)
         
         # Use RAG service
-        response = rag_service.get_augmented_response(enhanced_message)
+        response = await cancel_on_disconnect(http_request, rag_service.get_augmented_response(enhanced_message))
         
         if response:
             return {
@@ -438,6 +631,8 @@ async def ask_compatibility(payload: Dict):
                 "source": "fallback"
             }
             
+    except ClientDisconnected:
+        raise
     except Exception as e:
         fallback = rag_service.get_fallback_wisdom(payload.get("question", ""))
         return {
@@ -446,6 +641,15 @@ async def ask_compatibility(payload: Dict):
             "source": "error_fallback"
         }
 
+@app.post("/ask/stream")
+async def ask_compatibility_stream(payload: Dict, http_request: Request):
+    """Streaming variant of /ask: tokens are relayed as Server-Sent Events"""
+    return StreamingResponse(
+        rag_service.stream_augmented_response(build_ask_message(payload), http_request=http_request),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 @app.post("/ask-test")
 async def ask_test(payload: Dict):
     """Minimal test endpoint that doesn't use LLM"""
@@ -488,7 +692,7 @@ async def ask_simple(payload: Dict):
         
         # Use LLM service directly
         messages = [{"role": "user", "content": enhanced_question}]
-        response = llm_service.chat(messages)
+        response = await llm_service.chat(messages)
         
         return {
             "success": True,
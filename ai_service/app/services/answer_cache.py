@@ -0,0 +1,161 @@
+# Semantic Answer Cache for Symbiosis
+# Reuses LLM answers for paraphrased questions: embedding similarity, scoped by model + context
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Iterable
+
+import numpy as np
+
+from app.services.embedding_service import embedding_engine
+
+
+def context_fingerprint(parts: Iterable[str]) -> str:
+    """Stable short hash of the retrieved context an answer was generated from."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or '').encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()[:16]
+
+
+async def embed_for_cache(text: str) -> Optional[List[float]]:
+    """Query embedding for cache lookups; None (cache bypassed) if the model is unavailable."""
+    try:
+        return (await embedding_engine.encode_async([text]))[0]
+    except Exception as e:
+        print(f"Warning: Answer cache embedding failed: {e}")
+        return None
+
+
+@dataclass
+class CachedAnswer:
+    scope: str
+    embedding: np.ndarray
+    answer: Dict[str, Any]
+    created: float
+    generation_ms: float
+
+
+class SemanticAnswerCache:
+    """In-process cache of generated answers keyed by query-embedding similarity.
+
+    Entries only match within the same scope (model + retrieved-context
+    fingerprint), expire after a TTL, are evicted least-recently-used beyond
+    max_entries, and are dropped wholesale when the knowledge base changes.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, max_entries: Optional[int] = None,
+                 ttl_seconds: Optional[float] = None):
+        self.enabled = os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+        self.threshold = float(threshold or os.getenv('ANSWER_CACHE_THRESHOLD', '0.95'))
+        self.max_entries = int(max_entries or os.getenv('ANSWER_CACHE_MAX_ENTRIES', '2000'))
+        self.ttl_seconds = float(ttl_seconds or os.getenv('ANSWER_CACHE_TTL_SECONDS', '86400'))
+
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._scopes: Dict[str, List[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self._lookups = 0
+        self._hits = 0
+        self._saved_ms = 0.0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def scope_for(model: str, fingerprint: str) -> str:
+        return f"{model}|{fingerprint}"
+
+    def lookup(self, embedding: Optional[List[float]], model: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Best cached answer in scope with cosine similarity >= threshold."""
+        if not self.enabled or embedding is None:
+            return None
+        scope = self.scope_for(model, fingerprint)
+        query = np.asarray(embedding, dtype=np.float32)
+        now = time.time()
+
+        with self._lock:
+            self._lookups += 1
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._scopes.get(scope, [])):
+                entry = self._entries[entry_id]
+                if now - entry.created > self.ttl_seconds:
+                    self._remove(entry_id)
+                    self._expirations += 1
+                    continue
+                # Embeddings are normalized, so the dot product is cosine similarity
+                score = float(np.dot(entry.embedding, query))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                return None
+            entry = self._entries[best_id]
+            self._entries.move_to_end(best_id)
+            self._hits += 1
+            self._saved_ms += entry.generation_ms
+            return {**entry.answer, "cache_similarity": round(best_score, 4)}
+
+    def store(self, embedding: Optional[List[float]], model: str, fingerprint: str,
+              answer: Dict[str, Any], generation_ms: float):
+        if not self.enabled or embedding is None:
+            return
+        scope = self.scope_for(model, fingerprint)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = CachedAnswer(
+                scope=scope,
+                embedding=np.asarray(embedding, dtype=np.float32),
+                answer=answer,
+                created=time.time(),
+                generation_ms=generation_ms,
+            )
+            self._scopes.setdefault(scope, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        ids = self._scopes.get(entry.scope)
+        if ids is not None:
+            ids.remove(entry_id)
+            if not ids:
+                del self._scopes[entry.scope]
+
+    def invalidate(self, reason: str = "knowledge base changed"):
+        """Drop every cached answer; called whenever the knowledge base is written."""
+        with self._lock:
+            if self._entries:
+                print(f"Answer cache cleared ({len(self._entries)} entries): {reason}")
+            self._entries.clear()
+            self._scopes.clear()
+            self._invalidations += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_ratio": round(self._hits / self._lookups, 4) if self._lookups else 0.0,
+                "latency_saved_ms": round(self._saved_ms, 1),
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
+
+
+# Create singleton instance
+answer_cache = SemanticAnswerCache()
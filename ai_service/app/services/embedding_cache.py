@@ -0,0 +1,195 @@
+# Embedding Cache for Symbiosis
+# Content-addressed (model, SHA-256 of normalised text) cache: in-memory LRU in front of SQLite
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data', 'embedding_cache.sqlite3'
+)
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for the cache key: NFC, collapsed whitespace, stripped."""
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFC', text)).strip()
+
+
+class EmbeddingCache:
+    """Persistent embedding cache shared by ingestion and query paths.
+
+    Lookups hit a bounded in-memory LRU first, then an on-disk SQLite table.
+    Both tiers evict least-recently-used entries once they exceed their bound.
+    """
+
+    def __init__(self, path: Optional[str] = None, memory_entries: Optional[int] = None,
+                 disk_entries: Optional[int] = None):
+        self.enabled = os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+        self.path = path or os.getenv('EMBEDDING_CACHE_PATH', DEFAULT_CACHE_PATH)
+        self.memory_entries = int(memory_entries or os.getenv('EMBEDDING_CACHE_MEMORY_ENTRIES', '10000'))
+        self.disk_entries = int(disk_entries or os.getenv('EMBEDDING_CACHE_DISK_ENTRIES', '500000'))
+
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_count = 0
+
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._memory_evictions = 0
+        self._disk_evictions = 0
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+        return f"{model}:{digest}"
+
+    # ------------- Disk tier -------------
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._db is not None:
+            return self._db
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access_idx ON embeddings (last_access)")
+            self._disk_count = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._db = db
+        except Exception as e:
+            print(f"Warning: Embedding cache disk tier unavailable: {e}")
+            self.enabled = False
+        return self._db
+
+    # ------------- Lookup / insert -------------
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached embeddings in input order, None where the text is not cached."""
+        if not self.enabled or not texts:
+            return [None] * len(texts)
+
+        keys = [self.key(model, t) for t in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            disk_lookup: Dict[str, List[int]] = {}
+            for i, k in enumerate(keys):
+                vector = self._memory.get(k)
+                if vector is not None:
+                    self._memory.move_to_end(k)
+                    results[i] = vector
+                    self._memory_hits += 1
+                else:
+                    disk_lookup.setdefault(k, []).append(i)
+
+            db = self._connect() if disk_lookup else None
+            if db is not None:
+                found = self._read_disk(db, list(disk_lookup))
+                for k, vector in found.items():
+                    for i in disk_lookup[k]:
+                        results[i] = vector
+                    self._disk_hits += len(disk_lookup[k])
+                    self._remember(k, vector)
+
+            self._misses += sum(1 for r in results if r is None)
+        return results
+
+    def _read_disk(self, db: sqlite3.Connection, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk).fetchall()
+            for k, blob in rows:
+                found[k] = array('f', blob).tolist()
+        if found:
+            now = time.time()
+            db.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, k) for k in found])
+            db.commit()
+        return found
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        if not self.enabled or not texts:
+            return
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            k = self.key(model, text)
+            rows[k] = (k, len(vector), array('f', vector).tobytes(), now)
+
+        with self._lock:
+            for k, row in rows.items():
+                self._remember(k, array('f', row[2]).tolist())
+            db = self._connect()
+            if db is None:
+                return
+            before = db.total_changes
+            db.executemany("INSERT OR IGNORE INTO embeddings (key, dim, vector, last_access) VALUES (?, ?, ?, ?)",
+                           list(rows.values()))
+            db.commit()
+            self._disk_count += db.total_changes - before
+            self._evict_disk(db)
+
+    def _remember(self, k: str, vector: List[float]):
+        self._memory[k] = vector
+        self._memory.move_to_end(k)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self._memory_evictions += 1
+
+    def _evict_disk(self, db: sqlite3.Connection):
+        excess = self._disk_count - self.disk_entries
+        if excess <= 0:
+            return
+        # Evict an extra 5% so we don't pay for eviction on every insert
+        target = excess + self.disk_entries // 20
+        db.execute("""
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?
+            )
+        """, (target,))
+        db.commit()
+        remaining = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._disk_evictions += self._disk_count - remaining
+        self._disk_count = remaining
+
+    # ------------- Metrics -------------
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._memory_hits + self._disk_hits
+            lookups = hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "path": self.path,
+                "memory_entries": len(self._memory),
+                "memory_capacity": self.memory_entries,
+                "disk_entries": self._disk_count,
+                "disk_capacity": self.disk_entries,
+                "memory_hits": self._memory_hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_evictions": self._memory_evictions,
+                "disk_evictions": self._disk_evictions,
+            }
+
+
+# Create singleton instance
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,172 @@
+# Embedding Engine for Symbiosis
+# Process-wide resident sentence-transformers model with micro-batched encoding
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+from queue import Queue, Empty
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.services.embedding_cache import embedding_cache
+
+
+class EmbeddingEngine:
+    """Resident embedding model shared by every caller in the process.
+
+    The model is loaded once. Concurrent encode() calls are queued and folded
+    into a single model.encode call, bounded by max_batch texts and a
+    max_wait_ms collection window.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, max_batch: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None):
+        self.model_name = model_name or os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+        self.max_batch = int(max_batch or os.getenv('EMBEDDING_MAX_BATCH', '64'))
+        self.max_wait = float(max_wait_ms or os.getenv('EMBEDDING_MAX_WAIT_MS', '5')) / 1000.0
+
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._queue: "Queue[Tuple[List[str], Future]]" = Queue()
+        self._worker: Optional[threading.Thread] = None
+
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._texts = 0
+        self._batches = 0
+        self._encode_seconds = 0.0
+        self._load_seconds = 0.0
+        self._errors = 0
+
+    # ------------- Lifecycle -------------
+    def load(self):
+        """Load the model and start the batching worker (idempotent)."""
+        with self._load_lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                started = time.perf_counter()
+                self._model = SentenceTransformer(self.model_name)
+                self._load_seconds = time.perf_counter() - started
+                print(f"Embedding model {self.model_name} loaded in {self._load_seconds:.2f}s")
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='embedding-engine', daemon=True)
+                self._worker.start()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def dimension(self) -> int:
+        self.load()
+        return self._model.get_sentence_embedding_dimension()
+
+    # ------------- Encoding -------------
+    def submit(self, texts: List[str]) -> Future:
+        """Queue texts for the next batch; the future resolves to their embeddings."""
+        self.load()
+        future: Future = Future()
+        self._queue.put((list(texts), future))
+        return future
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        """Blocking encode of texts into normalized embeddings."""
+        if not texts:
+            return []
+        return self.submit(texts).result()
+
+    def encode_cached(self, texts: List[str]) -> List[List[float]]:
+        """Blocking encode through the content-addressed cache; only misses reach the model."""
+        embeddings = embedding_cache.get_many(self.model_name, texts)
+        missing: Dict[str, List[int]] = {}
+        for i, vector in enumerate(embeddings):
+            if vector is None:
+                missing.setdefault(embedding_cache.key(self.model_name, texts[i]), []).append(i)
+        if not missing:
+            return embeddings
+
+        # Encode each distinct missing text once, even if repeated in the batch
+        positions = list(missing.values())
+        miss_texts = [texts[idx[0]] for idx in positions]
+        fresh = self.encode(miss_texts)
+        embedding_cache.put_many(self.model_name, miss_texts, fresh)
+        for idx, vector in zip(positions, fresh):
+            for i in idx:
+                embeddings[i] = vector
+        return embeddings
+
+    async def encode_async(self, texts: List[str]) -> List[List[float]]:
+        """Awaitable encode for async handlers; never blocks the event loop."""
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        # load() may take seconds on first use, keep it off the loop as well
+        future = await loop.run_in_executor(None, self.submit, texts)
+        return await asyncio.wrap_future(future)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            pending = [first]
+            count = len(first[0])
+            deadline = time.monotonic() + self.max_wait
+
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except Empty:
+                    break
+                pending.append(item)
+                count += len(item[0])
+
+            self._encode_batch(pending)
+
+    def _encode_batch(self, pending: List[Tuple[List[str], Future]]):
+        texts = [t for batch_texts, _ in pending for t in batch_texts]
+        started = time.perf_counter()
+        try:
+            vectors = self._model.encode(texts, batch_size=self.max_batch, normalize_embeddings=True).tolist()
+        except Exception as e:
+            with self._stats_lock:
+                self._errors += 1
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - started
+
+        offset = 0
+        for batch_texts, future in pending:
+            future.set_result(vectors[offset:offset + len(batch_texts)])
+            offset += len(batch_texts)
+
+        with self._stats_lock:
+            self._requests += len(pending)
+            self._texts += len(texts)
+            self._batches += 1
+            self._encode_seconds += elapsed
+
+    # ------------- Metrics -------------
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "model": self.model_name,
+                "model_loaded": self.loaded,
+                "load_seconds": round(self._load_seconds, 3),
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self._queue.qsize(),
+                "requests": self._requests,
+                "texts": self._texts,
+                "batches": self._batches,
+                "avg_batch_size": round(self._texts / self._batches, 2) if self._batches else 0.0,
+                "texts_per_second": round(self._texts / self._encode_seconds, 1) if self._encode_seconds else 0.0,
+                "errors": self._errors,
+            }
+
+
+# Create singleton instance
+embedding_engine = EmbeddingEngine()
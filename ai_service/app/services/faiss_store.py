@@ -0,0 +1,241 @@
+# FAISS Vector Store for Symbiosis
+# Offline, in-process alternative to PgVectorStore for single-box deployments
+
+import os
+import json
+import time
+import threading
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from app.services.llm_service import VectorRecord, check_filters, metadata_matches
+
+DEFAULT_INDEX_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data', 'faiss'
+)
+
+
+class FaissVectorStore:
+    """FAISS inner-product index with the same add/query interface as PgVectorStore.
+
+    Embeddings are normalized, so IndexFlatIP ranks exactly like pgvector's
+    <#> operator. The index is persisted to disk and memory-mapped on startup;
+    texts and metadata live alongside it in a JSONL file whose line number is
+    the FAISS id. Writes only change memory and mark the store dirty; flush()
+    persists index, records and manifest once at the end of a sync or ingest
+    batch, so per-file syncs don't each rewrite the whole index.
+    """
+
+    def __init__(self, index_dir: Optional[str] = None, dimension: int = 384):
+        import faiss
+        self._faiss = faiss
+
+        self.index_dir = index_dir or os.getenv('FAISS_INDEX_DIR', DEFAULT_INDEX_DIR)
+        self.index_path = os.path.join(self.index_dir, 'vectors.faiss')
+        self.records_path = os.path.join(self.index_dir, 'records.jsonl')
+        self.manifest_path = os.path.join(self.index_dir, 'manifest.json')
+        self.dimension = dimension
+        self.index_type = 'faiss_flat_ip'
+
+        self._lock = threading.RLock()
+        self._mmapped = False
+        self._dirty = False
+        self.records: List[Dict[str, Any]] = []
+        self.manifest: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    # ------------- Persistence -------------
+    def _load(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        if os.path.exists(self.index_path):
+            try:
+                self.index = self._faiss.read_index(self.index_path, self._faiss.IO_FLAG_MMAP)
+                self._mmapped = True
+            except Exception:
+                self.index = self._faiss.read_index(self.index_path)
+        else:
+            self.index = self._faiss.IndexFlatIP(self.dimension)
+
+        if os.path.exists(self.records_path):
+            with open(self.records_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        self.records.append(json.loads(line))
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+        # A crash between the records append and the index write leaves them out of step
+        if len(self.records) != self.index.ntotal:
+            print(f"Warning: FAISS index has {self.index.ntotal} vectors but {len(self.records)} records, truncating")
+            keep = min(len(self.records), self.index.ntotal)
+            self.records = self.records[:keep]
+            self._ensure_writable()
+            if self.index.ntotal > keep:
+                self.index.remove_ids(np.arange(keep, self.index.ntotal, dtype=np.int64))
+            self._rewrite_records()
+            self._write_index()
+
+    def _ensure_writable(self):
+        """Memory-mapped indexes are read-only; load into RAM before the first write."""
+        if self._mmapped:
+            self.index = self._faiss.read_index(self.index_path)
+            self._mmapped = False
+
+    def _write_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        self._faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, self.index_path)
+
+    def _rewrite_records(self):
+        tmp_path = f"{self.records_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in self.records:
+                f.write(json.dumps(record) + '\n')
+        os.replace(tmp_path, self.records_path)
+
+    def flush(self):
+        """Persist pending changes: records, then index, then manifest.
+
+        The manifest goes last, so a crash before it makes the next ingest
+        re-sync the affected files; a records/index count mismatch from a
+        crash in between is truncated on load.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            self._rewrite_records()
+            self._write_index()
+            self._write_manifest()
+            self._dirty = False
+
+    def _write_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _remove_positions(self, positions: List[int]):
+        """Drop records by position; IndexFlat.remove_ids compacts ids the same way."""
+        if not positions:
+            return
+        self._ensure_writable()
+        self.index.remove_ids(np.asarray(sorted(positions), dtype=np.int64))
+        drop = set(positions)
+        self.records = [r for i, r in enumerate(self.records) if i not in drop]
+        self._dirty = True
+
+    # ------------- Store interface -------------
+    def add(self, texts: List[str], embeddings: List[List[float]], metadatas: Optional[List[Dict[str, Any]]] = None,
+            batch_size: Optional[int] = None) -> Dict[str, Any]:
+        if metadatas is None:
+            metadatas = [{} for _ in texts]
+        started = time.perf_counter()
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension)
+
+        with self._lock:
+            self._ensure_writable()
+            new_records = [{"text": t, "metadata": m} for t, m in zip(texts, metadatas)]
+            self.index.add(vectors)
+            self.records.extend(new_records)
+            self._dirty = True
+
+        elapsed = time.perf_counter() - started
+        return {
+            "rows": len(new_records),
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(len(new_records) / elapsed, 1) if elapsed > 0 else float(len(new_records)),
+        }
+
+    def query(self, query_embedding: List[float], top_k: int = 4, filters: Optional[Dict[str, Any]] = None,
+              **_search_options) -> List[VectorRecord]:
+        check_filters(filters)
+        vector = np.asarray([query_embedding], dtype=np.float32)
+        with self._lock:
+            if self.index.ntotal == 0:
+                return []
+            # No WHERE clause here: filtered queries rank everything and keep the first top_k matches
+            k = self.index.ntotal if filters else min(top_k, self.index.ntotal)
+            scores, ids = self.index.search(vector, k)
+
+            results = []
+            for score, idx in zip(scores[0], ids[0]):
+                if idx < 0 or len(results) >= top_k:
+                    break
+                record = self.records[idx]
+                if filters and not metadata_matches(record["metadata"], filters):
+                    continue
+                try:
+                    embedding = self.index.reconstruct(int(idx)).tolist()
+                except Exception:
+                    embedding = []
+                results.append(VectorRecord(text=record["text"], embedding=embedding, metadata=record["metadata"]))
+            return results
+
+    # ------------- Ingest manifest -------------
+    def get_manifest(self, source: str) -> Optional[Dict[str, Any]]:
+        entry = self.manifest.get(source)
+        return dict(entry, source=source) if entry else None
+
+    def list_sources(self, prefix: str = '') -> List[str]:
+        return [s for s in self.manifest if s.startswith(prefix)]
+
+    def touch_source(self, source: str, mtime: float):
+        with self._lock:
+            if source in self.manifest:
+                self.manifest[source]["mtime"] = mtime
+                self._dirty = True
+
+    def sync_source(self, source: str, mtime: Optional[float], content_hash: str, chunk_hashes: List[str],
+                    stale_hashes: List[str], texts: List[str], embeddings: List[List[float]],
+                    metadatas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Apply one file's chunk diff in memory; flush() persists it with the manifest last."""
+        stale = set(stale_hashes)
+        with self._lock:
+            positions = [
+                i for i, r in enumerate(self.records)
+                if r["metadata"].get("source") == source
+                and (r["metadata"].get("chunk_hash") is None or r["metadata"].get("chunk_hash") in stale)
+            ]
+            self._remove_positions(positions)
+            if texts:
+                self.add(texts, embeddings, metadatas)
+            self.manifest[source] = {"mtime": mtime, "content_hash": content_hash, "chunk_hashes": chunk_hashes}
+            self._dirty = True
+        return {"added": len(texts), "deleted": len(positions)}
+
+    def delete_source(self, source: str) -> int:
+        with self._lock:
+            positions = [i for i, r in enumerate(self.records) if r["metadata"].get("source") == source]
+            self._remove_positions(positions)
+            self.manifest.pop(source, None)
+            self._dirty = True
+        return len(positions)
+
+    def tag_source(self, source: str, metadata: Dict[str, Any]) -> int:
+        with self._lock:
+            changed = 0
+            for record in self.records:
+                meta = record["metadata"]
+                if meta.get("source") == source and any(meta.get(k) != v for k, v in metadata.items()):
+                    meta.update(metadata)
+                    changed += 1
+            if changed:
+                self._dirty = True
+        return changed
+
+    def count(self) -> int:
+        return self.index.ntotal
+
+    def ensure_index(self, table: str = 'vectors', column: str = 'embedding') -> Optional[str]:
+        # Flat index is always exact and needs no separate ANN structure
+        return None
+
+    def reindex(self, table: str = 'vectors', column: str = 'embedding') -> Dict[str, Any]:
+        return {"table": table, "index": self.index_path, "index_type": self.index_type, "vectors": self.index.ntotal}
@@ -0,0 +1,197 @@
+# Federated Knowledge Search for Symbiosis
+# One query embedding, one UNION ALL round trip across the pgvector knowledge tables
+
+import os
+import time
+import threading
+from typing import List, Dict, Any, Optional
+
+from app.services.pg_pool import PgConnectionPool, knowledge_pool, POSTGRES_AVAILABLE
+from app.services.embedding_cache import normalize_text
+from app.services.llm_service import vector_literal
+
+if POSTGRES_AVAILABLE:
+    import psycopg2.extras
+    from psycopg2 import sql
+
+# knowledge_type -> table, and the columns that make up a result's text (also the dedupe key)
+KNOWLEDGE_TABLES = {
+    'companion': ('companion_planting_knowledge',
+                  ['primary_crop', 'companion_plant', 'relationship_type', 'benefits', 'planting_notes']),
+    'rotation': ('crop_rotation_knowledge',
+                 ['previous_crop', 'following_crop', 'relationship', 'benefits', 'risks']),
+    'calendar': ('uk_planting_calendar',
+                 ['crop_name', 'variety_type', 'seasonal_notes', 'uk_specific_advice']),
+    'general': ('general_knowledge', ['title', 'content']),
+}
+
+# Never returned: the vector itself and the duplicate full-text copy
+HIDDEN_COLUMNS = {'embedding', 'searchable_content'}
+
+
+class FederatedSearch:
+    """Top-k over all knowledge tables in one statement.
+
+    Each table contributes its own ORDER BY embedding <=> query LIMIT n
+    branch (so every branch can use its ANN index) and the branches are
+    merged with UNION ALL. Filters are pushed into the WHERE clause of the
+    tables that have the column; a table without a filtered column cannot
+    match and is left out. Table columns and embedding dimensions are read
+    from the catalog once per schema TTL, so unknown filter columns are
+    rejected and tables embedded with a different model are skipped.
+
+    The knowledge tables live in Laravel's pgsql_rag database, so this
+    searches through knowledge_pool (PGSQL_RAG_*), like RAGService does.
+    """
+
+    def __init__(self, pool: Optional[PgConnectionPool] = None):
+        self.pool = pool or knowledge_pool
+        self.per_table_extra = int(os.getenv('FEDERATED_PER_TABLE_EXTRA', '5'))
+        self.schema_ttl = float(os.getenv('FEDERATED_SCHEMA_TTL_SECONDS', '300'))
+        self.ef_search = int(os.getenv('PGVECTOR_EF_SEARCH', '40'))
+
+        self._schema: Dict[str, Dict[str, Any]] = {}
+        self._schema_loaded = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return POSTGRES_AVAILABLE and self.pool.available()
+
+    # ------------- Schema -------------
+    def schema(self, refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        """knowledge_type -> {table, columns, dims} for the tables that exist."""
+        with self._lock:
+            if refresh or not self._schema or time.monotonic() - self._schema_loaded > self.schema_ttl:
+                self._schema = self._load_schema()
+                self._schema_loaded = time.monotonic()
+            return self._schema
+
+    def _load_schema(self) -> Dict[str, Dict[str, Any]]:
+        tables = {table: kind for kind, (table, _) in KNOWLEDGE_TABLES.items()}
+        schema: Dict[str, Dict[str, Any]] = {}
+        with self.pool.cursor() as cur:
+            cur.execute(
+                """
+                SELECT table_name, array_agg(column_name::text ORDER BY ordinal_position)
+                FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = ANY(%s)
+                GROUP BY table_name
+                """,
+                (list(tables),)
+            )
+            for table, columns in cur.fetchall():
+                if 'embedding' in columns:
+                    schema[tables[table]] = {"table": table, "columns": columns, "dims": None}
+            if not schema:
+                return schema
+
+            # Dimension of the stored vectors, from one embedded row per table
+            cur.execute(sql.SQL(" UNION ALL ").join(
+                sql.SQL("SELECT {kind}, (SELECT vector_dims(embedding) FROM {table} "
+                        "WHERE embedding IS NOT NULL LIMIT 1)").format(
+                    kind=sql.Literal(kind), table=sql.Identifier(info["table"]))
+                for kind, info in schema.items()
+            ))
+            for kind, dims in cur.fetchall():
+                schema[kind]["dims"] = dims
+        return schema
+
+    # ------------- Query -------------
+    def _branch(self, kind: str, info: Dict[str, Any], filters: Dict[str, str], min_similarity: Optional[float]):
+        """One table's top-n; filters maps column -> name of its bound parameter."""
+        columns = [c for c in info["columns"] if c not in HIDDEN_COLUMNS]
+        row = sql.SQL("jsonb_build_object({})").format(sql.SQL(", ").join(
+            sql.SQL("{}, {}").format(sql.Literal(c), sql.Identifier(c)) for c in columns))
+
+        conditions = [sql.SQL("embedding IS NOT NULL")]
+        for column, name in filters.items():
+            conditions.append(sql.SQL("{} = ANY({})").format(sql.Identifier(column), sql.Placeholder(name)))
+        if min_similarity is not None:
+            conditions.append(sql.SQL("embedding <=> %(query)s::vector <= %(max_distance)s"))
+
+        return sql.SQL(
+            "(SELECT {kind} AS knowledge_type, {row} AS data, 1 - (embedding <=> %(query)s::vector) AS similarity "
+            "FROM {table} WHERE {where} ORDER BY embedding <=> %(query)s::vector LIMIT %(per_table)s)"
+        ).format(kind=sql.Literal(kind), row=row, table=sql.Identifier(info["table"]),
+                 where=sql.SQL(" AND ").join(conditions))
+
+    def search(self, embedding, limit: int = 10, filters: Optional[Dict[str, Any]] = None,
+               types: Optional[List[str]] = None, min_similarity: Optional[float] = None) -> Dict[str, Any]:
+        """Merged, de-duplicated top-k across the knowledge tables, best first.
+
+        filters maps column -> value (or list of values, matched with IN).
+        Raises ValueError for unknown knowledge types or filter columns.
+        """
+        filters = filters or {}
+        types = types or list(KNOWLEDGE_TABLES)
+        unknown_types = set(types) - set(KNOWLEDGE_TABLES)
+        if unknown_types:
+            raise ValueError(f"Unknown knowledge types: {sorted(unknown_types)}")
+
+        schema = self.schema()
+        known_columns = {c for info in schema.values() for c in info["columns"]} - HIDDEN_COLUMNS
+        unknown_columns = set(filters) - known_columns
+        if unknown_columns:
+            raise ValueError(f"Unknown filter columns: {sorted(unknown_columns)}")
+
+        vector = vector_literal(embedding)
+        dims = vector.count(',') + 1
+        # Scalars and lists alike are matched with = ANY(array)
+        params: Dict[str, Any] = {}
+        placeholders: Dict[str, str] = {}
+        for i, (column, value) in enumerate(filters.items()):
+            placeholders[column] = f"filter_{i}"
+            params[f"filter_{i}"] = list(value) if isinstance(value, (list, tuple)) else [value]
+
+        searched, skipped = [], {}
+        branches = []
+        for kind in types:
+            info = schema.get(kind)
+            if info is None:
+                skipped[kind] = "table missing"
+            elif info["dims"] is None:
+                skipped[kind] = "no embeddings"
+            elif info["dims"] != dims:
+                skipped[kind] = f"embedded with {info['dims']} dims, query has {dims}"
+            elif not set(filters) <= set(info["columns"]):
+                skipped[kind] = "filter columns not in table"
+            else:
+                branches.append(self._branch(kind, info, placeholders, min_similarity))
+                searched.append(kind)
+
+        result = {"results": [], "searched": searched, "skipped": skipped, "candidates": 0, "duplicates": 0}
+        if not branches:
+            return result
+
+        # Extra rows per table so duplicates removed below don't leave the top-k short
+        per_table = limit + self.per_table_extra
+        statement = sql.SQL(" UNION ALL ").join(branches) + sql.SQL(" ORDER BY similarity DESC")
+        params.update(query=vector, per_table=per_table,
+                      max_distance=1 - min_similarity if min_similarity is not None else None)
+
+        with self.pool.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            # An HNSW scan returns at most ef_search rows per branch
+            cur.execute("SET LOCAL hnsw.ef_search = %s", (max(self.ef_search, per_table),))
+            cur.execute(statement, params)
+            rows = cur.fetchall()
+
+        seen = set()
+        for r in rows:
+            record = r["data"]
+            text = " | ".join(str(record[c]) for c in KNOWLEDGE_TABLES[r["knowledge_type"]][1] if record.get(c))
+            key = normalize_text(text)
+            if key in seen:
+                result["duplicates"] += 1
+                continue
+            seen.add(key)
+            result["results"].append({**record, "knowledge_type": r["knowledge_type"],
+                                      "similarity": float(r["similarity"]), "text": text})
+            if len(result["results"]) >= limit:
+                break
+        result["candidates"] = len(rows)
+        return result
+
+
+# Create singleton instance
+federated_search = FederatedSearch()
@@ -0,0 +1,124 @@
+# Generation Pipeline for Symbiosis
+# In-process retrieve -> prompt -> LLM pass with per-stage timings and a configurable backend
+
+import os
+import time
+import asyncio
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Callable, AsyncIterator
+
+import httpx
+
+from app.services.ollama_client import ollama_client
+from app.services.answer_cache import SemanticAnswerCache, context_fingerprint
+
+# Backends: "ollama" generates in-process through the shared client;
+# "farm_ai" forwards the built prompt to the legacy /ask service (extra hop).
+BACKENDS = ('ollama', 'farm_ai')
+
+
+@dataclass
+class PipelineResult:
+    answer: str
+    documents: List[Dict[str, Any]]
+    model: str
+    backend: str
+    timings: Dict[str, float] = field(default_factory=dict)
+    cached: bool = False
+
+
+class GenerationPipeline:
+    """One pass from retrieval to answer; every stage is timed in milliseconds."""
+
+    def __init__(self, retrieve: Callable[[str, int], List[Dict[str, Any]]],
+                 build_prompt: Callable[..., str], backend: Optional[str] = None,
+                 model: Optional[str] = None, top_k: int = 3,
+                 embed: Optional[Callable[[str], List[float]]] = None,
+                 cache: Optional[SemanticAnswerCache] = None):
+        self.retrieve = retrieve
+        self.build_prompt = build_prompt
+        # Optional semantic answer cache, consulted after retrieval
+        self.embed = embed
+        self.cache = cache
+        self.backend = (backend or os.getenv('GENERATION_BACKEND', 'ollama')).lower()
+        if self.backend not in BACKENDS:
+            print(f"Warning: Unknown GENERATION_BACKEND '{self.backend}', using ollama")
+            self.backend = 'ollama'
+        self.model = model or os.getenv('GENERATION_MODEL', os.getenv('LLM_MODEL', 'mistral:7b'))
+        self.farm_ai_url = os.getenv('FARM_AI_ASK_URL', 'http://localhost:8005/ask')
+        self.timeout = float(os.getenv('GENERATION_TIMEOUT', '60'))
+        # Admission lane: these answers serve the admin UI
+        self.lane = os.getenv('GENERATION_LANE', 'admin')
+        self.top_k = top_k
+
+    async def prepare(self, query: str, history: Optional[List[Dict[str, str]]] = None,
+                      timings: Optional[Dict[str, float]] = None):
+        """Retrieve and build the prompt; returns (documents, prompt)."""
+        timings = timings if timings is not None else {}
+        started = time.perf_counter()
+        # Embedding + vector search are blocking; keep them off the event loop
+        loop = asyncio.get_running_loop()
+        documents = await loop.run_in_executor(None, self.retrieve, query, self.top_k)
+        timings["retrieve_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+
+        started = time.perf_counter()
+        prompt = self.build_prompt(query, documents, history)
+        timings["prompt_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+        return documents, prompt
+
+    async def generate(self, prompt: str) -> str:
+        if self.backend == 'farm_ai':
+            # Not through ollama_client: /ask is a full generation (never retried) and not Ollama traffic
+            async with httpx.AsyncClient(timeout=httpx.Timeout(self.timeout, connect=5.0)) as client:
+                response = await client.post(self.farm_ai_url, json={'question': prompt, 'lane': self.lane})
+            response.raise_for_status()
+            return response.json().get('answer', '')
+        result = await ollama_client.generate(prompt, model=self.model, timeout=self.timeout, lane=self.lane)
+        return result.get('response', '').strip()
+
+    async def run(self, query: str, history: Optional[List[Dict[str, str]]] = None) -> PipelineResult:
+        total_started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        documents, prompt = await self.prepare(query, history, timings)
+
+        # Follow-up turns depend on the conversation, so only standalone questions are cached
+        embedding = None
+        cache_scope = f"{self.backend}:{self.model}"
+        fingerprint = context_fingerprint(doc["text"] for doc in documents)
+        if self.cache is not None and self.embed is not None and not history:
+            started = time.perf_counter()
+            embedding = await asyncio.get_running_loop().run_in_executor(None, self.embed, query)
+            cached = self.cache.lookup(embedding, cache_scope, fingerprint)
+            timings["cache_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+            if cached is not None:
+                timings["total_ms"] = round((time.perf_counter() - total_started) * 1000.0, 1)
+                return PipelineResult(answer=cached["answer"], documents=documents, model=self.model,
+                                      backend=self.backend, timings=timings, cached=True)
+
+        started = time.perf_counter()
+        answer = await self.generate(prompt)
+        timings["generate_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+        timings["total_ms"] = round((time.perf_counter() - total_started) * 1000.0, 1)
+        if answer and embedding is not None:
+            self.cache.store(embedding, cache_scope, fingerprint, {"answer": answer}, timings["generate_ms"])
+        return PipelineResult(answer=answer, documents=documents, model=self.model,
+                              backend=self.backend, timings=timings)
+
+    async def stream(self, prompt: str, timings: Dict[str, float]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield Ollama stream chunks; the farm_ai backend has no stream, so it yields one chunk."""
+        started = time.perf_counter()
+        if self.backend == 'farm_ai':
+            answer = await self.generate(prompt)
+            timings["generate_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+            yield {"response": answer, "done": True, "model": self.model}
+            return
+        # aclosing: if our consumer stops early, the upstream stream is closed right away
+        async with aclosing(ollama_client.stream_generate(prompt, model=self.model, timeout=self.timeout,
+                                                          lane=self.lane)) as chunks:
+            async for chunk in chunks:
+                if chunk.get("done"):
+                    timings["generate_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+                    if chunk.get("ttft_ms") is not None:
+                        timings["ttft_ms"] = chunk["ttft_ms"]
+                yield chunk
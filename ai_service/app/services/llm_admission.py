@@ -0,0 +1,261 @@
+# LLM Admission Control for Symbiosis
+# Priority lanes, per-model concurrency limits and queue deadlines in front of Ollama
+
+import os
+import re
+import time
+import heapq
+import itertools
+import asyncio
+import tempfile
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+    print("Warning: fcntl not available - LLM concurrency limits apply per process only")
+
+# Lower value is served first; admin also gets reserved slots public/background can't take
+LANES = {'admin': 0, 'public': 1, 'background': 2}
+DEFAULT_DEADLINES = {'admin': '60', 'public': '10', 'background': '300'}
+
+
+# Opt-in: tags that are the same weights on this Ollama host, e.g. "mistral:latest=mistral:7b";
+# the right-hand name is used. Empty by default, since tags can point at different models per host.
+MODEL_ALIASES = {}
+for _item in os.getenv('LLM_MODEL_ALIASES', '').split(','):
+    if '=' in _item:
+        _alias, _target = _item.split('=', 1)
+        MODEL_ALIASES[_alias.strip()] = _target.strip()
+
+
+def canonical_model(name: str) -> str:
+    """One name per Ollama model: untagged names are name:latest, then aliases are resolved."""
+    name = name if ':' in name else f"{name}:latest"
+    return MODEL_ALIASES.get(name, name)
+
+
+def _summary(samples) -> Dict[str, Any]:
+    samples = sorted(samples)
+    if not samples:
+        return {"samples": 0}
+    return {
+        "samples": len(samples),
+        "avg": round(sum(samples) / len(samples), 1),
+        "p50": round(samples[len(samples) // 2], 1),
+        "p95": round(samples[int(0.95 * (len(samples) - 1))], 1),
+    }
+
+
+class Slot:
+    """A held generation slot for one model; release it when the generation ends."""
+
+    def __init__(self, controller: "AdmissionController", model: str, lane: str,
+                 index: Optional[int] = None, fd: Optional[int] = None):
+        self.controller = controller
+        self.model = model
+        self.lane = lane
+        self.index = index
+        self.fd = fd
+        self.acquired = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """Admits generations to Ollama by lane priority, per-model capacity and deadline.
+
+    Slots are lock files held with flock and keyed by canonical model name,
+    so the admin (8005), ai_service and public chatbot processes share one
+    limit per model whatever tag they use for it; a crashed process
+    releases its slots automatically. Within a process, waiters for a model
+    are served in (lane, arrival) order. A waiter that cannot get a slot
+    before its lane deadline is shed, and is shed immediately when the
+    estimated queue wait already exceeds the deadline, so callers can answer
+    with a fallback instead of queueing behind a burst.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv('LLM_ADMISSION_ENABLED', 'true').lower() == 'true'
+        self.default_concurrency = int(os.getenv('LLM_MAX_CONCURRENT', '2'))
+        # e.g. "mistral:7b=1,tinyllama=3"
+        self.model_concurrency: Dict[str, int] = {}
+        for item in os.getenv('LLM_MODEL_CONCURRENCY', '').split(','):
+            if '=' in item:
+                name, value = item.split('=', 1)
+                self.model_concurrency[canonical_model(name.strip())] = int(value)
+        self.admin_reserved = int(os.getenv('LLM_ADMIN_RESERVED_SLOTS', '1'))
+        self.deadlines = {lane: float(os.getenv(f'LLM_QUEUE_DEADLINE_{lane.upper()}', default))
+                          for lane, default in DEFAULT_DEADLINES.items()}
+        self.poll_interval = float(os.getenv('LLM_ADMISSION_POLL_SECONDS', '0.05'))
+        self.slot_dir = os.getenv('LLM_SLOT_DIR', os.path.join(tempfile.gettempdir(), 'symbiosis-llm-slots'))
+        self.shared = FCNTL_AVAILABLE and self._prepare_slot_dir()
+
+        self._queues: Dict[str, List[Tuple[int, int]]] = {}
+        self._events: Dict[str, asyncio.Event] = {}
+        self._held: Dict[str, set] = {}
+        self._seq = itertools.count()
+        self._hold_ms: Dict[str, float] = {}
+
+        self._counts = {lane: {"admitted": 0, "shed": 0, "cancelled": 0} for lane in LANES}
+        self._wait_ms = {lane: deque(maxlen=1000) for lane in LANES}
+
+    def _prepare_slot_dir(self) -> bool:
+        try:
+            os.makedirs(self.slot_dir, exist_ok=True)
+            return True
+        except OSError as e:
+            print(f"Warning: LLM slot dir {self.slot_dir} unusable, limits apply per process only: {e}")
+            return False
+
+    def capacity(self, model: str) -> int:
+        return max(self.model_concurrency.get(canonical_model(model), self.default_concurrency), 1)
+
+    def _slot_indexes(self, model: str, lane: str) -> range:
+        capacity = self.capacity(model)
+        if lane == 'admin':
+            return range(capacity)
+        # Always leave at least one slot for non-admin lanes
+        return range(min(self.admin_reserved, capacity - 1), capacity)
+
+    # ------------- Slots -------------
+    def _try_slot(self, model: str, lane: str) -> Optional[Slot]:
+        held = self._held.setdefault(model, set())
+        for index in self._slot_indexes(model, lane):
+            if index in held:
+                continue
+            fd = None
+            if self.shared:
+                path = os.path.join(self.slot_dir, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', model)}.{index}.lock")
+                try:
+                    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+                except OSError as e:
+                    print(f"Warning: Cannot open LLM slot file {path}: {e}")
+                    continue
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    os.close(fd)  # held by another process
+                    continue
+            held.add(index)
+            return Slot(self, model, lane, index, fd)
+        return None
+
+    def _release(self, slot: Slot):
+        if slot.index is not None:
+            self._held.get(slot.model, set()).discard(slot.index)
+        if slot.fd is not None:
+            try:
+                fcntl.flock(slot.fd, fcntl.LOCK_UN)
+            finally:
+                os.close(slot.fd)
+        hold_ms = (time.perf_counter() - slot.acquired) * 1000.0
+        previous = self._hold_ms.get(slot.model)
+        self._hold_ms[slot.model] = hold_ms if previous is None else 0.8 * previous + 0.2 * hold_ms
+        self._notify(slot.model)
+
+    # ------------- Queue -------------
+    def _notify(self, model: str):
+        event = self._events.pop(model, None)
+        if event is not None:
+            event.set()
+
+    async def _wait(self, model: str, timeout: float):
+        # Woken by local releases; the timeout picks up slots freed by other processes
+        event = self._events.setdefault(model, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _expected_wait(self, model: str, lane: str, ahead: int) -> Optional[float]:
+        hold_ms = self._hold_ms.get(model)
+        if hold_ms is None:
+            return None
+        usable = len(self._slot_indexes(model, lane))
+        # Everyone ahead plus the generations already running must finish first
+        return (ahead // usable + 1) * hold_ms / 1000.0 if ahead >= usable else None
+
+    async def acquire(self, model: str, lane: str = 'public', deadline: Optional[float] = None) -> Optional[Slot]:
+        """Wait for a slot in priority order; None means the request was shed."""
+        lane = lane if lane in LANES else 'public'
+        model = canonical_model(model)
+        if not self.enabled:
+            return Slot(self, model, lane)
+
+        wait_budget = self.deadlines[lane] if deadline is None else deadline
+        queue = self._queues.setdefault(model, [])
+        entry = (LANES[lane], next(self._seq))
+
+        expected = self._expected_wait(model, lane, sum(1 for other in queue if other < entry))
+        if expected is not None and expected > wait_budget:
+            self._counts[lane]["shed"] += 1
+            return None
+
+        heapq.heappush(queue, entry)
+        started = time.perf_counter()
+        try:
+            while True:
+                if queue[0] == entry:
+                    slot = self._try_slot(model, lane)
+                    if slot is not None:
+                        heapq.heappop(queue)
+                        self._counts[lane]["admitted"] += 1
+                        self._wait_ms[lane].append((time.perf_counter() - started) * 1000.0)
+                        self._notify(model)  # let the next waiter try the remaining slots
+                        return slot
+                remaining = wait_budget - (time.perf_counter() - started)
+                if remaining <= 0:
+                    self._counts[lane]["shed"] += 1
+                    return None
+                await self._wait(model, min(remaining, self.poll_interval))
+        except asyncio.CancelledError:
+            self._counts[lane]["cancelled"] += 1
+            raise
+        finally:
+            if entry in queue:
+                queue.remove(entry)
+                heapq.heapify(queue)
+                self._notify(model)
+
+    def get_stats(self) -> Dict[str, Any]:
+        waiting = {lane: 0 for lane in LANES}
+        priorities = {value: lane for lane, value in LANES.items()}
+        for queue in self._queues.values():
+            for priority, _ in queue:
+                waiting[priorities[priority]] += 1
+        return {
+            "enabled": self.enabled,
+            "shared_across_processes": self.shared,
+            "slot_dir": self.slot_dir if self.shared else None,
+            "lanes": {
+                lane: {
+                    **self._counts[lane],
+                    "waiting": waiting[lane],
+                    "deadline_s": self.deadlines[lane],
+                    "queue_ms": _summary(self._wait_ms[lane]),
+                }
+                for lane in LANES
+            },
+            "models": {
+                model: {
+                    "capacity": self.capacity(model),
+                    "admin_reserved": min(self.admin_reserved, self.capacity(model) - 1),
+                    "in_use_here": len(self._held.get(model, ())),
+                    "queued_here": len(self._queues.get(model, [])),
+                    "avg_generation_ms": round(self._hold_ms[model], 1) if model in self._hold_ms else None,
+                }
+                for model in set(self._queues) | set(self._held)
+            },
+        }
+
+
+# Create singleton instance
+llm_admission = AdmissionController()
@@ -2,24 +2,89 @@
 # Provider-agnostic wrapper with simple local vector store (JSON) and cosine retrieval
 
 import os
+import io
+import re
 import json
 import math
+import time
+import hashlib
+import threading
 from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 
 import numpy as np
 
+from app.services.embedding_service import embedding_engine
+from app.services.answer_cache import answer_cache
 
 # Default to local LLM (Ollama/LM Studio) and pgvector for vector DB
-import requests
+from app.services.ollama_client import ollama_client
+
+from app.services.pg_pool import PgConnectionPool, pg_pool, POSTGRES_AVAILABLE
 
 # Optional PostgreSQL import - will work without it
-try:
-    import psycopg2
+if POSTGRES_AVAILABLE:
     import psycopg2.extras
-    POSTGRES_AVAILABLE = True
-except ImportError:
-    POSTGRES_AVAILABLE = False
+    from psycopg2 import sql
+
+# Operator class matching each pgvector distance operator, so the ANN index
+# is usable by the ORDER BY the queries actually run.
+DISTANCE_OPCLASSES = {
+    '<#>': 'vector_ip_ops',
+    '<=>': 'vector_cosine_ops',
+    '<->': 'vector_l2_ops',
+}
+
+
+def _copy_text(value: Optional[str]) -> str:
+    """Escape a value for COPY ... FROM STDIN text format."""
+    if value is None:
+        return '\\N'
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def vector_literal(embedding) -> str:
+    """pgvector text form '[x,y,...]' - no JSON round trip per row."""
+    if hasattr(embedding, 'tolist'):
+        embedding = embedding.tolist()
+    return '[' + ','.join(map(repr, embedding)) + ']'
+
+
+# Structured filters every vector store's query(filters=...) accepts
+FILTER_KEYS = ('source', 'source_prefix', 'chunk_type', 'page_context')
+# Words in doc names that say nothing about which admin page they cover
+GENERIC_PAGE_WORDS = {'readme', 'guide', 'complete', 'setup', 'instructions', 'feature', 'quickstart',
+                      'analysis', 'admin', 'page', 'docs', 'the', 'and', 'for'}
+
+
+def page_tags(text: str) -> List[str]:
+    """Coarse page keywords for filtering: 5-letter stems, so "planner" and "planning" share a tag."""
+    words = re.findall(r'[a-z0-9]+', (text or '').lower())
+    return sorted({w[:5] for w in words if len(w) >= 3 and w not in GENERIC_PAGE_WORDS})
+
+
+def check_filters(filters: Optional[Dict[str, Any]]):
+    unknown = set(filters or {}) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown vector filters: {sorted(unknown)} (supported: {', '.join(FILTER_KEYS)})")
+
+
+def metadata_matches(metadata: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """In-process equivalent of PgVectorStore's WHERE clause, for stores without SQL."""
+    source = metadata.get('source') or ''
+    if 'source' in filters and source != filters['source']:
+        return False
+    if 'source_prefix' in filters and not source.startswith(filters['source_prefix']):
+        return False
+    if 'chunk_type' in filters:
+        allowed = filters['chunk_type'] if isinstance(filters['chunk_type'], (list, tuple)) else [filters['chunk_type']]
+        if metadata.get('chunk_type') not in allowed:
+            return False
+    tags = page_tags(filters.get('page_context', ''))
+    if tags and not set(tags) & set(metadata.get('page_tags') or []):
+        return False
+    return True
 
 
 @dataclass
@@ -31,26 +96,44 @@ class VectorRecord:
 
 
 class PgVectorStore:
-    """pgvector-based vector store for embeddings and texts."""
-    def __init__(self):
+    """pgvector-based vector store for embeddings and texts.
+
+    With manage_tables=False the store only reads and indexes tables another
+    owner (Laravel) creates, e.g. general_knowledge, and runs no DDL at startup.
+    """
+    def __init__(self, pool: Optional[PgConnectionPool] = None, manage_tables: bool = True):
         if not POSTGRES_AVAILABLE:
             raise ImportError("PostgreSQL is not available. Please install psycopg2-binary.")
-            
-        try:
-            self.conn = psycopg2.connect(
-                dbname=os.getenv('PGVECTOR_DB', 'vector_db'),
-                user=os.getenv('PGVECTOR_USER', 'postgres'),
-                password=os.getenv('PGVECTOR_PASSWORD', ''),
-                host=os.getenv('PGVECTOR_HOST', 'localhost'),
-                port=os.getenv('PGVECTOR_PORT', '5432'),
-            )
+
+        # Connections are borrowed per query from the process-wide pool
+        self.pool = pool or pg_pool
+        self.copy_batch_size = int(os.getenv('PGVECTOR_COPY_BATCH_SIZE', '1000'))
+
+        # ANN index management (hnsw | ivfflat | none) and per-query recall knobs
+        self.distance_operator = '<#>'
+        self.index_type = os.getenv('PGVECTOR_INDEX_TYPE', 'hnsw').lower()
+        self.hnsw_m = int(os.getenv('PGVECTOR_HNSW_M', '16'))
+        self.hnsw_ef_construction = int(os.getenv('PGVECTOR_HNSW_EF_CONSTRUCTION', '64'))
+        self.ivfflat_lists = int(os.getenv('PGVECTOR_IVFFLAT_LISTS', '0'))  # 0 = size from row count
+        self.ef_search = int(os.getenv('PGVECTOR_EF_SEARCH', '40'))
+        self.probes = int(os.getenv('PGVECTOR_PROBES', '10'))
+        # HNSW filters after the index scan, so filtered queries look at more candidates;
+        # on pgvector >= 0.8 set PGVECTOR_ITERATIVE_SCAN=relaxed_order to keep scanning until k match
+        self.filtered_ef_search = int(os.getenv('PGVECTOR_FILTERED_EF_SEARCH', '200'))
+        self.iterative_scan = os.getenv('PGVECTOR_ITERATIVE_SCAN', '')
+        # Text search configuration of the search_tsv column (set by the Laravel migration)
+        self.text_search_config = os.getenv('PGVECTOR_TEXT_SEARCH_CONFIG', 'english')
+
+        self._table_ready = False
+        if manage_tables and self.available:
             self._ensure_table()
-        except Exception as e:
-            print(f"Warning: Could not connect to PostgreSQL: {e}")
-            self.conn = None
+
+    @property
+    def available(self) -> bool:
+        return self.pool.available()
 
     def _ensure_table(self):
-        with self.conn.cursor() as cur:
+        with self.pool.cursor(commit=True) as cur:
             cur.execute('''
                 CREATE TABLE IF NOT EXISTS vectors (
                     id SERIAL PRIMARY KEY,
@@ -59,91 +142,465 @@ class PgVectorStore:
                     metadata JSONB
                 );
             ''')
-            self.conn.commit()
+            # Per-source record of what is already embedded, for incremental ingestion
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS ingest_manifest (
+                    source TEXT PRIMARY KEY,
+                    mtime DOUBLE PRECISION,
+                    content_hash TEXT NOT NULL,
+                    chunk_hashes JSONB NOT NULL DEFAULT '[]',
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+            ''')
+            cur.execute("CREATE INDEX IF NOT EXISTS vectors_source_idx ON vectors ((metadata->>'source'))")
+            # Expression indexes behind query(filters=...): source prefix, chunk type, page tags
+            cur.execute("CREATE INDEX IF NOT EXISTS vectors_source_prefix_idx "
+                        "ON vectors ((metadata->>'source') text_pattern_ops)")
+            cur.execute("CREATE INDEX IF NOT EXISTS vectors_chunk_type_idx ON vectors ((metadata->>'chunk_type'))")
+            cur.execute("CREATE INDEX IF NOT EXISTS vectors_page_tags_idx ON vectors USING gin ((metadata->'page_tags'))")
+            cur.execute("SELECT EXISTS (SELECT 1 FROM vectors)")
+            empty = not cur.fetchone()[0]
+        self._table_ready = True
+        if empty:
+            # Instant on an empty table; a populated one is indexed explicitly through reindex()
+            self.ensure_index('vectors')
+        else:
+            self.check_index('vectors')
+
+    def flush(self):
+        # Every write is already committed; kept for parity with FaissVectorStore
+        pass
+
+    # ------------- ANN indexes -------------
+    def index_name(self, table: str, column: str = 'embedding') -> str:
+        return f"{table}_{column}_{self.index_type}_idx"
+
+    def has_index(self, table: str, column: str = 'embedding') -> bool:
+        with self.pool.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (self.index_name(table, column),))
+            return cur.fetchone()[0]
 
-    def add(self, texts: List[str], embeddings: List[List[float]], metadatas: Optional[List[Dict[str, Any]]] = None):
+    def check_index(self, table: str, column: str = 'embedding') -> bool:
+        """Report (never build) a missing ANN index; building one on a populated table is slow."""
+        if self.index_type not in ('hnsw', 'ivfflat'):
+            return True
+        try:
+            present = self.has_index(table, column)
+        except Exception as e:
+            print(f"Warning: Could not check the {self.index_type} index on {table}.{column}: {e}")
+            return False
+        if not present:
+            print(f"Warning: No {self.index_type} index on {table}.{column}; queries scan the table until "
+                  f"POST /api/v1/vector-store/reindex is run with table={table}")
+        return present
+
+    def ensure_index(self, table: str, column: str = 'embedding') -> Optional[str]:
+        """Create the configured ANN index on table.column if it is missing.
+
+        IVFFlat needs data to train its lists, so it is deferred on empty
+        tables until reindex() is run after the first bulk load.
+        """
+        if self.index_type not in ('hnsw', 'ivfflat'):
+            return None
+        try:
+            with self.pool.cursor(commit=True) as cur:
+                if self.index_type == 'ivfflat':
+                    cur.execute(sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(table)))
+                    if cur.fetchone()[0] == 0:
+                        return None
+                self._create_index(cur, table, column)
+            return self.index_name(table, column)
+        except Exception as e:
+            print(f"Warning: Could not create {self.index_type} index on {table}.{column}: {e}")
+            return None
+
+    def _create_index(self, cur, table: str, column: str):
+        opclass = DISTANCE_OPCLASSES[self.distance_operator]
+        if self.index_type == 'hnsw':
+            options = sql.SQL("WITH (m = {}, ef_construction = {})").format(
+                sql.Literal(self.hnsw_m), sql.Literal(self.hnsw_ef_construction))
+        else:
+            options = sql.SQL("WITH (lists = {})").format(sql.Literal(self._ivfflat_lists_for(cur, table)))
+        cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} USING {} ({} {}) {}").format(
+            sql.Identifier(self.index_name(table, column)),
+            sql.Identifier(table),
+            sql.SQL(self.index_type),
+            sql.Identifier(column),
+            sql.SQL(opclass),
+            options,
+        ))
+
+    def _ivfflat_lists_for(self, cur, table: str) -> int:
+        if self.ivfflat_lists:
+            return self.ivfflat_lists
+        # pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond
+        cur.execute(sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(table)))
+        rows = cur.fetchone()[0]
+        lists = rows // 1000 if rows <= 1_000_000 else int(math.sqrt(rows))
+        return max(lists, 10)
+
+    def reindex(self, table: str = 'vectors', column: str = 'embedding') -> Dict[str, Any]:
+        """Rebuild the ANN index after bulk loads (IVFFlat lists are re-trained)."""
+        if self.index_type not in ('hnsw', 'ivfflat'):
+            return {"table": table, "index": None, "index_type": self.index_type}
+        started = time.perf_counter()
+        with self.pool.cursor(commit=True, timeout_ms=0) as cur:
+            cur.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(self.index_name(table, column))))
+            self._create_index(cur, table, column)
+            cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(table)))
+        return {
+            "table": table,
+            "index": self.index_name(table, column),
+            "index_type": self.index_type,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+    # ------------- Schema checks -------------
+    def has_column(self, table: str, column: str) -> bool:
+        with self.pool.cursor() as cur:
+            cur.execute(
+                "SELECT EXISTS (SELECT 1 FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s)",
+                (table, column))
+            return cur.fetchone()[0]
+
+    def apply_search_settings(self, cur, ef_search: Optional[int] = None, probes: Optional[int] = None,
+                              exact: bool = False, filtered: bool = False):
+        """Set per-query recall/speed knobs; must run inside the query's transaction."""
+        if exact:
+            # Force the sequential scan + sort the ANN index replaces
+            cur.execute("SET LOCAL enable_indexscan = off")
+            return
+        if self.index_type == 'hnsw':
+            ef = int(ef_search or self.ef_search)
+            cur.execute("SET LOCAL hnsw.ef_search = %s", (max(ef, self.filtered_ef_search) if filtered else ef,))
+            if filtered and self.iterative_scan:
+                cur.execute("SET LOCAL hnsw.iterative_scan = %s", (self.iterative_scan,))
+        elif self.index_type == 'ivfflat':
+            cur.execute("SET LOCAL ivfflat.probes = %s", (int(probes or self.probes),))
+
+    def add(self, texts: List[str], embeddings: List[List[float]], metadatas: Optional[List[Dict[str, Any]]] = None,
+            batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """Stream rows through COPY in batches inside one transaction; returns write stats."""
         if metadatas is None:
             metadatas = [{} for _ in texts]
-        with self.conn.cursor() as cur:
-            for t, e, m in zip(texts, embeddings, metadatas):
+        if not self._table_ready:
+            self._ensure_table()
+        batch_size = batch_size or self.copy_batch_size
+
+        started = time.perf_counter()
+        rows = 0
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                for start in range(0, len(texts), batch_size):
+                    end = start + batch_size
+                    buf = io.StringIO()
+                    for t, e, m in zip(texts[start:end], embeddings[start:end], metadatas[start:end]):
+                        buf.write(f"{_copy_text(t)}\t{vector_literal(e)}\t{_copy_text(json.dumps(m))}\n")
+                    buf.seek(0)
+                    cur.copy_expert("COPY vectors (text, embedding, metadata) FROM STDIN", buf)
+                    rows += min(end, len(texts)) - start
+            conn.commit()
+
+        elapsed = time.perf_counter() - started
+        return {
+            "rows": rows,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else float(rows),
+        }
+
+    # ------------- Ingest manifest -------------
+    def get_manifest(self, source: str) -> Optional[Dict[str, Any]]:
+        with self.pool.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute("SELECT source, mtime, content_hash, chunk_hashes FROM ingest_manifest WHERE source = %s",
+                        (source,))
+            row = cur.fetchone()
+            return dict(row) if row else None
+
+    def list_sources(self, prefix: str = '') -> List[str]:
+        with self.pool.cursor() as cur:
+            cur.execute("SELECT source FROM ingest_manifest WHERE left(source, %s) = %s", (len(prefix), prefix))
+            return [row[0] for row in cur.fetchall()]
+
+    def touch_source(self, source: str, mtime: float):
+        """Record a new mtime for a source whose content hash did not change."""
+        with self.pool.cursor(commit=True) as cur:
+            cur.execute("UPDATE ingest_manifest SET mtime = %s, updated_at = now() WHERE source = %s",
+                        (mtime, source))
+
+    def sync_source(self, source: str, mtime: Optional[float], content_hash: str, chunk_hashes: List[str],
+                    stale_hashes: List[str], texts: List[str], embeddings: List[List[float]],
+                    metadatas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Apply one file's chunk diff and manifest update in a single transaction.
+
+        Rows for stale chunk hashes are deleted, along with any rows for the
+        source that predate the manifest (no chunk_hash), then new chunks are
+        copied in and the manifest row is upserted.
+        """
+        if not self._table_ready:
+            self._ensure_table()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    DELETE FROM vectors
+                    WHERE metadata->>'source' = %s
+                      AND (metadata->>'chunk_hash' IS NULL OR metadata->>'chunk_hash' = ANY(%s))
+                    """,
+                    (source, list(stale_hashes))
+                )
+                deleted = cur.rowcount
+                if texts:
+                    buf = io.StringIO()
+                    for t, e, m in zip(texts, embeddings, metadatas):
+                        buf.write(f"{_copy_text(t)}\t{vector_literal(e)}\t{_copy_text(json.dumps(m))}\n")
+                    buf.seek(0)
+                    cur.copy_expert("COPY vectors (text, embedding, metadata) FROM STDIN", buf)
                 cur.execute(
-                    "INSERT INTO vectors (text, embedding, metadata) VALUES (%s, %s, %s)",
-                    (t, e, json.dumps(m))
+                    """
+                    INSERT INTO ingest_manifest (source, mtime, content_hash, chunk_hashes, updated_at)
+                    VALUES (%s, %s, %s, %s, now())
+                    ON CONFLICT (source) DO UPDATE SET
+                        mtime = EXCLUDED.mtime,
+                        content_hash = EXCLUDED.content_hash,
+                        chunk_hashes = EXCLUDED.chunk_hashes,
+                        updated_at = now()
+                    """,
+                    (source, mtime, content_hash, json.dumps(chunk_hashes))
                 )
-            self.conn.commit()
+            conn.commit()
+        return {"added": len(texts), "deleted": deleted}
+
+    def delete_source(self, source: str) -> int:
+        """Remove every chunk and the manifest entry for a source that no longer exists."""
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM vectors WHERE metadata->>'source' = %s", (source,))
+                deleted = cur.rowcount
+                cur.execute("DELETE FROM ingest_manifest WHERE source = %s", (source,))
+            conn.commit()
+        return deleted
+
+    def count(self) -> int:
+        with self.pool.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM vectors")
+            return cur.fetchone()[0]
 
-    def query(self, query_embedding: List[float], top_k: int = 4) -> List[VectorRecord]:
-        with self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+    def tag_source(self, source: str, metadata: Dict[str, Any]) -> int:
+        """Merge metadata into every chunk of a source (backfills filter fields on unchanged files)."""
+        patch = json.dumps(metadata)
+        with self.pool.cursor(commit=True) as cur:
             cur.execute(
-                """
+                "UPDATE vectors SET metadata = metadata || %s::jsonb "
+                "WHERE metadata->>'source' = %s AND NOT metadata @> %s::jsonb",
+                (patch, source, patch)
+            )
+            return cur.rowcount
+
+    @staticmethod
+    def _filter_clause(filters: Optional[Dict[str, Any]]) -> Tuple[str, List[Any]]:
+        """WHERE clause over the indexed metadata expressions for query(filters=...)."""
+        check_filters(filters)
+        conditions, params = [], []
+        filters = filters or {}
+        if 'source' in filters:
+            conditions.append("metadata->>'source' = %s")
+            params.append(filters['source'])
+        if 'source_prefix' in filters:
+            escaped = re.sub(r'([\\%_])', r'\\\1', filters['source_prefix'])
+            conditions.append("metadata->>'source' LIKE %s")
+            params.append(escaped + '%')
+        if 'chunk_type' in filters:
+            value = filters['chunk_type']
+            conditions.append("metadata->>'chunk_type' = ANY(%s)")
+            params.append(list(value) if isinstance(value, (list, tuple)) else [value])
+        tags = page_tags(filters.get('page_context', ''))
+        if tags:
+            conditions.append("metadata->'page_tags' ?| %s")
+            params.append(tags)
+        return ("WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def query(self, query_embedding: List[float], top_k: int = 4, ef_search: Optional[int] = None,
+              probes: Optional[int] = None, exact: bool = False,
+              filters: Optional[Dict[str, Any]] = None) -> List[VectorRecord]:
+        vector = vector_literal(query_embedding)
+        where, params = self._filter_clause(filters)
+        with self.pool.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            self.apply_search_settings(cur, ef_search=ef_search, probes=probes, exact=exact, filtered=bool(where))
+            cur.execute(
+                f"""
                 SELECT text, embedding, metadata, (embedding <#> %s::vector) AS distance
                 FROM vectors
+                {where}
                 ORDER BY embedding <#> %s::vector ASC
                 LIMIT %s
                 """,
-                (query_embedding, query_embedding, top_k)
+                (vector, *params, vector, top_k)
             )
             rows = cur.fetchall()
             return [VectorRecord(text=row['text'], embedding=row['embedding'], metadata=row['metadata']) for row in rows]
 
 
 
+_store_lock = threading.Lock()
+_shared_store = None
+
+
+def create_vector_store():
+    """The process-wide vector store selected by VECTOR_BACKEND (pgvector | faiss | auto).
+
+    auto uses pgvector when the database is reachable and falls back to the
+    in-process FAISS store otherwise. The store is built once and shared by
+    every LLMService, so a FAISS index has a single in-memory copy and a
+    single writer for its files.
+    """
+    global _shared_store
+    with _store_lock:
+        if _shared_store is None:
+            _shared_store = _build_vector_store()
+        return _shared_store
+
+
+def _build_vector_store():
+    backend = os.getenv('VECTOR_BACKEND', 'pgvector').lower()
+    if backend == 'faiss':
+        from app.services.faiss_store import FaissVectorStore
+        return FaissVectorStore()
+    if backend == 'auto':
+        if POSTGRES_AVAILABLE:
+            store = PgVectorStore()
+            if store.available:
+                return store
+        print("PostgreSQL unreachable, using in-process FAISS vector store")
+        from app.services.faiss_store import FaissVectorStore
+        return FaissVectorStore()
+    return PgVectorStore()
+
+
 class LLMService:
     """Provider-agnostic LLM wrapper with embeddings + simple retrieval (Ollama + pgvector)."""
     def __init__(self):
         self.provider = os.getenv('LLM_PROVIDER', 'ollama').lower()
-        self.model = os.getenv('LLM_MODEL', 'mistral')
+        self.model = os.getenv('LLM_MODEL', 'mistral:7b')
         self.ollama_url = os.getenv('OLLAMA_URL', 'http://localhost:11434')
         
         # Try to initialize vector store, but don't fail if unavailable
         try:
             if os.getenv('ENABLE_VECTOR_DB', 'true').lower() == 'true':
-                self.store = PgVectorStore()
+                self.store = create_vector_store()
             else:
                 self.store = None
         except Exception as e:
             print(f"Warning: Vector store unavailable: {e}")
             self.store = None
             
-        self.embedding_model = os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+        self.embedding_model = embedding_engine.model_name
 
     # ------------- Embeddings & Retrieval -------------
     def embed_texts(self, texts: List[str]) -> List[List[float]]:
-        # Use sentence-transformers locally for embeddings
-        from sentence_transformers import SentenceTransformer
-        model = SentenceTransformer(self.embedding_model)
-        return model.encode(texts, normalize_embeddings=True).tolist()
+        # Content-addressed cache first; only misses reach the resident model
+        return embedding_engine.encode_cached(texts)
 
     def ingest_corpus(self, chunks: List[str], source: str = 'biodynamic_principles_core.txt') -> int:
-        if not self.store:
+        if not self.store or not self.store.available:
             print("Warning: Vector store not available, skipping corpus ingestion")
             return 0
             
         embeddings = self.embed_texts(chunks)
         metadatas = [{"source": source, "chunk_index": i} for i in range(len(chunks))]
-        self.store.add(chunks, embeddings, metadatas)
+        write_stats = self.store.add(chunks, embeddings, metadatas)
+        self.store.flush()
+        print(f"Ingested {write_stats['rows']} chunks from {source} at {write_stats['rows_per_second']} rows/s")
+        answer_cache.invalidate(f"ingested {source}")
         return len(chunks)
 
-    def retrieve_context(self, query: str, top_k: int = 4) -> List[VectorRecord]:
-        if not self.store:
+    def ingest_file(self, path: str, source: str, max_chars: int = 1200, overlap: int = 150,
+                    metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Incrementally ingest one file: embed only new chunks, drop changed ones.
+
+        The manifest short-circuits on an unchanged mtime, then on an unchanged
+        content hash; otherwise the chunk-hash diff is applied in one
+        transaction so a failed file leaves its previous chunks intact.
+        metadata (e.g. chunk_type, page_tags) is stored on every chunk.
+        Callers ingesting a batch of files call flush() once at the end.
+        """
+        if not self.store or not self.store.available:
+            print("Warning: Vector store not available, skipping file ingestion")
+            return {"source": source, "status": "skipped", "added": 0, "deleted": 0}
+
+        mtime = os.path.getmtime(path)
+        manifest = self.store.get_manifest(source)
+        if manifest and manifest.get("mtime") == mtime:
+            if metadata:
+                self.store.tag_source(source, metadata)
+            return {"source": source, "status": "unchanged", "added": 0, "deleted": 0}
+
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        if manifest and manifest.get("content_hash") == content_hash:
+            self.store.touch_source(source, mtime)
+            if metadata:
+                self.store.tag_source(source, metadata)
+            return {"source": source, "status": "unchanged", "added": 0, "deleted": 0}
+
+        chunks = self.chunk_text(content, max_chars=max_chars, overlap=overlap) if content.strip() else []
+        chunk_hashes: List[str] = []
+        seen = set()
+        new_chunks = []
+        known = set(manifest["chunk_hashes"]) if manifest else set()
+        for i, chunk in enumerate(chunks):
+            chunk_hash = hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+            if chunk_hash in seen:
+                continue
+            seen.add(chunk_hash)
+            chunk_hashes.append(chunk_hash)
+            if chunk_hash not in known:
+                new_chunks.append((i, chunk, chunk_hash))
+
+        stale_hashes = list(known - seen)
+        texts = [chunk for _, chunk, _ in new_chunks]
+        embeddings = self.embed_texts(texts) if texts else []
+        metadatas = [{**(metadata or {}), "source": source, "chunk_index": i, "chunk_hash": h}
+                     for i, _, h in new_chunks]
+        result = self.store.sync_source(source, mtime, content_hash, chunk_hashes, stale_hashes,
+                                        texts, embeddings, metadatas)
+        print(f"Synced {source}: +{result['added']} / -{result['deleted']} chunks")
+        if result['added'] or result['deleted']:
+            answer_cache.invalidate(f"synced {source}")
+        return {"source": source, "status": "updated" if manifest else "new", **result}
+
+    def flush(self):
+        """Persist a local store's pending writes (no-op for pgvector)."""
+        if self.store:
+            self.store.flush()
+
+    def prune_sources(self, prefix: str, keep: List[str]) -> Dict[str, int]:
+        """Delete chunks for manifest sources under prefix whose file has disappeared."""
+        if not self.store or not self.store.available:
+            return {}
+        keep_set = set(keep)
+        removed = {source: self.store.delete_source(source)
+                   for source in self.store.list_sources(prefix) if source not in keep_set}
+        if removed:
+            answer_cache.invalidate(f"removed {len(removed)} sources under {prefix}")
+        return removed
+
+    def retrieve_context(self, query: str, top_k: int = 4,
+                         filters: Optional[Dict[str, Any]] = None) -> List[VectorRecord]:
+        """Nearest chunks, optionally restricted by source, source_prefix, chunk_type or page_context."""
+        if not self.store or not self.store.available:
             print("Warning: Vector store not available, returning empty context")
             return []
             
         q_emb = self.embed_texts([query])[0]
-        return self.store.query(q_emb, top_k=top_k)
+        return self.store.query(q_emb, top_k=top_k, filters=filters)
 
-    def chat(self, messages: List[Dict[str, str]]) -> str:
+    async def chat(self, messages: List[Dict[str, str]], timeout: float = 120, lane: str = 'admin') -> str:
         # Compose prompt from messages
         prompt = "\n".join([f"{m['role'].capitalize()}: {m['content']}" for m in messages])
-        data = {
-            "model": self.model,
-            "prompt": prompt,
-            "stream": False
-        }
         try:
-            resp = requests.post(f"{self.ollama_url}/api/generate", json=data, timeout=120)
-            resp.raise_for_status()
-            result = resp.json()
+            result = await ollama_client.generate(prompt, model=self.model, timeout=timeout, lane=lane)
             return result.get('response', '').strip()
         except Exception as e:
             return f"[Local LLM error: {e}]"
@@ -0,0 +1,168 @@
+# Model Warm-up Scheduler for Symbiosis
+# Preloads Ollama models with zero-token keep_alive requests and keeps recently used ones resident
+
+import os
+import re
+import time
+import asyncio
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+from app.services.ollama_client import OllamaClient
+from app.services.llm_admission import canonical_model, llm_admission
+
+DEFAULT_WARMUP_MODELS = 'mistral:7b,phi3:mini,tinyllama,gemma2:2b'
+
+
+def _seconds_until(timestamp: Optional[str]) -> Optional[float]:
+    """Seconds until an RFC 3339 expires_at from /api/ps (nanosecond precision trimmed)."""
+    if not timestamp:
+        return None
+    try:
+        cleaned = re.sub(r'(\.\d{6})\d+', r'\1', timestamp.replace('Z', '+00:00'))
+        return (datetime.fromisoformat(cleaned) - datetime.now(timezone.utc)).total_seconds()
+    except ValueError:
+        return None
+
+
+class ModelWarmupScheduler:
+    """Keeps the configured models hot without running real prompts.
+
+    An empty prompt with keep_alive makes Ollama load the model and reset its
+    unload timer without generating a token. All models are preloaded on
+    startup; afterwards only models with traffic inside the traffic window
+    (or pinned ones) are refreshed before their keep_alive lapses, so idle
+    models are allowed to unload and free memory. Warm-ups take an admission
+    slot in the background lane like any generation; when none is free within
+    WARMUP_ADMISSION_WAIT_SECONDS the model is busy serving traffic (so it is
+    loaded anyway) and the warm-up is skipped.
+    """
+
+    def __init__(self, client: OllamaClient, primary_model: Optional[str] = None,
+                 models: Optional[List[str]] = None):
+        self.client = client
+        configured = models or [m.strip() for m in os.getenv('WARMUP_MODELS', DEFAULT_WARMUP_MODELS).split(',') if m.strip()]
+        # Compared by canonical name everywhere, so "mistral" and "mistral:latest" are one model
+        self.models = list(dict.fromkeys(canonical_model(m) for m in configured))
+        self.pinned = {canonical_model(m.strip()) for m in os.getenv('WARMUP_PINNED_MODELS', '').split(',') if m.strip()}
+        self.primary_model = canonical_model(primary_model or self.models[0])
+        if self.primary_model not in self.models:
+            # The model this service generates with is always warmed, and first
+            self.models.insert(0, self.primary_model)
+        self.enabled = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+        self.keep_alive = os.getenv('WARMUP_KEEP_ALIVE', '30m')
+        self.interval = float(os.getenv('WARMUP_INTERVAL_SECONDS', '240'))
+        self.traffic_window = float(os.getenv('WARMUP_TRAFFIC_WINDOW_SECONDS', '3600'))
+        self.timeout = float(os.getenv('WARMUP_TIMEOUT', '180'))
+        self.admission_wait = float(os.getenv('WARMUP_ADMISSION_WAIT_SECONDS', '0'))
+
+        self._task: Optional[asyncio.Task] = None
+        self._warming: Dict[str, asyncio.Task] = {}
+        self._last_warmup: Dict[str, Dict[str, Any]] = {}
+
+    # ------------- Warm-up -------------
+    async def warm(self, model: str) -> Dict[str, Any]:
+        """Load (or keep loaded) one model with a zero-token request."""
+        started = time.perf_counter()
+        slot = await llm_admission.acquire(model, 'background', deadline=self.admission_wait)
+        if slot is None:
+            result = {"ok": False, "skipped": "generation slots busy"}
+        else:
+            try:
+                await self.client.request('POST', '/api/generate', json={
+                    "model": model, "prompt": "", "stream": False, "keep_alive": self.keep_alive
+                }, timeout=self.timeout, retries=0)
+                result = {"ok": True}
+            except Exception as e:
+                result = {"ok": False, "error": str(e)}
+            finally:
+                slot.release()
+        result["seconds"] = round(time.perf_counter() - started, 2)
+        result["at"] = time.time()
+        self._last_warmup[canonical_model(model)] = result
+        return result
+
+    async def warm_all(self, models: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        # Sequential: loading several models at once on one CPU box just thrashes memory
+        return {model: await self.warm(model) for model in (canonical_model(m) for m in models or self.models)}
+
+    def schedule(self, models: Optional[List[str]] = None) -> List[str]:
+        """Start warm-ups in the background (one per model at a time); returns the models queued."""
+        queued = []
+        for model in (canonical_model(m) for m in models or self.models):
+            task = self._warming.get(model)
+            if task is None or task.done():
+                self._warming[model] = asyncio.ensure_future(self.warm(model))
+                queued.append(model)
+        return queued
+
+    # ------------- Status -------------
+    async def loaded_models(self) -> Dict[str, Dict[str, Any]]:
+        """Models currently resident in Ollama, from /api/ps."""
+        data = await self.client.get_json('/api/ps', timeout=3)
+        return {canonical_model(m.get('name', '')): m for m in data.get('models', [])}
+
+    async def readiness(self) -> Dict[str, Any]:
+        try:
+            loaded = await self.loaded_models()
+            error = None
+        except Exception as e:
+            loaded, error = {}, str(e)
+
+        now = time.time()
+        usage = {canonical_model(m): t for m, t in self.client.model_usage().items()}
+        models = {}
+        for name in self.models:
+            entry = loaded.get(name)
+            last_used = usage.get(name)
+            models[name] = {
+                "hot": entry is not None,
+                "expires_in_s": round(_seconds_until(entry.get('expires_at')) or 0) if entry else None,
+                "last_request_s_ago": round(now - last_used) if last_used else None,
+                "warming": name in self._warming and not self._warming[name].done(),
+                "last_warmup": self._last_warmup.get(name),
+            }
+        return {
+            "ready": self.primary_model in loaded,
+            "primary_model": self.primary_model,
+            "hot": sorted(name for name in loaded),
+            "models": models,
+            "ollama_error": error,
+        }
+
+    # ------------- Scheduling -------------
+    async def tick(self):
+        """Refresh keep_alive for models with recent traffic whose unload is near."""
+        now = time.time()
+        usage = {canonical_model(m): t for m, t in self.client.model_usage().items()}
+        loaded = await self.loaded_models()
+        due = []
+        for name in self.models:
+            recently_used = now - usage.get(name, 0.0) < self.traffic_window
+            if not recently_used and name not in self.pinned:
+                continue  # let keep_alive lapse so the memory is freed
+            remaining = _seconds_until(loaded[name].get('expires_at')) if name in loaded else None
+            if remaining is None or remaining < 2 * self.interval:
+                due.append(name)
+        if due:
+            await self.warm_all(due)
+
+    async def _run(self):
+        await self.warm_all()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"Warning: Model warm-up tick failed: {e}")
+
+    def start(self):
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        tasks = [t for t in [self._task, *self._warming.values()] if t is not None and not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
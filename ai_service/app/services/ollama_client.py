@@ -0,0 +1,426 @@
+# Ollama Client for Symbiosis
+# Shared async HTTP client: keep-alive connection pool, retries with backoff, per-call timeouts
+
+import os
+import json
+import time
+import hashlib
+import random
+import asyncio
+from collections import deque
+from contextlib import aclosing
+from typing import List, Dict, Any, Optional, AsyncIterator
+
+import httpx
+
+from app.services.llm_admission import llm_admission
+
+# Statuses worth retrying: Ollama busy/restarting or a proxy in front of it hiccuping
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+
+def sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Format one Server-Sent Events frame."""
+    frame = f"event: {event}\n" if event else ""
+    return f"{frame}data: {json.dumps(data)}\n\n"
+
+
+# Headers that stop proxies (nginx) from buffering the event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+class ClientDisconnected(Exception):
+    """The HTTP caller went away; the generation serving it has been cancelled."""
+
+
+async def cancel_on_disconnect(request, awaitable, poll_interval: float = 0.5):
+    """Await a generation, cancelling it as soon as the HTTP client disconnects.
+
+    PHP callers give up after a few seconds; cancelling closes the Ollama
+    connection, which makes Ollama stop generating tokens nobody will read.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise ClientDisconnected("client disconnected before the answer was ready")
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+
+async def stream_until_disconnect(request, chunks: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """Relay a generation stream, closing it upstream as soon as the HTTP client disconnects."""
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            if await request.is_disconnected():
+                raise ClientDisconnected("client disconnected mid-stream")
+            yield chunk
+
+
+class OllamaError(Exception):
+    """Raised when Ollama cannot produce a response after all retries."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OllamaTimeout(OllamaError):
+    """Raised when a call exceeds its timeout; never retried, the model is busy."""
+
+
+class OllamaBusy(OllamaError):
+    """Raised when the admission queue sheds a generation; answer with a fallback."""
+
+
+class _Flight:
+    """One in-flight generation shared by every caller with the same request."""
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class OllamaClient:
+    """One pooled httpx.AsyncClient per process, shared by every generation path.
+
+    Calls never block the event loop, so a single uvicorn worker can hold many
+    in-flight generations. Connection failures and retryable statuses are
+    retried with jittered exponential backoff; read timeouts are not, since a
+    retry would only queue behind the generation that is still running.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, max_connections: Optional[int] = None,
+                 max_keepalive: Optional[int] = None, retries: Optional[int] = None,
+                 backoff: Optional[float] = None, timeout: Optional[float] = None,
+                 lane: Optional[str] = None):
+        self.base_url = (base_url or os.getenv('OLLAMA_URL', 'http://localhost:11434')).rstrip('/')
+        self.max_connections = int(max_connections or os.getenv('OLLAMA_MAX_CONNECTIONS', '20'))
+        self.max_keepalive = int(max_keepalive or os.getenv('OLLAMA_MAX_KEEPALIVE', '10'))
+        self.retries = int(retries if retries is not None else os.getenv('OLLAMA_RETRIES', '2'))
+        self.backoff = float(backoff or os.getenv('OLLAMA_RETRY_BACKOFF', '0.5'))
+        self.timeout = float(timeout or os.getenv('OLLAMA_TIMEOUT', '120'))
+        self.connect_timeout = float(os.getenv('OLLAMA_CONNECT_TIMEOUT', '5'))
+        # Identical (model, prompt, options) generations in flight share one upstream call
+        self.coalesce = os.getenv('OLLAMA_COALESCE', 'true').lower() == 'true'
+        self._flights: Dict[str, _Flight] = {}
+        # Admission lane for generations that don't name one: admin, public or background
+        self.lane = lane or os.getenv('LLM_DEFAULT_LANE', 'public')
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop = None
+
+        self._requests = 0
+        self._retries = 0
+        self._errors = 0
+        self._timeouts = 0
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._latency_seconds = 0.0
+        self._streams = 0
+        self._coalesced = 0
+        self._shed = 0
+        # Generations abandoned by their callers, and the work that saved
+        self._cancelled = 0
+        self._cancel_tokens_saved = 0.0
+        self._cancel_seconds_saved = 0.0
+        # model -> (tokens, seconds) moving average of completed generations
+        self._typical: Dict[str, tuple] = {}
+        # model -> last request time, read by the warm-up scheduler
+        self._model_last_used: Dict[str, float] = {}
+        self._ttft_ms = deque(maxlen=1000)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # The pool is bound to the event loop it was created on
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=30.0,
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            )
+            self._loop = loop
+        return self._client
+
+    def _timeout_for(self, timeout: Optional[float]):
+        if timeout is None:
+            return httpx.USE_CLIENT_DEFAULT
+        return httpx.Timeout(timeout, connect=min(self.connect_timeout, timeout))
+
+    async def _sleep_backoff(self, attempt: int):
+        delay = self.backoff * (2 ** attempt)
+        await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+    async def request(self, method: str, url: str, json: Optional[Dict[str, Any]] = None,
+                      timeout: Optional[float] = None, retries: Optional[int] = None) -> httpx.Response:
+        """Send a request (path relative to OLLAMA_URL, or an absolute URL) with retries."""
+        client = self._get_client()
+        attempts = (self.retries if retries is None else retries) + 1
+        last_error = "no attempts made"
+
+        self._requests += 1
+        self._in_flight += 1
+        self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        started = time.perf_counter()
+        try:
+            for attempt in range(attempts):
+                if attempt:
+                    self._retries += 1
+                    await self._sleep_backoff(attempt - 1)
+                try:
+                    response = await client.request(method, url, json=json, timeout=self._timeout_for(timeout))
+                except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+                    # Includes pooled keep-alive connections the server has since closed
+                    last_error = f"{type(e).__name__}: {e}"
+                    continue
+                except httpx.TimeoutException as e:
+                    self._timeouts += 1
+                    self._errors += 1
+                    raise OllamaTimeout(f"Ollama timed out after {timeout or self.timeout}s: {url}") from e
+
+                if response.status_code in RETRYABLE_STATUS:
+                    last_error = f"HTTP {response.status_code}"
+                    continue
+                if response.status_code >= 400:
+                    self._errors += 1
+                    raise OllamaError(f"Ollama returned HTTP {response.status_code}: {response.text[:200]}",
+                                      status_code=response.status_code)
+                return response
+
+            self._errors += 1
+            raise OllamaError(f"Ollama unavailable after {attempts} attempts ({last_error})")
+        finally:
+            self._in_flight -= 1
+            self._latency_seconds += time.perf_counter() - started
+
+    async def generate(self, prompt: str, model: str, options: Optional[Dict[str, Any]] = None,
+                       timeout: Optional[float] = None, retries: Optional[int] = None,
+                       lane: Optional[str] = None, **extra) -> Dict[str, Any]:
+        """Non-streaming /api/generate; returns Ollama's JSON body.
+
+        Concurrent calls with the same model, prompt and options wait on a
+        single upstream generation (single-flight) and each get a copy of it.
+        The generation waits for an admission slot in its lane first and
+        raises OllamaBusy if it is shed.
+        """
+        payload = {"model": model, "prompt": prompt, "stream": False, **extra}
+        if options:
+            payload["options"] = options
+        self._model_last_used[model] = time.time()
+        lane = lane or self.lane
+        if not self.coalesce:
+            return await self._post_generate(payload, timeout, retries, lane)
+
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        flight = self._flights.get(key)
+        if flight is None or flight.task.done():
+            # The flight holds one slot, queued in the lane of the caller that started it
+            flight = _Flight(asyncio.ensure_future(self._post_generate(payload, timeout, retries, lane)))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task, key=key, flight=flight: self._land(key, flight))
+        else:
+            self._coalesced += 1
+
+        flight.waiters += 1
+        try:
+            # Shielded so one caller going away doesn't cancel the others' answer
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Unregister first: the done-callback runs later, and a new caller must not join a cancelled flight
+                self._land(key, flight)
+                flight.task.cancel()
+            raise
+        flight.waiters -= 1
+        return dict(result)
+
+    def _land(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def _admit(self, model: str, lane: str):
+        slot = await llm_admission.acquire(model, lane)
+        if slot is None:
+            self._shed += 1
+            raise OllamaBusy(f"Ollama is busy: {lane} request for {model} shed by the admission queue",
+                             status_code=503)
+        return slot
+
+    async def _post_generate(self, payload: Dict[str, Any], timeout: Optional[float],
+                             retries: Optional[int], lane: str) -> Dict[str, Any]:
+        slot = await self._admit(payload["model"], lane)
+        started = time.perf_counter()
+        try:
+            response = await self.request("POST", "/api/generate", json=payload, timeout=timeout, retries=retries)
+        except asyncio.CancelledError:
+            # Every waiter left; the aborted request closes the connection and Ollama stops
+            self._record_cancel(payload["model"], time.perf_counter() - started, 0)
+            raise
+        finally:
+            slot.release()
+        result = response.json()
+        self._record_completion(payload["model"], result)
+        return result
+
+    def _record_completion(self, model: str, result: Dict[str, Any]):
+        tokens, seconds = result.get("eval_count"), result.get("total_duration")
+        if tokens is None or seconds is None:
+            return
+        seconds = seconds / 1e9  # Ollama reports nanoseconds
+        previous = self._typical.get(model)
+        if previous is not None:
+            tokens, seconds = 0.8 * previous[0] + 0.2 * tokens, 0.8 * previous[1] + 0.2 * seconds
+        self._typical[model] = (tokens, seconds)
+
+    def _record_cancel(self, model: str, elapsed: float, tokens_done: int):
+        """Count an abandoned generation; savings are estimated from typical completed ones."""
+        self._cancelled += 1
+        typical = self._typical.get(model)
+        if typical is not None:
+            self._cancel_tokens_saved += max(typical[0] - tokens_done, 0.0)
+            self._cancel_seconds_saved += max(typical[1] - elapsed, 0.0)
+
+    async def stream_generate(self, prompt: str, model: str, options: Optional[Dict[str, Any]] = None,
+                              timeout: Optional[float] = None, retries: Optional[int] = None,
+                              lane: Optional[str] = None, **extra) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming /api/generate; yields each NDJSON chunk as Ollama produces it.
+
+        Connection failures are retried only before the first chunk arrives.
+        The final chunk (done=True) is annotated with ttft_ms.
+        """
+        payload = {"model": model, "prompt": prompt, "stream": True, **extra}
+        if options:
+            payload["options"] = options
+        self._model_last_used[model] = time.time()
+        client = self._get_client()
+        attempts = (self.retries if retries is None else retries) + 1
+        last_error = "no attempts made"
+
+        slot = await self._admit(model, lane or self.lane)
+        self._requests += 1
+        self._streams += 1
+        self._in_flight += 1
+        self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        started = time.perf_counter()
+        try:
+            for attempt in range(attempts):
+                if attempt:
+                    self._retries += 1
+                    await self._sleep_backoff(attempt - 1)
+                try:
+                    async with client.stream("POST", "/api/generate", json=payload,
+                                             timeout=self._timeout_for(timeout)) as response:
+                        if response.status_code in RETRYABLE_STATUS:
+                            last_error = f"HTTP {response.status_code}"
+                            continue
+                        if response.status_code >= 400:
+                            body = (await response.aread()).decode('utf-8', 'replace')
+                            self._errors += 1
+                            raise OllamaError(f"Ollama returned HTTP {response.status_code}: {body[:200]}",
+                                              status_code=response.status_code)
+
+                        ttft_ms = None
+                        tokens = 0
+                        done = False
+                        try:
+                            async for line in response.aiter_lines():
+                                if not line.strip():
+                                    continue
+                                chunk = json.loads(line)
+                                if ttft_ms is None and chunk.get("response"):
+                                    ttft_ms = (time.perf_counter() - started) * 1000.0
+                                    self._ttft_ms.append(ttft_ms)
+                                if chunk.get("done"):
+                                    done = True
+                                    chunk["ttft_ms"] = round(ttft_ms, 1) if ttft_ms is not None else None
+                                    self._record_completion(model, chunk)
+                                elif chunk.get("response"):
+                                    tokens += 1
+                                yield chunk
+                        except (GeneratorExit, asyncio.CancelledError):
+                            # Consumer went away: leaving the `async with` closes the connection and Ollama stops
+                            if not done:
+                                self._record_cancel(model, time.perf_counter() - started, tokens)
+                            raise
+                        return
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    last_error = f"{type(e).__name__}: {e}"
+                    continue
+                except httpx.TimeoutException as e:
+                    self._timeouts += 1
+                    self._errors += 1
+                    raise OllamaTimeout(f"Ollama stream timed out after {timeout or self.timeout}s") from e
+
+            self._errors += 1
+            raise OllamaError(f"Ollama unavailable after {attempts} attempts ({last_error})")
+        finally:
+            slot.release()
+            self._in_flight -= 1
+            self._latency_seconds += time.perf_counter() - started
+
+    async def get_json(self, path: str, timeout: Optional[float] = 5.0) -> Dict[str, Any]:
+        response = await self.request("GET", path, timeout=timeout, retries=0)
+        return response.json()
+
+    async def list_models(self) -> List[str]:
+        data = await self.get_json("/api/tags")
+        return [m.get("name") for m in data.get("models", [])]
+
+    def model_usage(self) -> Dict[str, float]:
+        """Last generation request time per model (warm-up calls are not counted)."""
+        return dict(self._model_last_used)
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        completed = self._requests - self._in_flight
+        return {
+            "base_url": self.base_url,
+            "max_connections": self.max_connections,
+            "requests": self._requests,
+            "in_flight": self._in_flight,
+            "max_in_flight": self._max_in_flight,
+            "retries": self._retries,
+            "errors": self._errors,
+            "timeouts": self._timeouts,
+            "avg_latency_ms": round(self._latency_seconds / completed * 1000.0, 1) if completed else 0.0,
+            "streams": self._streams,
+            "coalesced": self._coalesced,
+            "shed": self._shed,
+            "cancelled": self._cancelled,
+            "cancel_tokens_saved": round(self._cancel_tokens_saved),
+            "cancel_seconds_saved": round(self._cancel_seconds_saved, 1),
+            "coalesced_in_flight": sum(max(f.waiters - 1, 0) for f in self._flights.values()),
+            "ttft_ms": self._ttft_summary(),
+        }
+
+    def _ttft_summary(self) -> Dict[str, Any]:
+        """Time-to-first-token over the most recent streamed generations."""
+        samples = sorted(self._ttft_ms)
+        if not samples:
+            return {"samples": 0}
+        return {
+            "samples": len(samples),
+            "avg": round(sum(samples) / len(samples), 1),
+            "p50": round(samples[len(samples) // 2], 1),
+            "p95": round(samples[int(0.95 * (len(samples) - 1))], 1),
+        }
+
+
+# Create singleton instance
+ollama_client = OllamaClient()
@@ -0,0 +1,231 @@
+# PostgreSQL Connection Pool for Symbiosis
+# Shared, health-checked psycopg2 pool used by every vector-store user in the service
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+# Optional PostgreSQL import - will work without it
+try:
+    import psycopg2
+    import psycopg2.pool
+    POSTGRES_AVAILABLE = True
+except ImportError:
+    POSTGRES_AVAILABLE = False
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the acquire timeout."""
+
+
+class PgConnectionPool:
+    """Thread-safe psycopg2 pool with health checks, reconnect and statement timeouts.
+
+    Connections are created lazily, so importing the service never requires a
+    running database. Callers borrow a connection per request with
+    connection()/cursor(); a broken connection is discarded and replaced on
+    the next checkout.
+    """
+
+    def __init__(self, minconn: Optional[int] = None, maxconn: Optional[int] = None,
+                 statement_timeout_ms: Optional[int] = None, acquire_timeout: Optional[float] = None,
+                 connect_params: Optional[Dict[str, Any]] = None):
+        self.minconn = int(minconn or os.getenv('PGVECTOR_POOL_MIN', '1'))
+        self.maxconn = int(maxconn or os.getenv('PGVECTOR_POOL_MAX', '10'))
+        self.statement_timeout_ms = int(statement_timeout_ms or os.getenv('PGVECTOR_STATEMENT_TIMEOUT_MS', '30000'))
+        self.acquire_timeout = float(acquire_timeout or os.getenv('PGVECTOR_POOL_ACQUIRE_TIMEOUT', '10'))
+        # Idle connections older than this are pinged before being handed out
+        self.health_check_after = float(os.getenv('PGVECTOR_POOL_HEALTH_CHECK_SECONDS', '30'))
+        self.retry_interval = float(os.getenv('PGVECTOR_POOL_RETRY_SECONDS', '30'))
+        # dbname/user/password/host/port; defaults to the PGVECTOR_* database
+        self.connect_params = connect_params or {
+            "dbname": os.getenv('PGVECTOR_DB', 'vector_db'),
+            "user": os.getenv('PGVECTOR_USER', 'postgres'),
+            "password": os.getenv('PGVECTOR_PASSWORD', ''),
+            "host": os.getenv('PGVECTOR_HOST', 'localhost'),
+            "port": os.getenv('PGVECTOR_PORT', '5432'),
+        }
+
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._last_used: Dict[int, float] = {}
+        self._last_failure = 0.0
+        self.last_error: Optional[str] = None
+
+        self._stats_lock = threading.Lock()
+        self._acquired = 0
+        self._in_use = 0
+        self._wait_seconds = 0.0
+        self._max_wait = 0.0
+        self._errors = 0
+        self._reconnects = 0
+        self._timeouts = 0
+
+    # ------------- Pool lifecycle -------------
+    def _ensure_pool(self):
+        if self._pool is not None:
+            return self._pool
+        with self._lock:
+            if self._pool is None:
+                if not POSTGRES_AVAILABLE:
+                    raise ImportError("PostgreSQL is not available. Please install psycopg2-binary.")
+                self._pool = psycopg2.pool.ThreadedConnectionPool(
+                    self.minconn,
+                    self.maxconn,
+                    **self.connect_params,
+                    connect_timeout=int(os.getenv('PGVECTOR_CONNECT_TIMEOUT', '5')),
+                    options=f"-c statement_timeout={self.statement_timeout_ms}",
+                )
+        return self._pool
+
+    def available(self) -> bool:
+        """True when the database is reachable; retries a failed pool periodically."""
+        if self._pool is not None:
+            return True
+        if time.monotonic() - self._last_failure < self.retry_interval and self._last_failure:
+            return False
+        try:
+            self._ensure_pool()
+            self.last_error = None
+            return True
+        except Exception as e:
+            self._last_failure = time.monotonic()
+            self.last_error = str(e)
+            print(f"Warning: Could not connect to PostgreSQL: {e}")
+            return False
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+    # ------------- Checkout -------------
+    def _checkout(self):
+        pool = self._ensure_pool()
+        conn = pool.getconn()
+        last_used = self._last_used.get(id(conn), 0.0)
+
+        if conn.closed or time.monotonic() - last_used > self.health_check_after:
+            if not self._is_healthy(conn):
+                pool.putconn(conn, close=True)
+                self._last_used.pop(id(conn), None)
+                with self._stats_lock:
+                    self._reconnects += 1
+                conn = pool.getconn()
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    @contextmanager
+    def connection(self, timeout_ms: Optional[int] = None):
+        """Borrow a connection; uncommitted work is rolled back on return.
+
+        timeout_ms overrides the statement timeout for this checkout only.
+        """
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._stats_lock:
+                self._timeouts += 1
+            raise PoolTimeout(f"No database connection available within {self.acquire_timeout}s")
+
+        conn = None
+        broken = False
+        try:
+            conn = self._checkout()
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self._acquired += 1
+                self._in_use += 1
+                self._wait_seconds += waited
+                self._max_wait = max(self._max_wait, waited)
+
+            if timeout_ms is not None:
+                with conn.cursor() as cur:
+                    # SET LOCAL lasts until the caller's commit/rollback
+                    cur.execute("SET LOCAL statement_timeout = %s", (int(timeout_ms),))
+
+            yield conn
+        except Exception as e:
+            with self._stats_lock:
+                self._errors += 1
+            if conn is not None:
+                broken = bool(conn.closed) or isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+                if not broken:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        broken = True
+            raise
+        finally:
+            if conn is not None:
+                if not broken and not conn.closed:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        broken = True
+                self._last_used[id(conn)] = time.monotonic()
+                if broken:
+                    self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=broken or bool(conn.closed))
+                with self._stats_lock:
+                    self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def cursor(self, cursor_factory=None, timeout_ms: Optional[int] = None, commit: bool = False):
+        """Borrow a connection and yield a cursor; optionally commit on success."""
+        with self.connection(timeout_ms=timeout_ms) as conn:
+            with conn.cursor(cursor_factory=cursor_factory) as cur:
+                yield cur
+            if commit:
+                conn.commit()
+
+    # ------------- Metrics -------------
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "database": self.connect_params.get("dbname"),
+                "connected": self._pool is not None,
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "in_use": self._in_use,
+                "acquired": self._acquired,
+                "avg_wait_ms": round(self._wait_seconds / self._acquired * 1000.0, 3) if self._acquired else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000.0, 3),
+                "acquire_timeouts": self._timeouts,
+                "errors": self._errors,
+                "reconnects": self._reconnects,
+                "statement_timeout_ms": self.statement_timeout_ms,
+                "last_error": self.last_error,
+            }
+
+
+# Create singleton instance
+pg_pool = PgConnectionPool()
+
+# Laravel's pgsql_rag database (config/database.php, PGSQL_RAG_*): general_knowledge and the
+# structured knowledge tables are written there, so every reader of them uses this pool
+knowledge_pool = PgConnectionPool(
+    maxconn=int(os.getenv('PGSQL_RAG_POOL_MAX', '5')),
+    connect_params={
+        "dbname": os.getenv('PGSQL_RAG_DATABASE', 'farm_rag_db'),
+        "user": os.getenv('PGSQL_RAG_USERNAME', 'farm_rag_user'),
+        "password": os.getenv('PGSQL_RAG_PASSWORD', ''),
+        "host": os.getenv('PGSQL_RAG_HOST', '127.0.0.1'),
+        "port": os.getenv('PGSQL_RAG_PORT', '5432'),
+    },
+)
@@ -0,0 +1,164 @@
+# Prompt Assembler for Symbiosis
+# Packs history, retrieved chunks and few-shot examples into a per-model token budget
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional
+
+# Prompt budgets (tokens) sized for Ollama's default 2048-token context, leaving room for the answer
+DEFAULT_BUDGETS = {'tinyllama': 1200, 'gemma2': 1500, 'phi3': 1500, 'mistral': 1500}
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Roughly 4 characters per token for English with Llama-family tokenizers."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, ending on a sentence or word boundary where possible."""
+    limit = max_tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    boundary = max(cut.rfind('. '), cut.rfind('\n'))
+    cut = cut[:boundary + 1] if boundary > limit // 2 else cut.rsplit(' ', 1)[0]
+    return cut.rstrip() + '…'
+
+
+def format_turns(turns: List[Dict[str, str]]) -> str:
+    return "\n".join(f"{turn.get('role', 'user').capitalize()}: {turn.get('content', '')}" for turn in turns)
+
+
+def summarize_turn(turn: Dict[str, str], max_chars: int = 160) -> str:
+    """Extractive one-line summary: the first sentence of the turn."""
+    content = ' '.join((turn.get('content') or '').split())
+    sentence = re.split(r'(?<=[.!?])\s', content, maxsplit=1)[0]
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars].rsplit(' ', 1)[0] + '…'
+    return f"- {turn.get('role', 'user').capitalize()}: {sentence}"
+
+
+def budget_for(model: str) -> int:
+    """Token budget for a model: PROMPT_TOKEN_BUDGETS ("mistral=2500,tinyllama=1000") over the defaults."""
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in os.getenv('PROMPT_TOKEN_BUDGETS', '').split(','):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            budgets[name.strip()] = int(value)
+    name = (model or '').split(':')[0]
+    return budgets.get(model, budgets.get(name, int(os.getenv('PROMPT_TOKEN_BUDGET', '1500'))))
+
+
+@dataclass
+class AssembledPrompt:
+    """What fitted into the budget; callers render it into their own template."""
+    budget: int
+    history: List[Dict[str, str]] = field(default_factory=list)  # recent turns, oldest first
+    summary: str = ""  # older turns condensed to one line each
+    chunks: List[str] = field(default_factory=list)  # best first, possibly truncated
+    examples: List[Dict[str, str]] = field(default_factory=list)
+    tokens: Dict[str, int] = field(default_factory=dict)
+    dropped: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+
+class PromptAssembler:
+    """Fills a token budget in priority order.
+
+    The fixed text (system prompt, question, instructions) is always kept.
+    The remaining budget goes to, in order: the most recent conversation
+    turns, retrieved chunks best-first (the last one truncated to fit), a
+    one-line-per-turn summary of older turns, and whole few-shot examples.
+    Token counts are estimates (chars / 4), logged once per prompt.
+    """
+
+    def __init__(self, model: str, budget: Optional[int] = None, recent_turns: Optional[int] = None,
+                 max_chunk_tokens: Optional[int] = 300, min_chunk_tokens: int = 48):
+        self.model = model
+        self.budget = budget or budget_for(model)
+        self.recent_turns = int(recent_turns or os.getenv('PROMPT_RECENT_TURNS', '4'))
+        self.max_chunk_tokens = max_chunk_tokens
+        self.min_chunk_tokens = min_chunk_tokens
+
+    def assemble(self, fixed_text: str, history: Optional[List[Dict[str, str]]] = None,
+                 chunks: Optional[List[str]] = None, examples: Optional[List[Dict[str, str]]] = None,
+                 example_text=None) -> AssembledPrompt:
+        """Pack the optional sections around fixed_text; example_text renders one example for counting."""
+        history = [turn for turn in (history or []) if turn.get('content')]
+        chunks = [chunk for chunk in (chunks or []) if chunk and chunk.strip()]
+        examples = examples or []
+        example_text = example_text or (lambda ex: f"Q: {ex.get('question', '')}\nA: {ex.get('answer', '')}")
+
+        packed = AssembledPrompt(budget=self.budget)
+        packed.tokens["fixed"] = estimate_tokens(fixed_text)
+        remaining = self.budget - packed.tokens["fixed"]
+
+        # 1. Recent turns, newest first, kept contiguous
+        recent = []
+        for turn in reversed(history[-self.recent_turns:]):
+            cost = estimate_tokens(format_turns([turn])) + 1
+            if cost > remaining:
+                if not recent and remaining > self.min_chunk_tokens:
+                    # Always keep some of the last turn, it is what the question refers to
+                    turn = {**turn, "content": truncate_to_tokens(turn["content"], remaining // 2)}
+                    cost = estimate_tokens(format_turns([turn])) + 1
+                    recent.append(turn)
+                    remaining -= cost
+                break
+            recent.append(turn)
+            remaining -= cost
+        packed.history = list(reversed(recent))
+        packed.tokens["history"] = sum(estimate_tokens(format_turns([t])) + 1 for t in packed.history)
+
+        # 2. Retrieved chunks, best first
+        used = 0
+        for chunk in chunks:
+            if self.max_chunk_tokens:
+                chunk = truncate_to_tokens(chunk, self.max_chunk_tokens)
+            cost = estimate_tokens(chunk) + 2
+            if cost > remaining:
+                if remaining - 2 >= self.min_chunk_tokens:
+                    chunk = truncate_to_tokens(chunk, remaining - 2)
+                    packed.chunks.append(chunk)
+                    used += estimate_tokens(chunk) + 2
+                    remaining -= estimate_tokens(chunk) + 2
+                break
+            packed.chunks.append(chunk)
+            used += cost
+            remaining -= cost
+        packed.tokens["chunks"] = used
+        packed.dropped["chunks"] = len(chunks) - len(packed.chunks)
+
+        # 3. Older turns as a summary, newest first so the latest context survives
+        older = history[:len(history) - len(packed.history)]
+        lines = []
+        for turn in reversed(older):
+            line = summarize_turn(turn)
+            cost = estimate_tokens(line) + 1
+            if cost > remaining:
+                break
+            lines.append(line)
+            remaining -= cost
+        packed.summary = "\n".join(reversed(lines))
+        packed.tokens["summary"] = estimate_tokens(packed.summary)
+        packed.dropped["turns"] = len(older) - len(lines)
+
+        # 4. Few-shot examples, whole or not at all
+        used = 0
+        for example in examples:
+            cost = estimate_tokens(example_text(example)) + 4
+            if cost > remaining:
+                continue
+            packed.examples.append(example)
+            used += cost
+            remaining -= cost
+        packed.tokens["examples"] = used
+        packed.dropped["examples"] = len(examples) - len(packed.examples)
+
+        print(f"Prompt tokens ({self.model}): {packed.total_tokens}/{self.budget} "
+              f"{packed.tokens} dropped={packed.dropped}")
+        return packed
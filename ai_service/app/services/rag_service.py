@@ -2,19 +2,99 @@
 # Integrates vector search with LLM responses for enhanced agricultural intelligence
 
 import os
+import re
 import json
-from typing import List, Dict, Any, Optional
+import asyncio
+from contextlib import aclosing
+from typing import List, Dict, Any, Optional, AsyncIterator
 from datetime import datetime
 
-from app.services.llm_service import LLMService, PgVectorStore
+from app.services.llm_service import LLMService, PgVectorStore, POSTGRES_AVAILABLE, vector_literal
+from app.services.ollama_client import sse_event, stream_until_disconnect, ClientDisconnected
+from app.services.generation_pipeline import GenerationPipeline
+from app.services.answer_cache import answer_cache
+from app.services.prompt_assembler import PromptAssembler, format_turns
+from app.services.reranker import reranker
+from app.services.pg_pool import knowledge_pool
+
+if POSTGRES_AVAILABLE:
+    import psycopg2.extras
+
+# Top candidates from pgvector and from full-text search, fused by reciprocal rank:
+# score = sum over rankings of 1 / (rrf_k + rank). One round trip; both halves use their index.
+HYBRID_SEARCH_SQL = """
+    WITH vector_hits AS (
+        SELECT id, row_number() OVER (ORDER BY distance) AS rank
+        FROM (
+            SELECT id, embedding <#> %(embedding)s::vector AS distance
+            FROM general_knowledge
+            WHERE embedding IS NOT NULL
+            ORDER BY embedding <#> %(embedding)s::vector
+            LIMIT %(candidates)s
+        ) nearest
+    ),
+    lexical_hits AS (
+        SELECT id, row_number() OVER (ORDER BY text_rank DESC) AS rank
+        FROM (
+            SELECT id, ts_rank_cd(search_tsv, keywords) AS text_rank
+            FROM general_knowledge, websearch_to_tsquery(%(config)s::regconfig, %(keywords)s) AS keywords
+            WHERE search_tsv @@ keywords
+            ORDER BY text_rank DESC
+            LIMIT %(candidates)s
+        ) matched
+    ),
+    fused AS (
+        SELECT id,
+               sum(1.0 / (%(rrf_k)s + rank)) AS rrf_score,
+               min(rank) FILTER (WHERE ranking = 'vector') AS vector_rank,
+               min(rank) FILTER (WHERE ranking = 'lexical') AS lexical_rank
+        FROM (
+            SELECT id, rank, 'vector' AS ranking FROM vector_hits
+            UNION ALL
+            SELECT id, rank, 'lexical' AS ranking FROM lexical_hits
+        ) ranked
+        GROUP BY id
+    )
+    SELECT g.id, g.title, g.content, g.source, g.page_number, g.chunk_index,
+           (g.embedding <#> %(embedding)s::vector) AS distance,
+           f.rrf_score, f.vector_rank, f.lexical_rank
+    FROM fused f
+    JOIN general_knowledge g ON g.id = f.id
+    ORDER BY f.rrf_score DESC
+    LIMIT %(limit)s
+"""
+
+
+def keyword_query(text: str) -> str:
+    """OR together the query's words for websearch_to_tsquery (which drops the stop words).
+
+    Plain AND semantics would make every word mandatory and miss most chunks;
+    OR plus rank-by-coverage still puts exact identifiers like "F1 Doric" first.
+    """
+    words = [w for w in re.findall(r"\w+", text) if w.lower() != 'or']
+    return " or ".join(words)
+
 
 class RAGService:
     """Retrieval-Augmented Generation service for agricultural knowledge"""
 
     def __init__(self):
         self.llm_service = LLMService()
-        self.vector_store = PgVectorStore()
+        # general_knowledge lives in Laravel's RAG database; without it retrieval uses the LLMService store
+        self.vector_store = PgVectorStore(pool=knowledge_pool, manage_tables=False) if POSTGRES_AVAILABLE else None
         self.knowledge_ingested = False
+        self.index_ready = False
+        # Hybrid retrieval: full-text and vector rankings fused with reciprocal-rank fusion
+        self.hybrid_enabled = os.getenv('RAG_HYBRID_ENABLED', 'true').lower() == 'true'
+        self.hybrid_ready = False
+        self.hybrid_candidates = int(os.getenv('RAG_HYBRID_CANDIDATES', '20'))
+        self.rrf_k = int(os.getenv('RAG_RRF_K', '60'))
+        self.prompt_assembler = PromptAssembler(self.llm_service.model)
+        # retrieve -> prompt -> LLM in-process (GENERATION_BACKEND=farm_ai keeps the old /ask hop)
+        self.pipeline = GenerationPipeline(self._retrieve_relevant_knowledge, self._build_augmented_prompt,
+                                           model=self.llm_service.model,
+                                           embed=lambda text: self.llm_service.embed_texts([text])[0],
+                                           cache=answer_cache)
 
         # Initialize knowledge base
         self._initialize_knowledge_base()
@@ -25,82 +105,133 @@ class RAGService:
             # Check if we have any documents in the vector store
             count = self._get_document_count()
             self.knowledge_ingested = count > 0
+            if self._pg_available():
+                # Index builds are explicit (reindex endpoint); startup only reports a missing one
+                self.index_ready = self.vector_store.check_index('general_knowledge')
+                if self.hybrid_enabled:
+                    # The search_tsv column and its GIN index come from a Laravel migration; only detect them here
+                    self.hybrid_ready = self.vector_store.has_column('general_knowledge', 'search_tsv')
+                    if not self.hybrid_ready:
+                        print("Warning: general_knowledge has no search_tsv column (run php artisan migrate), "
+                              "using vector-only retrieval")
         except Exception as e:
             print(f"Warning: Could not initialize knowledge base: {e}")
             self.knowledge_ingested = False
 
+    def _pg_available(self) -> bool:
+        return self.vector_store is not None and self.vector_store.available
+
     def _get_document_count(self) -> int:
         """Get the number of documents in the vector store"""
-        if not self.vector_store.conn:
-            return 0
+        if not self._pg_available():
+            store = self.llm_service.store
+            return store.count() if store and store.available else 0
 
         try:
-            with self.vector_store.conn.cursor() as cursor:
+            with self.vector_store.pool.cursor() as cursor:
                 cursor.execute("SELECT COUNT(*) FROM general_knowledge")
                 result = cursor.fetchone()
                 return result[0] if result else 0
         except Exception:
             return 0
 
-    def get_augmented_response(self, user_message: str, conversation_history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+    async def get_augmented_response(self, user_message: str, conversation_history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
         """Get an augmented response using retrieved knowledge"""
         try:
-            # Use the user message as the query
-            query = user_message
-
-            # Retrieve relevant knowledge
-            relevant_docs = self._retrieve_relevant_knowledge(query, limit=3)
-
-            # Build augmented prompt
-            augmented_prompt = self._build_augmented_prompt(query, relevant_docs, conversation_history)
-
-            # Get LLM response by calling the main AI service
-            import requests
-            ai_response = requests.post(
-                'http://localhost:8005/ask',
-                json={'question': augmented_prompt},
-                timeout=60
-            )
-            
-            if ai_response.status_code == 200:
-                response_data = ai_response.json()
-                response = response_data.get('answer', augmented_prompt)
-            else:
-                response = f"AI Service Error: {ai_response.status_code}"
+            # Retrieval, prompt and generation in one in-process pass
+            result = await self.pipeline.run(user_message, conversation_history)
 
             return {
-                "response": response,
-                "sources": [doc["metadata"] for doc in relevant_docs],
-                "confidence": len(relevant_docs) / 3.0,  # Simple confidence score
-                "rag_enabled": True
+                "response": result.answer,
+                "sources": [doc["metadata"] for doc in result.documents],
+                "confidence": len(result.documents) / 3.0,  # Simple confidence score
+                "rag_enabled": True,
+                "model": result.model,
+                "backend": result.backend,
+                "timings": result.timings,
+                "cached": result.cached
             }
 
         except Exception as e:
             print(f"RAG augmentation failed: {e}")
             return self.get_fallback_wisdom(user_message)
 
+    async def stream_augmented_response(self, user_message: str,
+                                        conversation_history: Optional[List[Dict[str, str]]] = None,
+                                        http_request=None) -> AsyncIterator[str]:
+        """Relay the LLM token stream for a RAG answer as Server-Sent Events
+
+        With http_request given, generation stops as soon as that client disconnects.
+        """
+        timings: Dict[str, float] = {}
+        relevant_docs, augmented_prompt = await self.pipeline.prepare(user_message, conversation_history, timings)
+        yield sse_event({"sources": [doc["metadata"] for doc in relevant_docs]}, event="sources")
+
+        chunks = self.pipeline.stream(augmented_prompt, timings)
+        if http_request is not None:
+            chunks = stream_until_disconnect(http_request, chunks)
+        try:
+            # aclosing: Starlette closing this response closes the Ollama stream with it
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    if chunk.get("response"):
+                        yield sse_event({"token": chunk["response"]}, event="token")
+                    if chunk.get("done"):
+                        yield sse_event({
+                            "model": chunk.get("model", self.pipeline.model),
+                            "backend": self.pipeline.backend,
+                            "ttft_ms": chunk.get("ttft_ms"),
+                            "tokens": chunk.get("eval_count"),
+                            "confidence": len(relevant_docs) / 3.0,
+                            "timings": timings,
+                        }, event="done")
+        except ClientDisconnected:
+            print("RAG stream stopped: client disconnected")
+        except Exception as e:
+            print(f"RAG streaming failed: {e}")
+            yield sse_event({"error": str(e), **self.get_fallback_wisdom(user_message)}, event="error")
+
     def _retrieve_relevant_knowledge(self, query: str, limit: int = 3) -> List[Dict[str, Any]]:
-        """Retrieve relevant knowledge documents"""
-        if not self.vector_store.conn:
-            return []
+        """Retrieve relevant knowledge documents, reranked by the cross-encoder when enabled"""
+        if not reranker.enabled:
+            return self._search_knowledge(query, limit)
+        # Wider candidate set; the reranker keeps the best `limit` (or the vector order if over budget)
+        candidates = self._search_knowledge(query, max(reranker.candidates, limit))
+        return reranker.rerank(query, candidates, limit)
+
+    def _search_knowledge(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """First-stage retrieval: hybrid or vector search in Postgres, else the local store"""
+        if not self._pg_available():
+            return self._retrieve_from_local_store(query, limit)
 
         try:
             # Generate embedding for the query
-            query_embedding = self.llm_service.embed_texts([query])[0]
-
-            # Search for similar documents in general_knowledge table
-            with self.vector_store.conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                cursor.execute(
-                    """
-                    SELECT id, title, content, source, page_number, chunk_index,
-                           (embedding <#> %s::vector) AS distance
-                    FROM general_knowledge
-                    WHERE embedding IS NOT NULL
-                    ORDER BY embedding <#> %s::vector ASC
-                    LIMIT %s
-                    """,
-                    (query_embedding, query_embedding, limit)
-                )
+            query_embedding = vector_literal(self.llm_service.embed_texts([query])[0])
+
+            with self.vector_store.pool.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+                self.vector_store.apply_search_settings(cursor)
+                if self.hybrid_ready:
+                    cursor.execute(HYBRID_SEARCH_SQL, {
+                        "embedding": query_embedding,
+                        "keywords": keyword_query(query),
+                        "config": self.vector_store.text_search_config,
+                        "candidates": max(self.hybrid_candidates, limit),
+                        "rrf_k": self.rrf_k,
+                        "limit": limit,
+                    })
+                else:
+                    # Search for similar documents in general_knowledge table
+                    cursor.execute(
+                        """
+                        SELECT id, title, content, source, page_number, chunk_index,
+                               (embedding <#> %s::vector) AS distance
+                        FROM general_knowledge
+                        WHERE embedding IS NOT NULL
+                        ORDER BY embedding <#> %s::vector ASC
+                        LIMIT %s
+                        """,
+                        (query_embedding, query_embedding, limit)
+                    )
                 rows = cursor.fetchall()
 
                 # Convert to expected format
@@ -113,7 +244,9 @@ class RAGService:
                             "source": row['source'],
                             "page_number": row['page_number'],
                             "chunk_index": row['chunk_index'],
-                            "distance": row['distance']
+                            "distance": row['distance'],
+                            **({"rrf_score": float(row['rrf_score']), "vector_rank": row['vector_rank'],
+                                "lexical_rank": row['lexical_rank']} if self.hybrid_ready else {})
                         }
                     }
                     for row in rows
@@ -123,9 +256,18 @@ class RAGService:
             print(f"Knowledge retrieval failed: {e}")
             return []
 
+    def _retrieve_from_local_store(self, query: str, limit: int = 3) -> List[Dict[str, Any]]:
+        """Retrieve from the LLMService store (e.g. in-process FAISS) when Postgres is down"""
+        try:
+            records = self.llm_service.retrieve_context(query, top_k=limit)
+            return [{"text": record.text, "metadata": record.metadata} for record in records]
+        except Exception as e:
+            print(f"Local knowledge retrieval failed: {e}")
+            return []
+
     def _build_augmented_prompt(self, query: str, relevant_docs: List[Dict[str, Any]],
-                               context: Optional[Dict[str, Any]] = None) -> str:
-        """Build an augmented prompt with retrieved knowledge"""
+                               context: Optional[Any] = None) -> str:
+        """Build an augmented prompt with retrieved knowledge, packed into the model's token budget"""
 
         # Base prompt
         prompt = f"""You are a holistic agricultural AI assistant with access to specialized knowledge.
@@ -134,18 +276,30 @@ Query: {query}
 
 """
 
-        # Add context if provided
-        if context:
+        # The pipeline passes the conversation history; other context is a plain dict
+        history = context if isinstance(context, list) else None
+        if isinstance(context, dict) and context:
             prompt += f"Context: {json.dumps(context)}\n\n"
 
+        closing = """Please provide a comprehensive, practical response that incorporates both general agricultural wisdom and the specific knowledge provided above. Focus on biodynamic principles, sacred geometry, and sustainable farming practices."""
+
+        # Docs arrive best match first; recent turns outrank knowledge, which outranks older turns
+        packed = self.prompt_assembler.assemble(prompt + closing, history=history,
+                                                chunks=[doc['text'] for doc in relevant_docs])
+
+        if packed.summary:
+            prompt += f"Earlier in this conversation:\n{packed.summary}\n\n"
+        if packed.history:
+            prompt += f"Recent conversation:\n{format_turns(packed.history)}\n\n"
+
         # Add retrieved knowledge
-        if relevant_docs:
+        if packed.chunks:
             prompt += "Relevant Knowledge:\n"
-            for i, doc in enumerate(relevant_docs, 1):
-                prompt += f"{i}. {doc['text'][:500]}...\n"
+            for i, chunk in enumerate(packed.chunks, 1):
+                prompt += f"{i}. {chunk}\n"
             prompt += "\n"
 
-        prompt += """Please provide a comprehensive, practical response that incorporates both general agricultural wisdom and the specific knowledge provided above. Focus on biodynamic principles, sacred geometry, and sustainable farming practices."""
+        prompt += closing
 
         return prompt
 
@@ -162,28 +316,27 @@ Query: {query}
     def ingest_knowledge(self, documents: List[Dict[str, Any]]) -> bool:
         """Ingest new knowledge documents into the vector store"""
         try:
-            success_count = 0
+            docs = [doc for doc in documents if doc.get("text", "")]
+            if not docs:
+                return False
 
-            for doc in documents:
-                text = doc.get("text", "")
-                metadata = doc.get("metadata", {})
+            texts = [doc["text"] for doc in docs]
+            metadatas = [doc.get("metadata", {}) for doc in docs]
 
-                if text:
-                    # Generate embedding
-                    embedding = self.llm_service.embed_texts([text])[0]
+            # One batched embedding call for the whole set
+            embeddings = self.llm_service.embed_texts(texts)
+            store = self.vector_store if self._pg_available() else self.llm_service.store
+            store.add(texts, embeddings, metadatas)
 
-                    # Add to vector store
-                    self.vector_store.add([text], [embedding], [metadata])
-                    success_count += 1
-
-            self.knowledge_ingested = success_count > 0
-            return success_count > 0
+            self.knowledge_ingested = True
+            answer_cache.invalidate("knowledge documents ingested")
+            return True
 
         except Exception as e:
             print(f"Knowledge ingestion failed: {e}")
             return False
 
-    def get_contextual_help(self, query: str, page_context: str = "") -> Dict[str, Any]:
+    async def get_contextual_help(self, query: str, page_context: str = "") -> Dict[str, Any]:
         """Get contextual help based on page context and user query"""
         try:
             # Build enhanced query with page context
@@ -191,18 +344,19 @@ Query: {query}
             if page_context:
                 enhanced_query = f"Context: {page_context}. Help needed: {query}"
 
-            # Retrieve relevant context from admin docs
+            # One filtered retrieval over the admin docs, narrowed to the page's docs when it has any
+            loop = asyncio.get_running_loop()
+            filters = {"source_prefix": "admin-docs/"}
             context_records = []
-            
-            # First try to get context from admin-docs specifically
             if self.llm_service.store:
-                admin_context = self.llm_service.retrieve_context(f"admin-docs {enhanced_query}", top_k=3)
-                context_records.extend(admin_context)
-
-            # If no admin context, try general query
-            if not context_records:
-                general_context = self.llm_service.retrieve_context(enhanced_query, top_k=3)
-                context_records.extend(general_context)
+                if page_context:
+                    context_records = await loop.run_in_executor(
+                        None, self.llm_service.retrieve_context, enhanced_query, 3,
+                        {**filters, "page_context": page_context})
+                if not context_records:
+                    # Same query text, so the embedding comes from the cache
+                    context_records = await loop.run_in_executor(
+                        None, self.llm_service.retrieve_context, enhanced_query, 3, filters)
 
             # Build context string
             context_text = ""
@@ -226,7 +380,7 @@ Please provide clear, step-by-step guidance based on the documentation above. Fo
 
 Response:"""
 
-                response = self.llm_service.chat([{"role": "user", "content": prompt}])
+                response = await self.llm_service.chat([{"role": "user", "content": prompt}])
                 
                 return {
                     "response": response,
@@ -257,7 +411,9 @@ Response:"""
         return {
             "documents_count": self._get_document_count(),
             "knowledge_ingested": self.knowledge_ingested,
-            "vector_store_available": self.vector_store.conn is not None,
+            "hybrid_retrieval": self.hybrid_ready,
+            "ann_index_ready": self.index_ready,
+            "vector_store_available": self._pg_available() or bool(self.llm_service.store and self.llm_service.store.available),
             "last_updated": datetime.now().isoformat()
         }
 
@@ -0,0 +1,188 @@
+# Cross-Encoder Reranker for Symbiosis
+# Rescores a wide retrieval candidate set with a small CPU cross-encoder under a hard latency budget
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeout
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+from app.services.embedding_cache import normalize_text
+
+
+def default_chunk_id(doc: Dict[str, Any]) -> str:
+    """Stable id for a retrieved document: its row id, else a hash of its text."""
+    metadata = doc.get("metadata") or {}
+    if metadata.get("id") is not None:
+        return f"id:{metadata['id']}"
+    return "text:" + hashlib.sha1(doc.get("text", "").encode("utf-8")).hexdigest()
+
+
+class CrossEncoderReranker:
+    """Optional rerank stage between retrieval and prompt building.
+
+    All uncached (query, chunk) pairs are scored in one batched forward pass
+    on a single worker thread. Scores are cached per (query hash, chunk id),
+    so a repeated query costs no model time. When the pass does not finish
+    within the latency budget the caller gets the vector order instead; the
+    pass keeps running and fills the cache, so the next identical query is
+    reranked. At most one pass is queued or running: while one is, other
+    queries fall back straight away instead of queueing behind passes whose
+    callers have already given up. The model loads in the background, and
+    until it is ready every query falls back the same way.
+    """
+
+    def __init__(self, model_name: Optional[str] = None):
+        self.enabled = os.getenv('RERANK_ENABLED', 'false').lower() == 'true'
+        self.model_name = model_name or os.getenv('RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+        self.candidates = int(os.getenv('RERANK_CANDIDATES', '30'))
+        self.budget_ms = float(os.getenv('RERANK_BUDGET_MS', '300'))
+        self.max_chars = int(os.getenv('RERANK_MAX_CHARS', '1200'))  # the model reads ~512 tokens at most
+        self.cache_entries = int(os.getenv('RERANK_CACHE_ENTRIES', '20000'))
+
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._loading = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reranker')
+        self._submit_lock = threading.Lock()
+        self._inflight: Optional[Future] = None
+
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._counts = {"reranked": 0, "fallback_budget": 0, "fallback_busy": 0, "fallback_loading": 0, "errors": 0}
+        self._pairs_scored = 0
+        self._cache_hits = 0
+        self._score_seconds = 0.0
+        self.last_error: Optional[str] = None
+
+    # ------------- Lifecycle -------------
+    def load(self):
+        """Load the cross-encoder (idempotent, blocking)."""
+        with self._load_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                started = time.perf_counter()
+                self._model = CrossEncoder(self.model_name, max_length=512)
+                print(f"Rerank model {self.model_name} loaded in {time.perf_counter() - started:.2f}s")
+
+    def preload(self):
+        """Start loading in the background so no request waits on it."""
+        if not self.enabled or self._model is not None or self._loading:
+            return
+        self._loading = True
+
+        def _load():
+            try:
+                self.load()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Warning: Rerank model unavailable, keeping vector order: {e}")
+            finally:
+                self._loading = False
+
+        self._executor.submit(_load)
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    # ------------- Scoring -------------
+    def _remember(self, scores: Dict[Tuple[str, str], float]):
+        with self._cache_lock:
+            for key, score in scores.items():
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def _score(self, query: str, pending: List[Tuple[Tuple[str, str], str]]) -> Dict[Tuple[str, str], float]:
+        started = time.perf_counter()
+        raw = self._model.predict([(query, text[:self.max_chars]) for _, text in pending],
+                                  batch_size=len(pending), show_progress_bar=False)
+        scores = {key: float(score) for (key, _), score in zip(pending, raw)}
+        self._remember(scores)
+        with self._stats_lock:
+            self._pairs_scored += len(pending)
+            self._score_seconds += time.perf_counter() - started
+        return scores
+
+    def rerank(self, query: str, docs: List[Dict[str, Any]], top_k: int,
+               chunk_id: Callable[[Dict[str, Any]], str] = default_chunk_id) -> List[Dict[str, Any]]:
+        """Best top_k of docs by cross-encoder score, or docs[:top_k] when over budget or unavailable."""
+        if not self.enabled or len(docs) <= 1:
+            return docs[:top_k]
+        if self._model is None:
+            self.preload()
+            with self._stats_lock:
+                self._counts["fallback_loading"] += 1
+            return docs[:top_k]
+
+        started = time.perf_counter()
+        query_hash = hashlib.sha1(normalize_text(query).encode("utf-8")).hexdigest()
+        keys = [(query_hash, chunk_id(doc)) for doc in docs]
+        with self._cache_lock:
+            scores = {key: self._cache[key] for key in keys if key in self._cache}
+            for key in scores:
+                self._cache.move_to_end(key)
+        pending = [(key, doc.get("text", "")) for key, doc in zip(keys, docs) if key not in scores]
+        with self._stats_lock:
+            self._cache_hits += len(scores)
+
+        if pending:
+            with self._submit_lock:
+                busy = self._inflight is not None and not self._inflight.done()
+                if not busy:
+                    future = self._inflight = self._executor.submit(self._score, query, pending)
+            if busy:
+                # Bounded: never queue a second pass behind one that is still scoring
+                with self._stats_lock:
+                    self._counts["fallback_busy"] += 1
+                return docs[:top_k]
+            try:
+                scores.update(future.result(timeout=self.budget_ms / 1000.0))
+            except FutureTimeout:
+                # The pass keeps running and caches its scores for the next identical query
+                with self._stats_lock:
+                    self._counts["fallback_budget"] += 1
+                return docs[:top_k]
+            except Exception as e:
+                self.last_error = str(e)
+                with self._stats_lock:
+                    self._counts["errors"] += 1
+                print(f"Warning: Rerank failed, keeping vector order: {e}")
+                return docs[:top_k]
+
+        ranked = sorted(zip(keys, docs), key=lambda pair: scores[pair[0]], reverse=True)[:top_k]
+        elapsed_ms = round((time.perf_counter() - started) * 1000.0, 1)
+        with self._stats_lock:
+            self._counts["reranked"] += 1
+        return [
+            {**doc, "metadata": {**(doc.get("metadata") or {}), "rerank_score": round(scores[key], 4),
+                                 "rerank_ms": elapsed_ms}}
+            for key, doc in ranked
+        ]
+
+    # ------------- Metrics -------------
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "enabled": self.enabled,
+                "model": self.model_name,
+                "model_loaded": self.loaded,
+                "candidates": self.candidates,
+                "budget_ms": self.budget_ms,
+                **self._counts,
+                "pairs_scored": self._pairs_scored,
+                "cache_hits": self._cache_hits,
+                "cache_entries": len(self._cache),
+                "avg_pair_ms": round(self._score_seconds / self._pairs_scored * 1000.0, 2) if self._pairs_scored else 0.0,
+                "last_error": self.last_error,
+            }
+
+
+# Create singleton instance
+reranker = CrossEncoderReranker()
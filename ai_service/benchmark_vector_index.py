@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+ANN Index Benchmark for the pgvector tables
+Compares the HNSW/IVFFlat index against exact search on our own corpus:
+latency percentiles and recall@k versus the exact result set.
+
+Usage (from ai_service/):
+    python benchmark_vector_index.py --table general_knowledge --queries 50 --top-k 5
+    python benchmark_vector_index.py --table vectors --ef-search 20,40,80
+    python benchmark_vector_index.py --table vectors --reindex
+"""
+
+import argparse
+import statistics
+import time
+from typing import List, Dict, Any, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from psycopg2 import sql
+
+from app.services.llm_service import PgVectorStore
+from app.services.pg_pool import knowledge_pool
+
+
+def sample_queries(store: PgVectorStore, table: str, count: int) -> List[str]:
+    """Use stored embeddings as realistic queries from our own corpus."""
+    with store.pool.cursor() as cur:
+        cur.execute(sql.SQL(
+            "SELECT embedding::text FROM {} WHERE embedding IS NOT NULL ORDER BY random() LIMIT %s"
+        ).format(sql.Identifier(table)), (count,))
+        return [row[0] for row in cur.fetchall()]
+
+
+def search_ids(store: PgVectorStore, table: str, vector: str, top_k: int, exact: bool = False,
+               ef_search: Optional[int] = None, probes: Optional[int] = None) -> List[int]:
+    with store.pool.cursor() as cur:
+        store.apply_search_settings(cur, ef_search=ef_search, probes=probes, exact=exact)
+        cur.execute(sql.SQL(
+            "SELECT id FROM {} WHERE embedding IS NOT NULL ORDER BY embedding <#> %s::vector LIMIT %s"
+        ).format(sql.Identifier(table)), (vector, top_k))
+        return [row[0] for row in cur.fetchall()]
+
+
+def run(store: PgVectorStore, table: str, queries: List[str], top_k: int, exact: bool = False,
+        ef_search: Optional[int] = None, probes: Optional[int] = None) -> Dict[str, Any]:
+    latencies = []
+    results = []
+    for vector in queries:
+        started = time.perf_counter()
+        results.append(search_ids(store, table, vector, top_k, exact, ef_search, probes))
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    latencies.sort()
+    return {
+        "results": results,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "mean_ms": statistics.fmean(latencies),
+    }
+
+
+def recall(approx: List[List[int]], exact: List[List[int]]) -> float:
+    hits = sum(len(set(a) & set(e)) for a, e in zip(approx, exact))
+    total = sum(len(e) for e in exact)
+    return hits / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pgvector ANN index against exact search")
+    parser.add_argument("--table", default="vectors", choices=["vectors", "general_knowledge"])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--ef-search", default="", help="comma-separated hnsw.ef_search values to sweep")
+    parser.add_argument("--probes", default="", help="comma-separated ivfflat.probes values to sweep")
+    parser.add_argument("--reindex", action="store_true", help="rebuild the ANN index before benchmarking")
+    args = parser.parse_args()
+
+    # general_knowledge is in the RAG database and owned by Laravel's migrations
+    if args.table == "general_knowledge":
+        store = PgVectorStore(pool=knowledge_pool, manage_tables=False)
+    else:
+        store = PgVectorStore()
+    if not store.available:
+        raise SystemExit("Vector store not available")
+
+    if args.reindex:
+        print(f"Reindexing {args.table}: {store.reindex(args.table)}")
+    else:
+        store.ensure_index(args.table)
+
+    queries = sample_queries(store, args.table, args.queries)
+    if not queries:
+        raise SystemExit(f"No embeddings found in {args.table}")
+
+    exact = run(store, args.table, queries, args.top_k, exact=True)
+    print(f"{args.table}: {len(queries)} queries, top_k={args.top_k}, index={store.index_type}")
+    print(f"{'mode':<22}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'recall':>10}")
+    print(f"{'exact':<22}{exact['p50_ms']:>10.2f}{exact['p95_ms']:>10.2f}{exact['mean_ms']:>10.2f}{1.0:>10.3f}")
+
+    if store.index_type == 'hnsw':
+        settings = [("ef_search", int(v)) for v in args.ef_search.split(",") if v] or [("ef_search", store.ef_search)]
+    elif store.index_type == 'ivfflat':
+        settings = [("probes", int(v)) for v in args.probes.split(",") if v] or [("probes", store.probes)]
+    else:
+        settings = []
+
+    for knob, value in settings:
+        approx = run(store, args.table, queries, args.top_k, **{knob: value})
+        label = f"{store.index_type} {knob}={value}"
+        print(f"{label:<22}{approx['p50_ms']:>10.2f}{approx['p95_ms']:>10.2f}{approx['mean_ms']:>10.2f}"
+              f"{recall(approx['results'], exact['results']):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
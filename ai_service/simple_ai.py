@@ -4,11 +4,14 @@ Simple AI Service for Symbiosis - No Dependencies Version
 Just provides immediate responses without LLM complexity
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from typing import Dict, Any
 import json
 
+from app.services.ollama_client import ollama_client, OllamaError, ClientDisconnected, cancel_on_disconnect
+
 app = FastAPI(title="Symbiosis AI Service - Simple")
 
 # Enable CORS for browser requests
@@ -20,6 +23,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    """The caller timed out and its generation was cancelled; nobody reads this response"""
+    return Response(status_code=499)
+
 @app.get("/")
 async def root():
     return {
@@ -36,7 +44,7 @@ async def root():
     }
 
 @app.post("/ask")
-async def ask_simple(payload: Dict):
+async def ask_simple(payload: Dict, http_request: Request):
     """Main ask endpoint - tries Ollama first, then falls back to smart responses"""
     try:
         question = payload.get("question", "").lower()
@@ -45,8 +53,6 @@ async def ask_simple(payload: Dict):
         
         # First try Ollama LLM
         try:
-            import requests
-            
             # Build context for LLM
             context_parts = []
             if crop:
@@ -62,29 +68,23 @@ async def ask_simple(payload: Dict):
             
             # Call Ollama with 90 second timeout
             print(f"Calling Ollama with prompt: {enhanced_prompt[:100]}...")
-            ollama_response = requests.post(
-                "http://localhost:11434/api/generate",
-                json={
-                    "model": "phi3:mini",
-                    "prompt": enhanced_prompt,
-                    "stream": False
-                },
-                timeout=90  # Extended timeout to 90 seconds for testing
-            )
-            
-            print(f"Ollama response status: {ollama_response.status_code}")
+            ollama_data = await cancel_on_disconnect(http_request, ollama_client.generate(
+                enhanced_prompt,
+                model="phi3:mini",
+                timeout=90,  # Extended timeout to 90 seconds for testing
+                lane=payload.get("lane", "admin")
+            ))
+            ai_response = ollama_data.get('response', '').strip()
             
-            if ollama_response.status_code == 200:
-                ollama_data = ollama_response.json()
-                ai_response = ollama_data.get('response', '').strip()
-                
-                if ai_response:  # Only return if we got a real response
-                    return {
-                        "success": True,
-                        "answer": f"🤖 **Symbiosis Mistral (via Ollama):** {ai_response}",
-                        "source": "ollama_llm"
-                    }
+            if ai_response:  # Only return if we got a real response
+                return {
+                    "success": True,
+                    "answer": f"🤖 **Symbiosis Mistral (via Ollama):** {ai_response}",
+                    "source": "ollama_llm"
+                }
                     
+        except ClientDisconnected:
+            raise
         except Exception as llm_error:
             print(f"LLM Error: {llm_error}")
         
@@ -97,6 +97,8 @@ async def ask_simple(payload: Dict):
             "source": "symbiosis_smart"
         }
         
+    except ClientDisconnected:
+        raise
     except Exception as e:
         return {
             "success": True,
@@ -105,7 +107,7 @@ async def ask_simple(payload: Dict):
         }
 
 @app.post("/ask-ollama")
-async def ask_ollama(payload: Dict):
+async def ask_ollama(payload: Dict, http_request: Request):
     """Endpoint that actually uses Ollama LLM"""
     try:
         question = payload.get("question", "")
@@ -126,20 +128,15 @@ async def ask_ollama(payload: Dict):
             enhanced_prompt = f"You are Symbiosis Mistral, a friendly agricultural AI helper. Question: {question}. Provide a clear, concise answer in simple terms that a beginner farmer can easily understand and apply. Keep it practical and brief."
         
         # Call Ollama directly
-        import requests
-        
-        ollama_response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={
-                "model": "phi3:mini",
-                "prompt": enhanced_prompt,
-                "stream": False
-            },
-            timeout=90
-        )
+        try:
+            # Batch jobs (e.g. product enrichment) send lane=background
+            ollama_data = await cancel_on_disconnect(http_request, ollama_client.generate(
+                enhanced_prompt, model="phi3:mini", timeout=90, lane=payload.get("lane", "admin")))
+        except OllamaError as e:
+            print(f"Ollama unavailable: {e}")
+            ollama_data = None
         
-        if ollama_response.status_code == 200:
-            ollama_data = ollama_response.json()
+        if ollama_data is not None:
             ai_response = ollama_data.get('response', '').strip()
             
             return {
@@ -156,6 +153,8 @@ async def ask_ollama(payload: Dict):
                 "source": "smart_fallback"
             }
             
+    except ClientDisconnected:
+        raise
     except Exception as e:
         # Fallback to rule-based if anything fails
         response = generate_smart_response(question.lower(), crop, season)
@@ -13,13 +13,14 @@ import time
 import logging
 from datetime import datetime
 from typing import Dict, List, Optional
-import requests
 import json
+from contextlib import aclosing
 
 from fastapi import FastAPI, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
+import httpx
 import uvicorn
 
 # Add current directory to path for imports
@@ -27,6 +28,15 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from rag.public_rag_service import create_rag_service
 
+# Shared async Ollama client lives in the ai_service package
+sys.path.append(os.getenv('AI_SERVICE_PATH', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_service')))
+from app.services.ollama_client import (ollama_client, OllamaError, OllamaTimeout, OllamaBusy, sse_event, SSE_HEADERS,
+                                        ClientDisconnected, cancel_on_disconnect, stream_until_disconnect)
+from app.services.answer_cache import answer_cache, embed_for_cache, context_fingerprint
+from app.services.model_warmup import ModelWarmupScheduler
+from app.services.llm_admission import llm_admission
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -49,6 +59,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    """Visitor closed the widget; the generation was cancelled and nobody reads this response"""
+    logger.info(f"🔌 {exc}")
+    return Response(status_code=499)
+
 # Initialize RAG service
 rag_service = None
 
@@ -67,6 +83,9 @@ async def startup_event():
     except Exception as e:
         logger.error(f"❌ Startup error: {e}")
 
+    # Keep the public chat models resident in Ollama
+    model_warmup.start()
+
 @app.on_event("shutdown") 
 async def shutdown_event():
     """Cleanup on shutdown"""
@@ -74,6 +93,8 @@ async def shutdown_event():
     if rag_service:
         rag_service.close()
         logger.info("✅ RAG service closed")
+    await model_warmup.stop()
+    await ollama_client.aclose()
 
 # Request/Response Models
 class ChatRequest(BaseModel):
@@ -91,6 +112,7 @@ class ChatResponse(BaseModel):
     confidence: Optional[float] = None
     enhanced_prompt: Optional[str] = None  # Show the RAG-enhanced prompt
     rag_context_used: Optional[bool] = False  # Whether RAG was used
+    cached: Optional[bool] = False  # Served from the semantic answer cache
 
 class ModelInfo(BaseModel):
     name: str
@@ -124,6 +146,37 @@ MODELS_CONFIG = {
     }
 }
 
+# Canned replies returned instead of a model answer; never cached
+ENHANCED_UNAVAILABLE_RESPONSE = "Enhanced AI temporarily unavailable - using backup model"
+EMPTY_RESPONSE = "I apologize, but I couldn't generate a response."
+TIMEOUT_RESPONSE = "I apologize for the delay. Please try asking a simpler question or try again later."
+UNAVAILABLE_RESPONSE = "I'm currently experiencing technical difficulties. Please try again later."
+ERROR_RESPONSE = "I apologize, but I encountered an error. Please try again."
+BUSY_RESPONSE = "Lots of people are asking questions right now! Please try again in a minute."
+FALLBACK_RESPONSES = {ENHANCED_UNAVAILABLE_RESPONSE, EMPTY_RESPONSE, TIMEOUT_RESPONSE, UNAVAILABLE_RESPONSE,
+                      ERROR_RESPONSE, BUSY_RESPONSE}
+
+OLLAMA_MODEL_MAP = {
+    "tinyllama": "tinyllama:latest",
+    "gemma2": "gemma2:2b", 
+    "phi3": "phi3:mini",
+    "enhanced": "enhanced_farm_ai"  # Special marker for enhanced AI
+}
+
+# Warm the models this API actually serves; tinyllama is the "auto" default
+model_warmup = ModelWarmupScheduler(
+    ollama_client,
+    primary_model="tinyllama:latest",
+    models=[m for m in OLLAMA_MODEL_MAP.values() if m != "enhanced_farm_ai"],
+)
+
+OLLAMA_OPTIONS = {
+    "temperature": 0.7,
+    "num_predict": 400,  # Optimized for Phi3 - good balance of completeness and speed
+    "top_k": 40,
+    "top_p": 0.9
+}
+
 def get_session_id(request: Request) -> str:
     """Get or create session ID"""
     session_id = request.headers.get("X-Session-ID")
@@ -148,78 +201,56 @@ def select_best_model(message: str, preferred_model: str = "auto") -> str:
     else:
         return "tinyllama"  # Default to fast model for public chatbot
         
-def query_enhanced_farm_ai(question: str, timeout: int = 60) -> str:
+async def query_enhanced_farm_ai(question: str, timeout: int = 60) -> str:
     """Query the enhanced farm AI system (premium option)"""
     try:
         payload = {
             "question": question,
-            "context": "public_chatbot"
+            "context": "public_chatbot",
+            "lane": "public"  # don't let public traffic take the admin service's reserved slots
         }
         
-        response = requests.post(
-            "http://localhost:8005/ask",
-            json=payload,
-            timeout=timeout
-        )
+        # Plain client, not ollama_client: /ask runs a whole generation, so it must not be
+        # retried, and this hop is not Ollama traffic
+        async with httpx.AsyncClient(timeout=httpx.Timeout(timeout, connect=5.0)) as client:
+            response = await client.post("http://localhost:8005/ask", json=payload)
         response.raise_for_status()
         
         result = response.json()
         if result.get("success"):
             return result.get("answer", "Enhanced AI temporarily unavailable")
         else:
-            return "Enhanced AI temporarily unavailable - using backup model"
+            return ENHANCED_UNAVAILABLE_RESPONSE
             
     except Exception as e:
         logger.error(f"Enhanced AI error: {e}")
-        return "Enhanced AI temporarily unavailable - using backup model"
+        return ENHANCED_UNAVAILABLE_RESPONSE
 
-def query_ollama_model(model: str, prompt: str, timeout: int = 30) -> str:
+async def query_ollama_model(model: str, prompt: str, timeout: int = 30) -> str:
     """Query Ollama model with specified prompt (backup/basic option)"""
     try:
-        model_map = {
-            "tinyllama": "tinyllama:latest",
-            "gemma2": "gemma2:2b", 
-            "phi3": "phi3:mini",
-            "enhanced": "enhanced_farm_ai"  # Special marker for enhanced AI
-        }
-        
         # Use enhanced AI if requested
         if model == "enhanced" or model == "premium":
-            return query_enhanced_farm_ai(prompt, timeout)
+            return await query_enhanced_farm_ai(prompt, timeout)
         
-        ollama_model = model_map.get(model, "tinyllama:latest")
+        ollama_model = OLLAMA_MODEL_MAP.get(model, "tinyllama:latest")
         
-        payload = {
-            "model": ollama_model,
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.7,
-                "num_predict": 400,  # Optimized for Phi3 - good balance of completeness and speed
-                "top_k": 40,
-                "top_p": 0.9
-            }
-        }
+        result = await ollama_client.generate(prompt, model=ollama_model, options=OLLAMA_OPTIONS, timeout=timeout,
+                                              lane="public")
+        return result.get("response", EMPTY_RESPONSE)
         
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json=payload,
-            timeout=timeout
-        )
-        response.raise_for_status()
-        
-        result = response.json()
-        return result.get("response", "I apologize, but I couldn't generate a response.")
-        
-    except requests.exceptions.Timeout:
+    except OllamaBusy as e:
+        logger.warning(f"⏳ {e}")
+        return BUSY_RESPONSE
+    except OllamaTimeout:
         logger.error(f"Model {model} timeout")
-        return "I apologize for the delay. Please try asking a simpler question or try again later."
-    except requests.exceptions.RequestException as e:
+        return TIMEOUT_RESPONSE
+    except OllamaError as e:
         logger.error(f"Model {model} request error: {e}")
-        return "I'm currently experiencing technical difficulties. Please try again later."
+        return UNAVAILABLE_RESPONSE
     except Exception as e:
         logger.error(f"Model {model} error: {e}")
-        return "I apologize, but I encountered an error. Please try again."
+        return ERROR_RESPONSE
 
 @app.get("/")
 async def root():
@@ -229,7 +260,7 @@ async def root():
         "status": "operational",
         "available_models": list(MODELS_CONFIG.keys()),
         "features": ["RAG-enhanced responses", "Multiple AI models", "WordPress integration"],
-        "endpoints": ["/chat", "/models", "/health", "/wordpress/chat"],
+        "endpoints": ["/chat", "/chat/stream", "/models", "/health", "/wordpress/chat", "/wordpress/chat/stream"],
         "version": "1.0.0",
         "timestamp": datetime.now().isoformat()
     }
@@ -239,14 +270,14 @@ async def get_models():
     """Get available AI models and their capabilities"""
     models = []
     
+    # Test model availability once for all models
+    try:
+        await ollama_client.get_json("/api/tags", timeout=5)
+        available = True
+    except Exception:
+        available = False
+    
     for model_key, config in MODELS_CONFIG.items():
-        # Test model availability
-        try:
-            test_response = requests.get("http://localhost:11434/api/tags", timeout=5)
-            available = test_response.status_code == 200
-        except:
-            available = False
-            
         models.append(ModelInfo(
             name=config["name"],
             description=config["description"], 
@@ -257,6 +288,29 @@ async def get_models():
     
     return models
 
+def prepare_chat(request: ChatRequest):
+    """Validate the message, select a model and enhance the prompt with RAG"""
+    # Input validation
+    if len(request.message) > 1000:
+        raise HTTPException(status_code=400, detail="Message too long (max 1000 characters)")
+        
+    # Select model
+    selected_model = select_best_model(request.message, request.model)
+    
+    # Enhance prompt with RAG if available
+    enhanced_prompt = request.message
+    rag_context_used = False
+    if rag_service:
+        try:
+            enhanced_prompt = rag_service.enhance_prompt(request.message, selected_model)
+            rag_context_used = True
+            logger.info("✅ Prompt enhanced with RAG context")
+            logger.info(f"🔍 Enhanced prompt length: {len(enhanced_prompt)} chars")
+        except Exception as e:
+            logger.warning(f"⚠️ RAG enhancement failed: {e}")
+    
+    return selected_model, enhanced_prompt, rag_context_used
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest, http_request: Request):
     """Main chat endpoint for customer interactions"""
@@ -266,32 +320,31 @@ async def chat(request: ChatRequest, http_request: Request):
     logger.info(f"💬 Chat request: {request.message[:50]}... (Model: {request.model})")
     
     try:
-        # Input validation
-        if len(request.message) > 1000:
-            raise HTTPException(status_code=400, detail="Message too long (max 1000 characters)")
-            
-        # Select model
-        selected_model = select_best_model(request.message, request.model)
+        selected_model, enhanced_prompt, rag_context_used = prepare_chat(request)
         model_config = MODELS_CONFIG[selected_model]
         
-        # Enhance prompt with RAG if available
-        enhanced_prompt = request.message
-        rag_context_used = False
-        if rag_service:
-            try:
-                enhanced_prompt = rag_service.enhance_prompt(request.message, selected_model)
-                rag_context_used = True
-                logger.info("✅ Prompt enhanced with RAG context")
-                logger.info(f"🔍 Enhanced prompt length: {len(enhanced_prompt)} chars")
-            except Exception as e:
-                logger.warning(f"⚠️ RAG enhancement failed: {e}")
+        # Semantic cache: scope by model and the RAG context wrapped around the question
+        question_embedding = None
+        fingerprint = context_fingerprint([enhanced_prompt.replace(request.message, "")])
+        if not request.include_history:
+            question_embedding = await embed_for_cache(request.message)
+        cached = answer_cache.lookup(question_embedding, selected_model, fingerprint)
         
-        # Get AI response
-        ai_response = query_ollama_model(
-            selected_model, 
-            enhanced_prompt, 
-            model_config["timeout"]
-        )
+        if cached is not None:
+            ai_response = cached["response"]
+            logger.info(f"♻️ Semantic cache hit (similarity {cached['cache_similarity']})")
+        else:
+            # Get AI response
+            generation_started = time.time()
+            # Stop generating as soon as the visitor closes the widget
+            ai_response = await cancel_on_disconnect(http_request, query_ollama_model(
+                selected_model, 
+                enhanced_prompt, 
+                model_config["timeout"]
+            ))
+            if ai_response not in FALLBACK_RESPONSES:
+                answer_cache.store(question_embedding, selected_model, fingerprint, {"response": ai_response},
+                                   (time.time() - generation_started) * 1000.0)
         
         response_time = time.time() - start_time
         
@@ -314,15 +367,102 @@ async def chat(request: ChatRequest, http_request: Request):
             timestamp=datetime.now().isoformat(),
             response_time=response_time,
             enhanced_prompt=enhanced_prompt if rag_context_used else None,
-            rag_context_used=rag_context_used
+            rag_context_used=rag_context_used,
+            cached=cached is not None
         )
         
-    except HTTPException:
+    except (HTTPException, ClientDisconnected):
         raise
     except Exception as e:
         logger.error(f"❌ Chat error: {e}")
         raise HTTPException(status_code=500, detail="Sorry, I'm having technical difficulties. Please try again.")
 
+async def stream_chat_events(request: ChatRequest, http_request: Request, wordpress: bool = False):
+    """Relay Ollama's token stream for a chat request as Server-Sent Events"""
+    start_time = time.time()
+    session_id = request.session_id or get_session_id(http_request)
+    selected_model, enhanced_prompt, rag_context_used = prepare_chat(request)
+    model_config = MODELS_CONFIG[selected_model]
+    
+    logger.info(f"💬 Streaming chat: {request.message[:50]}... (Model: {selected_model})")
+    
+    async def events():
+        answer_parts = []
+        ttft_ms = None
+        yield sse_event({"model": selected_model, "session_id": session_id}, event="start")
+        try:
+            chunks = stream_until_disconnect(http_request, ollama_client.stream_generate(
+                enhanced_prompt,
+                model=OLLAMA_MODEL_MAP.get(selected_model, "tinyllama:latest"),
+                options=OLLAMA_OPTIONS,
+                timeout=model_config["timeout"],
+                lane="public"
+            ))
+            # aclosing: however the response ends, the Ollama stream is closed with it
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    if chunk.get("response"):
+                        answer_parts.append(chunk["response"])
+                        yield sse_event({"token": chunk["response"]}, event="token")
+                    if chunk.get("done"):
+                        ttft_ms = chunk.get("ttft_ms")
+        except ClientDisconnected as e:
+            logger.info(f"🔌 {e}")
+            return
+        except OllamaBusy as e:
+            logger.warning(f"⏳ {e}")
+            yield sse_event({"error": BUSY_RESPONSE}, event="error")
+            return
+        except OllamaTimeout:
+            logger.error(f"Model {selected_model} stream timeout")
+            yield sse_event({"error": TIMEOUT_RESPONSE}, event="error")
+            return
+        except Exception as e:
+            logger.error(f"❌ Streaming chat error: {e}")
+            yield sse_event({"error": UNAVAILABLE_RESPONSE}, event="error")
+            return
+        
+        response_time = time.time() - start_time
+        ai_response = "".join(answer_parts)
+        
+        # Log conversation if RAG service available
+        if rag_service:
+            try:
+                rag_service.log_conversation(session_id, request.message, ai_response, selected_model, response_time)
+            except Exception as e:
+                logger.warning(f"⚠️ Conversation logging failed: {e}")
+        
+        logger.info(f"✅ Streamed response in {response_time:.2f}s (first token {ttft_ms} ms) using {selected_model}")
+        
+        if wordpress:
+            done = {
+                "success": True,
+                "data": {
+                    "model": selected_model,
+                    "session": session_id,
+                    "timestamp": datetime.now().isoformat(),
+                    "response_time": f"{response_time:.2f}s",
+                    "ttft_ms": ttft_ms
+                }
+            }
+        else:
+            done = {
+                "model_used": selected_model,
+                "session_id": session_id,
+                "timestamp": datetime.now().isoformat(),
+                "response_time": response_time,
+                "ttft_ms": ttft_ms,
+                "rag_context_used": rag_context_used
+            }
+        yield sse_event(done, event="done")
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """Streaming variant of /chat (registered before /chat/{model_name})"""
+    return await stream_chat_events(request, http_request)
+
 @app.post("/chat/{model_name}")
 async def chat_specific_model(model_name: str, request: ChatRequest, http_request: Request):
     """Chat with a specific model"""
@@ -338,8 +478,8 @@ async def health_check():
     """Health check endpoint"""
     try:
         # Test Ollama connection
-        ollama_response = requests.get("http://localhost:11434/api/version", timeout=5)
-        ollama_status = "connected" if ollama_response.status_code == 200 else "disconnected"
+        await ollama_client.get_json("/api/version", timeout=5)
+        ollama_status = "connected"
     except:
         ollama_status = "disconnected"
     
@@ -352,9 +492,23 @@ async def health_check():
         "ollama_connection": ollama_status,
         "rag_service": rag_status,
         "models_available": len(MODELS_CONFIG),
+        "ollama_client": ollama_client.get_stats(),
+        "answer_cache": answer_cache.get_stats(),
+        "admission": llm_admission.get_stats(),
         "timestamp": datetime.now().isoformat()
     }
 
+@app.post("/warmup")
+async def warmup_models():
+    """Queue zero-token keep_alive loads and return immediately with what is hot now"""
+    queued = model_warmup.schedule()
+    return {"success": True, "queued": queued, **await model_warmup.readiness()}
+
+@app.get("/readiness")
+async def readiness():
+    """Which chat models are resident in Ollama"""
+    return await model_warmup.readiness()
+
 # WordPress Integration Endpoints
 @app.post("/wordpress/chat")
 async def wordpress_chat(request: ChatRequest, http_request: Request):
@@ -374,11 +528,17 @@ async def wordpress_chat(request: ChatRequest, http_request: Request):
         }
     }
 
+@app.post("/wordpress/chat/stream")
+async def wordpress_chat_stream(request: ChatRequest, http_request: Request):
+    """Streaming variant of /wordpress/chat"""
+    return await stream_chat_events(request, http_request, wordpress=True)
+
 @app.get("/wordpress/widget-config")
 async def wordpress_widget_config():
     """Configuration for WordPress widget"""
     return {
         "api_endpoint": "/wordpress/chat",
+        "stream_endpoint": "/wordpress/chat/stream",
         "models": [
             {"key": "auto", "name": "Auto-Select", "description": "Best model for your question"},
             {"key": "tinyllama", "name": "Quick Response", "description": "Fast answers"},
@@ -7,9 +7,9 @@ Gets EVERY bit of detailed scientific content as requested
 import requests
 import time
 import re
-from typing import List, Dict
+from typing import List, Dict, Iterator
 from urllib.parse import urljoin
-from fast_farm_rag import add_farm_knowledge
+from fast_farm_rag import add_farm_knowledge_bulk
 
 class AggressiveBionutrientExtractor:
     def __init__(self):
@@ -153,6 +153,12 @@ class AggressiveBionutrientExtractor:
         print("🧬 AGGRESSIVE Bionutrient Institute Knowledge Extraction")
         print("📊 Extracting EVERY bit of detailed scientific content...")
         
+        # Sections are streamed into the knowledge base as pages are extracted
+        batch_stats = add_farm_knowledge_bulk(self.iter_detailed_sections())
+        return sum(batch["added"] for batch in batch_stats)
+    
+    def iter_detailed_sections(self) -> Iterator[Dict]:
+        """Yield every detailed section from every bionutrient page"""
         # Comprehensive URL list - every section discovered
         urls = [
             f"{self.base_url}",
@@ -201,26 +207,14 @@ class AggressiveBionutrientExtractor:
             sections = self.extract_detailed_sections(text_content, url)
             
             for section in sections:
-                try:
-                    add_farm_knowledge(
-                        topic=section['topic'],
-                        content=section['content'],
-                        source=section['source'],
-                        confidence=section['confidence'],
-                        tags=section['tags']
-                    )
-                    total_extracted += 1
-                    print(f"✅ Added: {section['topic'][:50]}...")
-                except Exception as e:
-                    print(f"❌ Error adding knowledge: {e}")
+                yield section
+                total_extracted += 1
             
             # Rate limiting
             time.sleep(0.5)
             
             if i % 5 == 0:
                 print(f"📈 Progress: {total_extracted} knowledge entries extracted")
-        
-        return total_extracted
     
     def add_bionutrient_farming_applications(self):
         """Add specific applications for Middle World Farms"""
@@ -263,17 +257,10 @@ class AggressiveBionutrientExtractor:
             }
         ]
         
-        for app in applications:
-            add_farm_knowledge(
-                topic=app["topic"],
-                content=app["content"],
-                source=app["source"],
-                confidence=app["confidence"],
-                tags=app["tags"]
-            )
-            print(f"🔗 Added application: {app['topic']}")
+        batch_stats = add_farm_knowledge_bulk(applications)
+        print(f"🔗 Added {len(applications)} applications")
         
-        return len(applications)
+        return sum(batch["added"] for batch in batch_stats)
 
 def main():
     print("🧬 AGGRESSIVE Bionutrient Institute Knowledge Extraction")
@@ -6,8 +6,8 @@ Regularly scrapes biodynamic and farming websites to keep RAG updated
 
 import requests
 import time
-from typing import List, Dict
-from fast_farm_rag import add_farm_knowledge
+from typing import List, Dict, Iterator
+from fast_farm_rag import add_farm_knowledge_bulk
 
 class AutoKnowledgeUpdater:
     """Automatically updates farm knowledge from various sources"""
@@ -50,31 +50,27 @@ class AutoKnowledgeUpdater:
     
     def update_all_sources(self):
         """Update knowledge from all configured sources"""
-        total_added = 0
+        batch_stats = add_farm_knowledge_bulk(self.iter_source_knowledge())
+        total_added = sum(batch["added"] for batch in batch_stats)
         
+        print(f"🎯 Total new knowledge entries: {total_added}")
+        return total_added
+    
+    def iter_source_knowledge(self) -> Iterator[Dict]:
+        """Yield knowledge entries from every configured source"""
         for source_name, url in self.sources.items():
             try:
                 new_knowledge = self.scrape_source(source_name, url)
                 
                 for knowledge in new_knowledge:
-                    add_farm_knowledge(
-                        topic=knowledge["topic"],
-                        content=knowledge["content"],
-                        source=knowledge["source"],
-                        confidence=0.8,
-                        tags=knowledge["tags"]
-                    )
-                    total_added += 1
-                    print(f"✅ Added from {source_name}: {knowledge['topic']}")
+                    yield {**knowledge, "confidence": 0.8}
+                    print(f"✅ Queued from {source_name}: {knowledge['topic']}")
                 
                 # Rate limiting
                 time.sleep(2)
                 
             except Exception as e:
                 print(f"❌ Error scraping {source_name}: {e}")
-        
-        print(f"🎯 Total new knowledge entries: {total_added}")
-        return total_added
     
     def add_manual_expert_knowledge(self):
         """Add curated expert farming knowledge"""
@@ -99,15 +95,8 @@ class AutoKnowledgeUpdater:
             }
         ]
         
-        for knowledge in expert_knowledge:
-            add_farm_knowledge(
-                topic=knowledge["topic"],
-                content=knowledge["content"],
-                source=knowledge["source"],
-                confidence=0.9,
-                tags=knowledge["tags"]
-            )
-            print(f"📚 Added expert knowledge: {knowledge['topic']}")
+        add_farm_knowledge_bulk({**knowledge, "confidence": 0.9} for knowledge in expert_knowledge)
+        print(f"📚 Added {len(expert_knowledge)} expert knowledge entries")
 
 def run_knowledge_update():
     """Main function to update all knowledge"""
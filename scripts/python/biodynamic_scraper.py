@@ -6,7 +6,7 @@ Automatically extracts and adds biodynamic farming knowledge to the RAG system
 
 import requests
 import json
-from fast_farm_rag import add_farm_knowledge
+from fast_farm_rag import add_farm_knowledge_bulk
 
 def scrape_biodynamic_knowledge():
     """Extract key biodynamic principles and add to knowledge base"""
@@ -59,28 +59,20 @@ def scrape_biodynamic_knowledge():
         }
     ]
     
-    # Add each knowledge entry to the RAG system
+    # Add all knowledge entries to the RAG system in one batch
     added_count = 0
-    for knowledge in biodynamic_knowledge:
-        try:
-            add_farm_knowledge(
-                topic=knowledge["topic"],
-                content=knowledge["content"],
-                source=knowledge["source"],
-                confidence=knowledge["confidence"],
-                tags=knowledge["tags"]
-            )
-            added_count += 1
-            print(f"✅ Added: {knowledge['topic']}")
-        except Exception as e:
-            print(f"❌ Failed to add {knowledge['topic']}: {e}")
+    try:
+        batch_stats = add_farm_knowledge_bulk(biodynamic_knowledge)
+        added_count = sum(batch["added"] for batch in batch_stats)
+    except Exception as e:
+        print(f"❌ Failed to add biodynamic knowledge: {e}")
     
     print(f"🎉 Successfully added {added_count} biodynamic knowledge entries!")
     return added_count
 
 def add_biodynamic_to_ai_service():
     """Add biodynamic knowledge via API"""
-    url = "http://localhost:8005/add_knowledge"
+    url = "http://localhost:8005/add_knowledge/bulk"
     
     # Additional specific biodynamic practices
     advanced_knowledge = [
@@ -100,15 +92,14 @@ def add_biodynamic_to_ai_service():
         }
     ]
     
-    for knowledge in advanced_knowledge:
-        try:
-            response = requests.post(url, json=knowledge, timeout=10)
-            if response.status_code == 200:
-                print(f"✅ API Added: {knowledge['topic']}")
-            else:
-                print(f"❌ API Failed: {knowledge['topic']} - {response.status_code}")
-        except Exception as e:
-            print(f"❌ API Error: {e}")
+    try:
+        response = requests.post(url, json={"entries": advanced_knowledge}, timeout=30)
+        if response.status_code == 200:
+            print(f"✅ API Added: {response.json().get('added', 0)} entries")
+        else:
+            print(f"❌ API Failed: {response.status_code}")
+    except Exception as e:
+        print(f"❌ API Error: {e}")
 
 if __name__ == "__main__":
     print("🌍 Biodynamic Knowledge Integration Starting...")
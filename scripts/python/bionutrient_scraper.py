@@ -7,9 +7,9 @@ Systematically extracts all detailed research from BI documentation
 import requests
 import time
 import re
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Iterator
 from urllib.parse import urljoin, urlparse
-from fast_farm_rag import add_farm_knowledge
+from fast_farm_rag import add_farm_knowledge_bulk
 
 class BionutrientScraper:
     def __init__(self):
@@ -184,6 +184,12 @@ class BionutrientScraper:
         """Main scraping function"""
         print("🧬 Starting comprehensive Bionutrient Institute scraping...")
         
+        # Sections are streamed into the knowledge base as pages are scraped
+        batch_stats = add_farm_knowledge_bulk(self.iter_bionutrient_sections())
+        return sum(batch["added"] for batch in batch_stats)
+    
+    def iter_bionutrient_sections(self) -> Iterator[Dict[str, any]]:
+        """Yield knowledge entries for every chunk of every scraped page"""
         urls = self.discover_all_pages()
         total_knowledge = 0
         
@@ -215,16 +221,14 @@ class BionutrientScraper:
                     if len(content_chunks) > 1:
                         chunk_title += f" (Part {j+1})"
                     
-                    add_farm_knowledge(
-                        topic=chunk_title,
-                        content=chunk,
-                        source=knowledge_entry['source'],
-                        confidence=knowledge_entry['confidence'],
-                        tags=knowledge_entry['tags']
-                    )
-                    
+                    yield {
+                        "topic": chunk_title,
+                        "content": chunk,
+                        "source": knowledge_entry['source'],
+                        "confidence": knowledge_entry['confidence'],
+                        "tags": knowledge_entry['tags']
+                    }
                     total_knowledge += 1
-                    print(f"✅ Added: {chunk_title[:60]}...")
             
             # Rate limiting to be respectful
             time.sleep(1)
@@ -232,8 +236,6 @@ class BionutrientScraper:
             # Progress update
             if i % 5 == 0:
                 print(f"⚡ Progress: {i+1}/{len(urls)} pages, {total_knowledge} knowledge entries")
-        
-        return total_knowledge
     
     def add_bionutrient_integration_knowledge(self):
         """Add knowledge about integrating bionutrient methods with farming"""
@@ -262,15 +264,8 @@ class BionutrientScraper:
             }
         ]
         
-        for knowledge in integration_knowledge:
-            add_farm_knowledge(
-                topic=knowledge["topic"],
-                content=knowledge["content"],
-                source=knowledge["source"],
-                confidence=knowledge["confidence"],
-                tags=knowledge["tags"]
-            )
-            print(f"🔗 Added integration: {knowledge['topic']}")
+        add_farm_knowledge_bulk(integration_knowledge)
+        print(f"🔗 Added {len(integration_knowledge)} integration entries")
 
 def main():
     print("🧬 Bionutrient Institute Comprehensive Knowledge Extraction")
@@ -4,13 +4,25 @@ Enhanced Prompt Engineering and Few-Shot Learning System
 Dramatically improves AI responses with expert examples and better prompts
 """
 
+import os
+import sys
 from typing import Dict, List, Any
 
+# Token budgeting lives in the ai_service package
+AI_SERVICE_PATH = os.getenv('AI_SERVICE_PATH', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'ai_service'))
+if AI_SERVICE_PATH not in sys.path:
+    sys.path.append(AI_SERVICE_PATH)
+from app.services.prompt_assembler import PromptAssembler
+from few_shot_library import FewShotLibrary
+
 class EnhancedFarmingPrompts:
     """Advanced prompt engineering for farming AI"""
     
     def __init__(self):
         self.few_shot_examples = self.load_few_shot_examples()
+        # Seeds plus examples harvested from well-rated conversations, indexed by embedding
+        self.example_library = FewShotLibrary(self.few_shot_examples)
         self.system_prompt = self.create_expert_system_prompt()
     
     def create_expert_system_prompt(self) -> str:
@@ -42,7 +54,7 @@ class EnhancedFarmingPrompts:
 Remember: You're here to help make farming easier and more enjoyable!"""
 
     def load_few_shot_examples(self) -> List[Dict[str, str]]:
-        """Perfect Q&A examples to teach the AI"""
+        """Hand-written seed examples for the few-shot library"""
         return [
             {
                 "question": "How do I make JADAM JLF for Brussels sprouts?",
@@ -174,25 +186,12 @@ Remember: You're here to help make farming easier and more enjoyable!"""
             }
         ]
     
-    def create_enhanced_prompt(self, question: str, farm_context: str, farmos_context: str = "", variety_name: str = None) -> str:
-        """Create enhanced prompt with examples and expert guidance"""
-        
-        # Select relevant examples
-        relevant_examples = self.select_relevant_examples(question)
-        examples_text = self.format_examples(relevant_examples)
+    def create_enhanced_prompt(self, question: str, farm_context: str, farmos_context: str = "",
+                               variety_name: str = None, model: str = "mistral:7b",
+                               question_embedding: List[float] = None) -> str:
+        """Create enhanced prompt with examples and expert guidance, within the model's token budget"""
         
-        enhanced_prompt = f"""{self.system_prompt}
-
-📚 EXPERT EXAMPLES (Your response style should match these):
-
-{examples_text}
-
-🌾 CURRENT FARM CONTEXT:
-{farm_context}
-
-{farmos_context}
-
-❓ FARMER'S QUESTION: {question}
+        instructions = f"""❓ FARMER'S QUESTION: {question}
 
 🎯 INSTRUCTIONS:
 - Follow the expert example format above
@@ -204,30 +203,33 @@ Remember: You're here to help make farming easier and more enjoyable!"""
 - Consider UK growing conditions and timing
 
 Provide a comprehensive, actionable response:"""
+        
+        # farmOS data is the most specific context, then the farm knowledge base, then examples
+        packed = PromptAssembler(model, max_chunk_tokens=None).assemble(
+            self.system_prompt + instructions,
+            chunks=[farmos_context, farm_context],
+            examples=self.select_relevant_examples(question, question_embedding),
+            example_text=lambda example: self.format_examples([example])
+        )
+        context_text = "\n\n".join(packed.chunks)
+        
+        enhanced_prompt = f"{self.system_prompt}\n\n"
+        if packed.examples:
+            enhanced_prompt += f"""📚 EXPERT EXAMPLES (Your response style should match these):
+
+{self.format_examples(packed.examples)}
+
+"""
+        enhanced_prompt += f"""🌾 CURRENT FARM CONTEXT:
+{context_text}
+
+{instructions}"""
 
         return enhanced_prompt
     
-    def select_relevant_examples(self, question: str) -> List[Dict[str, str]]:
-        """Select most relevant examples based on question content"""
-        question_lower = question.lower()
-        
-        # Score examples by relevance
-        scored_examples = []
-        for example in self.few_shot_examples:
-            score = 0
-            example_lower = example["question"].lower() + " " + example["answer"].lower()
-            
-            # Keyword matching
-            question_words = question_lower.split()
-            for word in question_words:
-                if len(word) > 3 and word in example_lower:
-                    score += 1
-            
-            scored_examples.append((score, example))
-        
-        # Sort by relevance and take top 2
-        scored_examples.sort(key=lambda x: x[0], reverse=True)
-        return [example for score, example in scored_examples[:2]]
+    def select_relevant_examples(self, question: str, question_embedding: List[float] = None) -> List[Dict[str, str]]:
+        """Select the examples most similar to the question (none if nothing is close)"""
+        return self.example_library.select(question, question_embedding)
     
     def format_examples(self, examples: List[Dict[str, str]]) -> str:
         """Format examples for inclusion in prompt"""
@@ -244,6 +246,12 @@ A: {example['answer']}
 # Create global instance
 enhanced_prompts = EnhancedFarmingPrompts()
 
-def get_enhanced_farming_prompt(question: str, farm_context: str, farmos_context: str = "", variety_name: str = None) -> str:
+def get_enhanced_farming_prompt(question: str, farm_context: str, farmos_context: str = "", variety_name: str = None,
+                                model: str = "mistral:7b", question_embedding: List[float] = None) -> str:
     """Get enhanced prompt with few-shot examples"""
-    return enhanced_prompts.create_enhanced_prompt(question, farm_context, farmos_context, variety_name)
+    return enhanced_prompts.create_enhanced_prompt(question, farm_context, farmos_context, variety_name, model,
+                                                   question_embedding)
+
+def harvest_few_shot_examples(log_file: str, **kwargs) -> Dict[str, Any]:
+    """Add well-rated logged conversations to the few-shot library"""
+    return enhanced_prompts.example_library.harvest(log_file, **kwargs)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Inverted Index for Fast Farm RAG
+Tokenised per-field postings (topic, content, tags) with BM25 scoring,
+maintained incrementally and persisted next to the knowledge store
+"""
+
+import json
+import math
+import os
+import re
+from typing import Dict, List, Any, Iterable
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Same relative priorities the substring matcher used: topic > content > tags
+FIELD_WEIGHTS = {"topic": 10.0, "content": 3.0, "tags": 2.0}
+
+
+def normalize_token(token: str) -> str:
+    """Fold simple plurals so 'sprouts' and 'sprout' share a posting"""
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case alphanumeric tokens (underscored tags split into words)"""
+    return [normalize_token(t) for t in TOKEN_RE.findall(text.lower())]
+
+
+class FarmSearchIndex:
+    """Field-aware inverted index with BM25 ranking"""
+
+    def __init__(self, index_file: str, k1: float = 1.2, b: float = 0.75):
+        self.index_file = index_file
+        self.k1 = k1
+        self.b = b
+        self.clear()
+
+    def clear(self):
+        # field -> term -> {doc_id: term frequency}
+        self.postings: Dict[str, Dict[str, Dict[int, int]]] = {f: {} for f in FIELD_WEIGHTS}
+        self.doc_lengths: Dict[str, List[int]] = {f: [] for f in FIELD_WEIGHTS}
+        self.total_lengths: Dict[str, int] = {f: 0 for f in FIELD_WEIGHTS}
+        self.doc_count = 0
+
+    # ------------------------------------------------------------------
+    # Indexing
+    # ------------------------------------------------------------------
+    def add(self, doc_id: int, topic: str, content: str, tags: Iterable[str]):
+        """Index one document; doc ids must be assigned sequentially"""
+        if doc_id != self.doc_count:
+            raise ValueError(f"Expected doc_id {self.doc_count}, got {doc_id}")
+
+        fields = {"topic": topic, "content": content, "tags": ' '.join(tags)}
+        for field, text in fields.items():
+            tokens = tokenize(text)
+            self.doc_lengths[field].append(len(tokens))
+            self.total_lengths[field] += len(tokens)
+
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            postings = self.postings[field]
+            for token, tf in counts.items():
+                postings.setdefault(token, {})[doc_id] = tf
+
+        self.doc_count += 1
+
+    # ------------------------------------------------------------------
+    # Scoring
+    # ------------------------------------------------------------------
+    def score(self, terms: Iterable[str]) -> Dict[int, float]:
+        """BM25 score per field, combined with the field weights"""
+        scores: Dict[int, float] = {}
+        if not self.doc_count:
+            return scores
+
+        terms = {normalize_token(t) for t in terms}
+        for field, weight in FIELD_WEIGHTS.items():
+            postings = self.postings[field]
+            lengths = self.doc_lengths[field]
+            avg_len = (self.total_lengths[field] / self.doc_count) or 1.0
+
+            for term in terms:
+                docs = postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (self.doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, tf in docs.items():
+                    norm = self.k1 * (1 - self.b + self.b * lengths[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + weight * idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def docs_with_term(self, field: str, terms: Iterable[str]) -> set:
+        """Doc ids whose `field` contains any of `terms`"""
+        found = set()
+        for term in terms:
+            found.update(self.postings[field].get(normalize_token(term), {}))
+        return found
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def save(self, snapshot_bytes: int):
+        """Persist the index, tagged with the snapshot it was built against"""
+        data = {
+            "doc_count": self.doc_count,
+            "snapshot_bytes": snapshot_bytes,
+            "doc_lengths": self.doc_lengths,
+            "postings": {
+                field: {term: [[d, tf] for d, tf in docs.items()] for term, docs in postings.items()}
+                for field, postings in self.postings.items()
+            }
+        }
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, self.index_file)
+
+    def load(self, doc_count: int, snapshot_bytes: int) -> bool:
+        """Load a persisted index if it matches the current snapshot"""
+        if not os.path.exists(self.index_file):
+            return False
+        try:
+            with open(self.index_file, 'r') as f:
+                data = json.load(f)
+            if data["doc_count"] != doc_count or data["snapshot_bytes"] != snapshot_bytes:
+                return False
+
+            self.clear()
+            self.doc_count = data["doc_count"]
+            self.doc_lengths = data["doc_lengths"]
+            self.total_lengths = {f: sum(lengths) for f, lengths in self.doc_lengths.items()}
+            self.postings = {
+                field: {term: {d: tf for d, tf in docs} for term, docs in postings.items()}
+                for field, postings in data["postings"].items()
+            }
+            return True
+        except Exception as e:
+            print(f"⚠️ Search index unreadable, rebuilding: {e}")
+            self.clear()
+            return False
+
+    @staticmethod
+    def path_for(knowledge_file: str) -> str:
+        return f"{os.path.splitext(knowledge_file)[0]}.index.json"
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "documents": self.doc_count,
+            "terms": {field: len(postings) for field, postings in self.postings.items()}
+        }
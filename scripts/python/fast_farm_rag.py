@@ -6,10 +6,18 @@ Lightweight RAG system using simple text matching + embeddings
 
 import json
 import os
-from typing import Dict, List, Any
+import time
+import heapq
+from collections import Counter
+from typing import Dict, List, Any, Iterable
 from dataclasses import dataclass, asdict
 from datetime import datetime
 
+from knowledge_store import KnowledgeLogStore
+from farm_search_index import FarmSearchIndex, tokenize
+
+JADAM_TERMS = ['jadam', 'jwa', 'jms', 'js', 'jhs', 'jlf']
+
 @dataclass
 class FarmKnowledge:
     """Farm-specific knowledge entry"""
@@ -25,36 +33,74 @@ class FastFarmRAG:
     
     def __init__(self):
         self.knowledge_file = "/opt/sites/admin.middleworldfarms.org/farm_knowledge.json"
+        self.store = KnowledgeLogStore(self.knowledge_file)
+        self.index = FarmSearchIndex(FarmSearchIndex.path_for(self.knowledge_file))
         self.knowledge_base: List[FarmKnowledge] = []
         self.load_knowledge()
         self.seed_initial_knowledge()
     
     def load_knowledge(self):
-        """Load existing knowledge from file"""
-        if os.path.exists(self.knowledge_file):
-            try:
-                with open(self.knowledge_file, 'r') as f:
-                    data = json.load(f)
-                    self.knowledge_base = [
-                        FarmKnowledge(**item) for item in data
-                    ]
-                print(f"✅ Loaded {len(self.knowledge_base)} knowledge entries")
-            except Exception as e:
-                print(f"⚠️ Error loading knowledge: {e}")
-                self.knowledge_base = []
-        else:
+        """Load the knowledge snapshot and replay the append log on top"""
+        try:
+            self.knowledge_base = [
+                FarmKnowledge(**item) for item in self.store.load()
+            ]
+            if self.knowledge_base:
+                print(f"✅ Loaded {len(self.knowledge_base)} knowledge entries "
+                      f"({self.store.tail_records} from append log)")
+        except Exception as e:
+            print(f"⚠️ Error loading knowledge: {e}")
             self.knowledge_base = []
+        self.load_index()
+    
+    def load_index(self):
+        """Load the persisted search index for the snapshot, then index the log tail"""
+        snapshot_count = len(self.knowledge_base) - self.store.tail_records
+        if self.index.load(snapshot_count, self._snapshot_bytes()):
+            start = snapshot_count
+        else:
+            self.index.clear()
+            start = 0
+        for doc_id in range(start, len(self.knowledge_base)):
+            self._index_entry(doc_id)
+        if start == 0 and self.knowledge_base:
+            print(f"🔎 Rebuilt search index for {len(self.knowledge_base)} entries")
+    
+    def _index_entry(self, doc_id: int):
+        kb = self.knowledge_base[doc_id]
+        self.index.add(doc_id, kb.topic, kb.content, kb.tags)
+    
+    def _snapshot_bytes(self) -> int:
+        if os.path.exists(self.knowledge_file):
+            return os.path.getsize(self.knowledge_file)
+        return 0
     
     def save_knowledge(self):
-        """Save knowledge to file"""
+        """Compact the append log into a fresh knowledge snapshot"""
         try:
-            data = [asdict(kb) for kb in self.knowledge_base]
-            with open(self.knowledge_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            records = self.store.compact()
+            on_disk = Counter(self._record_key(item) for item in records)
+            on_disk.subtract(self._record_key(asdict(kb)) for kb in self.knowledge_base)
+            unsaved = -sum(n for n in on_disk.values() if n < 0)
+            if unsaved:
+                # Every entry must go through the store before compaction; never drop one silently
+                raise RuntimeError(f"{unsaved} in-memory knowledge entries are missing from the store log")
+            if len(records) != len(self.knowledge_base):
+                # Another process appended since we loaded - adopt the merged set and its order
+                self.knowledge_base = [FarmKnowledge(**item) for item in records]
+                self.index.clear()
+                for doc_id in range(len(self.knowledge_base)):
+                    self._index_entry(doc_id)
+            # The index is persisted against the snapshot so startup can skip the rebuild
+            self.index.save(self._snapshot_bytes())
             print(f"💾 Saved {len(self.knowledge_base)} knowledge entries")
         except Exception as e:
             print(f"❌ Error saving knowledge: {e}")
     
+    @staticmethod
+    def _record_key(record: Dict[str, Any]) -> str:
+        return json.dumps(record, sort_keys=True)
+    
     def seed_initial_knowledge(self):
         """Add initial Middle World Farms knowledge"""
         if len(self.knowledge_base) > 0:
@@ -119,16 +165,19 @@ class FastFarmRAG:
             )
         ]
         
-        self.knowledge_base.extend(initial_knowledge)
+        self.store.append_many([asdict(kb) for kb in initial_knowledge])
+        for kb in initial_knowledge:
+            self.knowledge_base.append(kb)
+            self._index_entry(len(self.knowledge_base) - 1)
         self.save_knowledge()
         print(f"🌱 Seeded {len(initial_knowledge)} initial knowledge entries")
     
     def search_knowledge(self, query: str, max_results: int = 3) -> List[FarmKnowledge]:
-        """Improved knowledge search that actually works"""
+        """BM25 search over the inverted index (topic, content and tags)"""
         query_lower = query.lower().strip()
         
         # Extract key terms from the query
-        query_terms = set(query_lower.split())
+        query_terms = set(tokenize(query_lower))
         
         # Remove common stop words that don't help with search
         stop_words = {'is', 'it', 'to', 'make', 'how', 'what', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'for', 'with', 'by', 'should', 'i', 'be', 'worried', 'safe'}
@@ -138,49 +187,28 @@ class FastFarmRAG:
         expanded_terms = set(meaningful_terms)
         for term in meaningful_terms:
             if 'jwa' in term or 'wetting' in term or 'agent' in term:
-                expanded_terms.update(['jwa', 'wetting', 'agent', 'wetting_agent', 'jadam'])
+                expanded_terms.update(['jwa', 'wetting', 'agent', 'jadam'])
             elif 'jadam' in term:
                 expanded_terms.update(['jwa', 'jms', 'js', 'jhs', 'jlf'])
             elif 'sulfur' in term or 'sulpher' in term:
                 expanded_terms.update(['sulfur', 'js', 'jadam'])
         
-        scored_results = []
-        
-        for kb in self.knowledge_base:
-            score = 0
-            topic_lower = kb.topic.lower()
-            content_lower = kb.content.lower()
-            tags_lower = ' '.join(kb.tags).lower()
-            
-            # High priority: exact topic matches
-            for term in expanded_terms:
-                if term in topic_lower:
-                    score += 10
-            
-            # Medium priority: content matches
-            for term in expanded_terms:
-                if term in content_lower:
-                    score += 3
-            
-            # Lower priority: tag matches  
-            for term in expanded_terms:
-                if term in tags_lower:
-                    score += 2
-            
-            # Boost for JADAM-related queries
-            if any(jadam_term in query_lower for jadam_term in ['jadam', 'jwa', 'jms', 'js', 'jhs', 'jlf']):
-                if any(jadam_term in topic_lower for jadam_term in ['jadam', 'jwa', 'jms', 'js', 'jhs', 'jlf']):
-                    score += 15
-            
-            # Apply confidence multiplier
-            score *= kb.confidence
-            
-            if score > 0:
-                scored_results.append((score, kb))
-        
-        # Sort by score (highest first) and return top results
-        scored_results.sort(key=lambda x: x[0], reverse=True)
-        return [kb for _, kb in scored_results[:max_results]]
+        scores = self.index.score(expanded_terms)
+        
+        # Boost for JADAM-related queries
+        if any(jadam_term in query_terms for jadam_term in JADAM_TERMS):
+            for doc_id in self.index.docs_with_term('topic', JADAM_TERMS):
+                scores[doc_id] = scores.get(doc_id, 0.0) + 15
+        
+        # Apply confidence multiplier
+        scored_results = [
+            (score * self.knowledge_base[doc_id].confidence, doc_id)
+            for doc_id, score in scores.items()
+        ]
+        
+        # Highest scores first; earlier entries win ties as before
+        top = heapq.nlargest(max_results, ((s, -d) for s, d in scored_results if s > 0))
+        return [self.knowledge_base[-neg_id] for _, neg_id in top]
     
     def add_knowledge(self, topic: str, content: str, source: str, 
                      confidence: float = 0.8, tags: List[str] = None):
@@ -197,10 +225,69 @@ class FastFarmRAG:
             tags=tags
         )
         
+        # Append one record instead of rewriting the whole knowledge file
+        self.store.append(asdict(new_knowledge))
         self.knowledge_base.append(new_knowledge)
-        self.save_knowledge()
+        self._index_entry(len(self.knowledge_base) - 1)
+        if self.store.needs_compaction():
+            self.save_knowledge()
         print(f"📝 Added knowledge: {topic}")
     
+    def bulk_add(self, entries: Iterable[Dict[str, Any]], batch_size: int = 100) -> List[Dict[str, Any]]:
+        """Stream knowledge entries into the store, one durable commit per batch
+        
+        `entries` may be any iterable or generator of dicts with topic, content
+        and optional source, confidence and tags. Returns per-batch stats.
+        """
+        batch_stats = []
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                batch_stats.append(self._commit_batch(batch, len(batch_stats) + 1))
+                batch = []
+        if batch:
+            batch_stats.append(self._commit_batch(batch, len(batch_stats) + 1))
+        
+        if self.store.needs_compaction():
+            self.save_knowledge()
+        return batch_stats
+    
+    def _commit_batch(self, entries: List[Dict[str, Any]], batch_number: int) -> Dict[str, Any]:
+        """Append a batch with a single fsync, then index it"""
+        started = time.perf_counter()
+        today = datetime.now().strftime("%Y-%m-%d")
+        
+        new_knowledge = []
+        skipped = 0
+        for entry in entries:
+            if not entry.get("topic") or not entry.get("content"):
+                skipped += 1
+                continue
+            new_knowledge.append(FarmKnowledge(
+                topic=entry["topic"],
+                content=entry["content"],
+                source=entry.get("source", "manual"),
+                confidence=float(entry.get("confidence", 0.8)),
+                last_updated=today,
+                tags=list(entry.get("tags") or [])
+            ))
+        
+        if new_knowledge:
+            self.store.append_many([asdict(kb) for kb in new_knowledge])
+            for kb in new_knowledge:
+                self.knowledge_base.append(kb)
+                self._index_entry(len(self.knowledge_base) - 1)
+        
+        stats = {
+            "batch": batch_number,
+            "added": len(new_knowledge),
+            "skipped": skipped,
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+        print(f"📦 Batch {batch_number}: added {stats['added']} entries ({skipped} skipped) in {stats['seconds']}s")
+        return stats
+    
     def get_context_for_query(self, query: str) -> str:
         """Get formatted context for AI prompt"""
         relevant_knowledge = self.search_knowledge(query, max_results=3)
@@ -235,6 +322,10 @@ def add_farm_knowledge(topic: str, content: str, source: str = "manual",
     """Quick function to add knowledge"""
     farm_rag.add_knowledge(topic, content, source, confidence, tags)
 
+def add_farm_knowledge_bulk(entries: Iterable[Dict[str, Any]], batch_size: int = 100) -> List[Dict[str, Any]]:
+    """Quick function to stream many knowledge entries in batches"""
+    return farm_rag.bulk_add(entries, batch_size)
+
 if __name__ == "__main__":
     # Test the system
     print("🧪 Testing Fast Farm RAG...")
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Few-Shot Example Library for Middle World Farms
+Embedding-indexed Q&A examples: only the most relevant ones go into each prompt
+"""
+
+import os
+import sys
+import json
+import logging
+import time
+import datetime
+import threading
+from typing import Dict, List, Any, Optional
+
+# Embedding engine, cache and token estimates live in the ai_service package
+AI_SERVICE_PATH = os.getenv('AI_SERVICE_PATH', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'ai_service'))
+if AI_SERVICE_PATH not in sys.path:
+    sys.path.append(AI_SERVICE_PATH)
+from app.services.embedding_service import embedding_engine
+from app.services.prompt_assembler import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def _dot(a: List[float], b: List[float]) -> float:
+    # Embeddings are normalized, so this is cosine similarity
+    return sum(x * y for x, y in zip(a, b))
+
+
+class FewShotLibrary:
+    """Q&A examples indexed by the embedding of their question.
+
+    Seeds are the hand-written examples from EnhancedFarmingPrompts; harvested
+    examples from well-rated logged conversations are appended to a JSONL
+    file. Example embeddings go through the shared embedding cache, so they
+    are only computed once per text. select() never embeds anything itself:
+    until build_index() has run (at service startup, off the event loop) or
+    without a question embedding, examples are ranked by keywords instead.
+    """
+
+    def __init__(self, seed_examples: List[Dict[str, str]], path: Optional[str] = None):
+        self.path = path or os.getenv('FEW_SHOT_LIBRARY_PATH', os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'few_shot_examples.jsonl'))
+        self.top_k = int(os.getenv('FEW_SHOT_TOP_K', '2'))
+        self.max_tokens = int(os.getenv('FEW_SHOT_MAX_TOKENS', '600'))
+        self.min_similarity = float(os.getenv('FEW_SHOT_MIN_SIMILARITY', '0.3'))
+
+        self.examples: List[Dict[str, Any]] = [
+            {**example, "source": "seed", "quality_score": None} for example in seed_examples
+        ]
+        self.examples.extend(self._load_harvested())
+        self._embeddings: Optional[List[List[float]]] = None
+        self._lock = threading.Lock()
+
+    def _load_harvested(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        harvested = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    harvested.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return harvested
+
+    def build_index(self) -> List[List[float]]:
+        """Embed every example question (blocking; call from a worker thread)."""
+        with self._lock:
+            if self._embeddings is None or len(self._embeddings) != len(self.examples):
+                started = time.perf_counter()
+                self._embeddings = embedding_engine.encode_cached([example["question"] for example in self.examples])
+                logger.info(f"📚 Indexed {len(self.examples)} few-shot examples in {time.perf_counter() - started:.2f}s")
+            return self._embeddings
+
+    def example_tokens(self, example: Dict[str, Any]) -> int:
+        return estimate_tokens(example["question"]) + estimate_tokens(example["answer"])
+
+    def _keyword_rank(self, question: str) -> List[tuple]:
+        # Fallback when no embedding model is available: share of question words found in the example
+        words = {w for w in question.lower().split() if len(w) > 3}
+        ranked = []
+        for example in self.examples:
+            text = f"{example['question']} {example['answer']}".lower()
+            ranked.append((sum(1 for w in words if w in text) / max(len(words), 1), example))
+        return ranked
+
+    def select(self, question: str, question_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Top-k examples most similar to the question that fit under the token cap."""
+        index = self._embeddings
+        if question_embedding is not None and index is not None and len(index) == len(self.examples):
+            ranked = [(_dot(question_embedding, vector), example) for vector, example in zip(index, self.examples)]
+        else:
+            ranked = self._keyword_rank(question)
+        ranked.sort(key=lambda pair: pair[0], reverse=True)
+
+        selected, used = [], 0
+        for score, example in ranked:
+            if len(selected) >= self.top_k or score < self.min_similarity:
+                break
+            cost = self.example_tokens(example)
+            if used + cost > self.max_tokens:
+                continue  # a shorter, slightly less similar example may still fit
+            selected.append(example)
+            used += cost
+        if ranked:
+            logger.info(f"📚 Few-shot: {len(selected)} example(s), ~{used} tokens, best score {ranked[0][0]:.2f}")
+        return selected
+
+    def harvest(self, log_file: str, min_quality: float = 4.0, include_unscored: bool = False, max_new: int = 20,
+                min_chars: int = 200, max_chars: int = 2400, duplicate_similarity: float = 0.92) -> Dict[str, Any]:
+        """Add well-rated logged conversations as examples, skipping near-duplicate questions.
+
+        Unscored conversations only qualify with include_unscored, as in export_for_training.
+        """
+        if not os.path.exists(log_file):
+            return {"added": 0, "total": len(self.examples), "error": f"No conversation log at {log_file}"}
+
+        candidates = []
+        with open(log_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    conv = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                score = conv.get("quality_score")
+                if score is None and not include_unscored:
+                    continue
+                if score is not None and score < min_quality:
+                    continue
+                if not (min_chars <= len(conv.get("answer", "")) <= max_chars):
+                    continue
+                candidates.append(conv)
+        # Best rated first, newest breaking ties
+        candidates.sort(key=lambda c: (c.get("quality_score") or 0, c.get("timestamp", "")), reverse=True)
+
+        index = list(self.build_index())
+        added = []
+        for conv, vector in zip(candidates, embedding_engine.encode_cached([c["question"] for c in candidates])):
+            if len(added) >= max_new:
+                break
+            if any(_dot(vector, existing) >= duplicate_similarity for existing in index):
+                continue
+            example = {
+                "question": conv["question"],
+                "answer": conv["answer"],
+                "source": "conversation",
+                "quality_score": conv.get("quality_score"),
+                "harvested_at": datetime.datetime.now().isoformat()
+            }
+            added.append(example)
+            index.append(vector)
+
+        if added:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for example in added:
+                    f.write(json.dumps(example) + "\n")
+            with self._lock:
+                self.examples.extend(added)
+                self._embeddings = index
+            logger.info(f"🌱 Harvested {len(added)} few-shot example(s) from {log_file}")
+
+        return {"added": len(added), "candidates": len(candidates), "total": len(self.examples)}
+
+    def get_stats(self) -> Dict[str, Any]:
+        sources: Dict[str, int] = {}
+        for example in self.examples:
+            sources[example["source"]] = sources.get(example["source"], 0) + 1
+        return {
+            "examples": len(self.examples),
+            "by_source": sources,
+            "top_k": self.top_k,
+            "max_tokens": self.max_tokens,
+            "min_similarity": self.min_similarity,
+            "indexed": self._embeddings is not None,
+            "path": self.path
+        }
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Append-only Knowledge Store for Fast Farm RAG
+Log-structured persistence: every add appends one record to a segment file,
+compaction folds the segments into the JSON snapshot
+"""
+
+import json
+import os
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterable
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+    print("⚠️ fcntl not available - knowledge store is safe for a single process only")
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl"
+COMPACTION_MARKER = "COMPACTING"
+LOCK_FILE = "LOCK"
+
+
+class KnowledgeLogStore:
+    """Snapshot + append-only segment log for knowledge records
+
+    The snapshot keeps the original farm_knowledge.json format (a JSON array),
+    so existing files import transparently and other readers keep working.
+    Records added since the last compaction live in numbered JSONL segments
+    in <snapshot>.segments/ and are replayed on top of the snapshot at startup.
+
+    Several processes (the 8005 service, scrapers) share one store, so load,
+    append and compaction each hold an exclusive flock on the segment
+    directory, and compaction builds the snapshot from what is on disk
+    rather than from one process's in-memory copy.
+    """
+
+    def __init__(self, snapshot_file: str, segment_max_records: int = 500,
+                 compact_threshold: int = 2000):
+        self.snapshot_file = snapshot_file
+        self.segment_dir = f"{snapshot_file}.segments"
+        self.segment_max_records = segment_max_records
+        self.compact_threshold = compact_threshold
+
+        self.tail_records = 0
+        self._active_segment = None
+        self._active_records = 0
+
+    # ------------------------------------------------------------------
+    # Locking
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _locked(self):
+        """Exclusive cross-process lock on the store for the duration of the block"""
+        os.makedirs(self.segment_dir, exist_ok=True)
+        if not FCNTL_AVAILABLE:
+            yield
+            return
+        with open(os.path.join(self.segment_dir, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def load(self) -> List[Dict[str, Any]]:
+        """Return snapshot records followed by every record in the segment tail"""
+        with self._locked():
+            self._recover_interrupted_compaction()
+            snapshot, tail, segments = self._read_disk()
+            if segments:
+                self._active_segment = segments[-1]
+                self._active_records = sum(1 for _ in self._read_segment(self._active_segment))
+
+        self.tail_records = len(tail)
+        return snapshot + tail
+
+    def _read_disk(self):
+        """Snapshot records, segment records and the segments read - caller holds the lock"""
+        snapshot: List[Dict[str, Any]] = []
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, 'r') as f:
+                snapshot = json.load(f)
+
+        tail: List[Dict[str, Any]] = []
+        segments = self._segment_paths()
+        for path in segments:
+            tail.extend(self._read_segment(path))
+        return snapshot, tail, segments
+
+    def _read_segment(self, path: str) -> Iterable[Dict[str, Any]]:
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final write from a crash - everything before it is intact
+                    print(f"⚠️ Skipping damaged record in {os.path.basename(path)}")
+
+    def _recover_interrupted_compaction(self):
+        """Finish or roll back a compaction that was interrupted by a crash"""
+        marker = os.path.join(self.segment_dir, COMPACTION_MARKER)
+        if not os.path.exists(marker):
+            return
+        try:
+            with open(marker, 'r') as f:
+                state = json.load(f)
+            snapshot_replaced = (os.path.exists(self.snapshot_file) and
+                                 os.path.getsize(self.snapshot_file) == state["snapshot_bytes"])
+            if snapshot_replaced:
+                # Snapshot already contains these segments, drop them
+                for path in self._segment_paths():
+                    if self._segment_number(path) <= state["through"]:
+                        os.remove(path)
+        except Exception as e:
+            print(f"⚠️ Could not recover interrupted compaction: {e}")
+        os.remove(marker)
+
+    # ------------------------------------------------------------------
+    # Appending
+    # ------------------------------------------------------------------
+    def append(self, record: Dict[str, Any]):
+        """Durably append a single record"""
+        self.append_many([record])
+
+    def append_many(self, records: List[Dict[str, Any]]):
+        """Durably append records with a single fsync per segment touched"""
+        pending = list(records)
+        with self._locked():
+            while pending:
+                # Another process may have compacted our segment away or rolled a newer one
+                segments = self._segment_paths()
+                if (self._active_segment is None or self._active_records >= self.segment_max_records
+                        or not segments or segments[-1] != self._active_segment):
+                    self._roll_segment(segments)
+
+                room = self.segment_max_records - self._active_records
+                chunk, pending = pending[:room], pending[room:]
+
+                with open(self._active_segment, 'a') as f:
+                    f.write(''.join(json.dumps(r) + '\n' for r in chunk))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                self._active_records += len(chunk)
+                self.tail_records += len(chunk)
+
+    def _roll_segment(self, segments: List[str]):
+        os.makedirs(self.segment_dir, exist_ok=True)
+        number = self._segment_number(segments[-1]) + 1 if segments else 1
+        self._active_segment = os.path.join(self.segment_dir, f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}")
+        self._active_records = 0
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+    def needs_compaction(self) -> bool:
+        return self.tail_records >= self.compact_threshold
+
+    def compact(self) -> List[Dict[str, Any]]:
+        """Fold the segments into a fresh snapshot and drop them
+
+        The snapshot is rebuilt from disk under the store lock, so records
+        appended by other processes are kept and only the segments folded in
+        are deleted. Returns the complete record set, which may include
+        records this process has not seen yet.
+        """
+        with self._locked():
+            snapshot, tail, segments = self._read_disk()
+            records = snapshot + tail
+            self._write_snapshot(records, segments)
+
+        self.tail_records = 0
+        self._active_segment = None
+        self._active_records = 0
+        return records
+
+    def _write_snapshot(self, records: List[Dict[str, Any]], segments: List[str]):
+        through = self._segment_number(segments[-1]) if segments else 0
+
+        payload = json.dumps(records, indent=2)
+        tmp_file = f"{self.snapshot_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Record intent so a crash between replace and cleanup can't replay twice
+        os.makedirs(self.segment_dir, exist_ok=True)
+        marker = os.path.join(self.segment_dir, COMPACTION_MARKER)
+        with open(marker, 'w') as f:
+            json.dump({"through": through, "snapshot_bytes": os.path.getsize(tmp_file)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_file, self.snapshot_file)
+        for path in segments:
+            os.remove(path)
+        os.remove(marker)
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    def _segment_paths(self) -> List[str]:
+        if not os.path.isdir(self.segment_dir):
+            return []
+        names = [n for n in os.listdir(self.segment_dir)
+                 if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX)]
+        return [os.path.join(self.segment_dir, n) for n in sorted(names)]
+
+    @staticmethod
+    def _segment_number(path: str) -> int:
+        name = os.path.basename(path)
+        return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "snapshot_file": self.snapshot_file,
+            "segments": len(self._segment_paths()),
+            "tail_records": self.tail_records,
+            "compact_threshold": self.compact_threshold
+        }
@@ -5,7 +5,7 @@ Extracts farm-specific knowledge from middleworldfarms.org
 """
 
 import requests
-from fast_farm_rag import add_farm_knowledge
+from fast_farm_rag import add_farm_knowledge_bulk
 
 def scrape_middleworldfarms_knowledge():
     """Extract Middle World Farms specific knowledge"""
@@ -58,21 +58,13 @@ def scrape_middleworldfarms_knowledge():
         }
     ]
     
-    # Add knowledge to RAG system
+    # Add knowledge to RAG system in one batch
     added_count = 0
-    for knowledge in farm_knowledge:
-        try:
-            add_farm_knowledge(
-                topic=knowledge["topic"],
-                content=knowledge["content"],
-                source=knowledge["source"],
-                confidence=knowledge["confidence"],
-                tags=knowledge["tags"]
-            )
-            added_count += 1
-            print(f"✅ Added: {knowledge['topic']}")
-        except Exception as e:
-            print(f"❌ Failed to add {knowledge['topic']}: {e}")
+    try:
+        batch_stats = add_farm_knowledge_bulk(farm_knowledge)
+        added_count = sum(batch["added"] for batch in batch_stats)
+    except Exception as e:
+        print(f"❌ Failed to add Middle World Farms knowledge: {e}")
     
     return added_count
 
@@ -103,15 +95,8 @@ def add_farm_specific_growing_knowledge():
         }
     ]
     
-    for knowledge in growing_knowledge:
-        add_farm_knowledge(
-            topic=knowledge["topic"],
-            content=knowledge["content"],
-            source=knowledge["source"],
-            confidence=knowledge["confidence"],
-            tags=knowledge["tags"]
-        )
-        print(f"📈 Added growing insight: {knowledge['topic']}")
+    add_farm_knowledge_bulk(growing_knowledge)
+    print(f"📈 Added {len(growing_knowledge)} growing insights")
 
 def scrape_farm_website():
     """Main function to scrape Middle World Farms knowledge"""
@@ -8,21 +8,36 @@ Ollama AI Service for RunPod Integration with Fast Farm RAG
 """
 
 import os
+import sys
+import json
 import time
+import asyncio
 import logging
 import requests
-from typing import Dict, Any
-from fastapi import FastAPI
+from contextlib import aclosing
+from typing import Dict, Any, List, Tuple
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
 
+# Shared async Ollama client lives in the ai_service package
+AI_SERVICE_PATH = os.getenv('AI_SERVICE_PATH', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'ai_service'))
+sys.path.append(AI_SERVICE_PATH)
+from app.services.ollama_client import (OllamaClient, OllamaBusy, sse_event, SSE_HEADERS, ClientDisconnected,
+                                        cancel_on_disconnect, stream_until_disconnect)
+from app.services.answer_cache import answer_cache, embed_for_cache, context_fingerprint
+from app.services.model_warmup import ModelWarmupScheduler
+from app.services.llm_admission import llm_admission
+
 # Import our fast farm RAG system
-from fast_farm_rag import get_farm_context, add_farm_knowledge, farm_rag
+from fast_farm_rag import get_farm_context, add_farm_knowledge, add_farm_knowledge_bulk, farm_rag
 
 # Import enhanced prompts
-from enhanced_prompts import get_enhanced_farming_prompt
+from enhanced_prompts import get_enhanced_farming_prompt, harvest_few_shot_examples, enhanced_prompts
 
 # Import conversation logger for training data collection
-from conversation_logger import log_farming_conversation, get_training_data_stats
+from conversation_logger import log_farming_conversation, get_training_data_stats, conversation_logger
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -30,10 +45,17 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Ollama AI Service - RunPod Integration")
 
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    """The PHP caller timed out and its generation was cancelled; nobody reads this response"""
+    logger.info(f"🔌 {exc}")
+    return Response(status_code=499)
+
 class QuestionRequest(BaseModel):
     question: str
     context: str = "general"
     variety_name: str = None
+    lane: str = "admin"  # admission lane: admin, public or background
 
 class KnowledgeRequest(BaseModel):
     topic: str
@@ -42,9 +64,27 @@ class KnowledgeRequest(BaseModel):
     confidence: float = 0.8
     tags: list = []
 
+class BulkKnowledgeRequest(BaseModel):
+    entries: List[KnowledgeRequest]
+    batch_size: int = 100
+
+class HarvestRequest(BaseModel):
+    min_quality: float = 4.0
+    include_unscored: bool = False  # unrated conversations with substantial answers
+    max_new: int = 20
+
 # RunPod Ollama Configuration via SSH Tunnel
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
 MODEL_NAME = "mistral:7b"
+OLLAMA_OPTIONS = {
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "max_tokens": 300
+}
+
+# Pooled keep-alive connections to the RunPod Ollama instance; succession planning is admin traffic
+ollama_client = OllamaClient(base_url=OLLAMA_URL, lane="admin")
+model_warmup = ModelWarmupScheduler(ollama_client, primary_model=MODEL_NAME)
 
 # farmOS Configuration (same as before)
 FARMOS_CONFIG = {
@@ -122,44 +162,32 @@ class FarmOSIntegration:
 # Initialize farmOS integration
 farmos = FarmOSIntegration()
 
-async def call_ollama_api(prompt: str, max_retries: int = 2) -> Dict[str, Any]:
+async def call_ollama_api(prompt: str, max_retries: int = 2, lane: str = "admin") -> Dict[str, Any]:
     """Call Ollama API on RunPod"""
     
-    payload = {
-        "model": MODEL_NAME,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "max_tokens": 300
+    try:
+        logger.info(f"Calling Ollama on RunPod: {OLLAMA_URL}/api/generate")
+        
+        # Retries back off with asyncio.sleep, so other requests keep being served
+        result = await ollama_client.generate(
+            prompt,
+            model=MODEL_NAME,
+            options=OLLAMA_OPTIONS,
+            timeout=30,
+            retries=max_retries - 1,
+            lane=lane
+        )
+        return {
+            "success": True, 
+            "answer": result.get("response", "No response"),
+            "model": MODEL_NAME
         }
-    }
-    
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Calling Ollama on RunPod: {OLLAMA_URL}/api/generate")
-            
-            response = requests.post(
-                f"{OLLAMA_URL}/api/generate", 
-                json=payload, 
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return {
-                    "success": True, 
-                    "answer": result.get("response", "No response"),
-                    "model": MODEL_NAME
-                }
-            else:
-                logger.warning(f"Ollama API returned {response.status_code}: {response.text}")
-                
-        except Exception as e:
-            logger.error(f"Ollama API call failed (attempt {attempt+1}): {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2)
+    except OllamaBusy as e:
+        # Shed by the admission queue: answer from the fallbacks right away
+        logger.warning(f"⏳ {e}")
+        return {"success": False, "error": str(e), "busy": True}
+    except Exception as e:
+        logger.error(f"Ollama API call failed: {e}")
     
     return {"success": False, "error": f"Ollama API unavailable after {max_retries} attempts"}
 
@@ -211,8 +239,9 @@ Based on your farmOS data and farming knowledge:
 
 This system learns from YOUR farmOS data!"""
 
-async def get_smart_farming_answer(question: str, variety_name: str = None) -> Dict[str, Any]:
-    """Get farming advice using farmOS database + Ollama AI"""
+async def build_smart_farming_prompt(question: str, variety_name: str = None,
+                                     question_embedding: List[float] = None) -> Tuple[str, Dict[str, Any], str]:
+    """Gather farmOS data and farm RAG context and build the few-shot prompt"""
     
     # Step 1: Get farmOS data if variety specified
     farmos_data = {}
@@ -248,36 +277,17 @@ async def get_smart_farming_answer(question: str, variety_name: str = None) -> D
         question=question,
         farm_context=farm_context,
         farmos_context=farmos_context,
-        variety_name=variety_name
+        variety_name=variety_name,
+        model=MODEL_NAME,
+        question_embedding=question_embedding
     )
 
-    # Step 4: Try Enhanced Ollama AI with RAG + Few-Shot Learning
-    logger.info(f"🤖 Calling Enhanced Ollama AI with farmOS + RAG + Few-Shot Examples...")
-    ai_result = await call_ollama_api(farming_prompt)
-    
-    if ai_result["success"]:
-        response_data = {
-            "success": True,
-            "answer": ai_result["answer"],
-            "model": f"ollama_{MODEL_NAME}_enhanced_with_few_shot",
-            "cost": "RunPod compute time only",
-            "farmos_integration": True,
-            "rag_integration": True,
-            "few_shot_learning": True,
-            "variety_data": farmos_data,
-            "farm_context": farm_context
-        }
-        
-        # Log conversation for future training data
-        log_farming_conversation(
-            question=question,
-            answer=ai_result["answer"],
-            context=response_data
-        )
-        
-        return response_data
+    return farming_prompt, farmos_data, farm_context
+
+def fallback_farming_answer(question: str, farmos_data: Dict[str, Any], farm_context: str) -> Dict[str, Any]:
+    """Answer without the LLM: farmOS data first, then the knowledge base"""
     
-    # Step 4: Fallback with farmOS data only
+    # Fallback with farmOS data only
     if farmos_data:
         fallback_answer = enhance_with_farmos_and_ai(farmos_data, question)
         return {
@@ -288,7 +298,7 @@ async def get_smart_farming_answer(question: str, variety_name: str = None) -> D
             "method": "farmos_database_integration"
         }
     
-    # Step 5: Use knowledge base for intelligent fallback
+    # Use knowledge base for intelligent fallback
     if farm_context:
         # Clean up the knowledge base response and make it conversational
         # Remove metadata formatting and present the actual information
@@ -346,13 +356,97 @@ By the way, if you add more variety data to your farmOS database, I can give you
         "cost": "FREE"
     }
 
+async def get_smart_farming_answer(question: str, variety_name: str = None, lane: str = "admin") -> Dict[str, Any]:
+    """Get farming advice using farmOS database + Ollama AI"""
+    
+    # One question embedding picks the few-shot examples and keys the answer cache
+    question_embedding = await embed_for_cache(question)
+
+    # Steps 1-3: farmOS data, farm RAG context and the enhanced prompt
+    farming_prompt, farmos_data, farm_context = await build_smart_farming_prompt(question, variety_name,
+                                                                                 question_embedding)
+
+    # Paraphrased questions over the same farmOS + knowledge context reuse the last answer
+    fingerprint = context_fingerprint([farm_context, json.dumps(farmos_data, sort_keys=True, default=str)])
+    cached = answer_cache.lookup(question_embedding, MODEL_NAME, fingerprint)
+    if cached is not None:
+        logger.info(f"♻️ Semantic cache hit (similarity {cached['cache_similarity']})")
+        return {**cached, "cached": True}
+
+    # Step 4: Try Enhanced Ollama AI with RAG + Few-Shot Learning
+    logger.info(f"🤖 Calling Enhanced Ollama AI with farmOS + RAG + Few-Shot Examples...")
+    started = time.perf_counter()
+    ai_result = await call_ollama_api(farming_prompt, lane=lane)
+    generation_ms = (time.perf_counter() - started) * 1000.0
+    
+    if ai_result["success"]:
+        response_data = {
+            "success": True,
+            "answer": ai_result["answer"],
+            "model": f"ollama_{MODEL_NAME}_enhanced_with_few_shot",
+            "cost": "RunPod compute time only",
+            "farmos_integration": True,
+            "rag_integration": True,
+            "few_shot_learning": True,
+            "variety_data": farmos_data,
+            "farm_context": farm_context
+        }
+        
+        # Log conversation for future training data
+        log_farming_conversation(
+            question=question,
+            answer=ai_result["answer"],
+            context=response_data
+        )
+        
+        answer_cache.store(question_embedding, MODEL_NAME, fingerprint, response_data, generation_ms)
+        return response_data
+    
+    # Step 5: Fallbacks without the LLM
+    return fallback_farming_answer(question, farmos_data, farm_context)
+
+@app.on_event("startup")
+async def start_model_warmup():
+    """Preload the Ollama models in the background and keep them hot"""
+    model_warmup.start()
+
+@app.on_event("startup")
+async def index_few_shot_examples():
+    """Embed the few-shot library in the background; prompts rank examples by keywords until it is ready"""
+    def _build():
+        try:
+            enhanced_prompts.example_library.build_index()
+        except Exception as e:
+            logger.warning(f"⚠️ Few-shot index unavailable, keeping keyword ranking: {e}")
+
+    asyncio.get_running_loop().run_in_executor(None, _build)
+
+@app.on_event("shutdown")
+async def close_ollama_client():
+    """Release pooled keep-alive connections to Ollama"""
+    await model_warmup.stop()
+    await ollama_client.aclose()
+
+@app.post("/warmup")
+async def warmup_models():
+    """Queue zero-token keep_alive loads and return immediately with what is hot now"""
+    queued = model_warmup.schedule()
+    return {"success": True, "queued": queued, **await model_warmup.readiness()}
+
+@app.get("/readiness")
+async def readiness():
+    """Which models are resident in Ollama; ready means the primary model is hot"""
+    return await model_warmup.readiness()
+
 @app.post("/ask")
-async def ask_question(request: QuestionRequest):
+async def ask_question(request: QuestionRequest, http_request: Request):
     """Process farming questions using farmOS database + Ollama AI"""
     try:
         logger.info(f"📝 Processing: {request.question[:100]}...")
         
-        result = await get_smart_farming_answer(request.question, request.variety_name)
+        # Laravel gives up after 1-90 s; stop generating as soon as it does
+        result = await cancel_on_disconnect(
+            http_request, get_smart_farming_answer(request.question, request.variety_name, request.lane))
         
         return {
             **result,
@@ -362,6 +456,8 @@ async def ask_question(request: QuestionRequest):
             "savings": "99% cost reduction vs OpenAI/Claude"
         }
         
+    except ClientDisconnected:
+        raise
     except Exception as e:
         logger.error(f"❌ Error: {e}")
         return {
@@ -371,6 +467,50 @@ async def ask_question(request: QuestionRequest):
             "cost": "FREE"
         }
 
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest, http_request: Request):
+    """Streaming variant of /ask: relays Ollama's tokens as Server-Sent Events"""
+    logger.info(f"📝 Streaming: {request.question[:100]}...")
+    farming_prompt, farmos_data, farm_context = await build_smart_farming_prompt(
+        request.question, request.variety_name, await embed_for_cache(request.question))
+    
+    async def events():
+        answer_parts = []
+        try:
+            chunks = stream_until_disconnect(http_request, ollama_client.stream_generate(
+                farming_prompt, model=MODEL_NAME, options=OLLAMA_OPTIONS, lane=request.lane))
+            # aclosing: however the response ends, the Ollama stream is closed with it
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    if chunk.get("response"):
+                        answer_parts.append(chunk["response"])
+                        yield sse_event({"token": chunk["response"]}, event="token")
+                    if chunk.get("done"):
+                        logger.info(f"⚡ First token after {chunk.get('ttft_ms')} ms")
+                        yield sse_event({
+                            "model": f"ollama_{MODEL_NAME}_enhanced_with_few_shot",
+                            "ttft_ms": chunk.get("ttft_ms"),
+                            "tokens": chunk.get("eval_count"),
+                            "context": request.context
+                        }, event="done")
+            
+            # Log conversation for future training data
+            log_farming_conversation(
+                question=request.question,
+                answer="".join(answer_parts),
+                context={"model": f"ollama_{MODEL_NAME}_enhanced_with_few_shot", "variety_data": farmos_data,
+                         "farm_context": farm_context, "streamed": True}
+            )
+        except ClientDisconnected as e:
+            logger.info(f"🔌 {e}")
+        except Exception as e:
+            logger.error(f"❌ Streaming error: {e}")
+            # Only fall back if nothing was sent yet; otherwise just end the stream
+            fallback = fallback_farming_answer(request.question, farmos_data, farm_context) if not answer_parts else {}
+            yield sse_event({"error": str(e), **fallback}, event="error")
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.post("/add_knowledge")
 async def add_knowledge(request: KnowledgeRequest):
     """Add new farm knowledge to the RAG system"""
@@ -382,6 +522,7 @@ async def add_knowledge(request: KnowledgeRequest):
             confidence=request.confidence,
             tags=request.tags
         )
+        answer_cache.invalidate(f"added knowledge: {request.topic}")
         
         return {
             "success": True,
@@ -396,6 +537,30 @@ async def add_knowledge(request: KnowledgeRequest):
             "error": str(e)
         }
 
+@app.post("/add_knowledge/bulk")
+async def add_knowledge_bulk(request: BulkKnowledgeRequest):
+    """Add many farm knowledge entries with one durable commit per batch"""
+    try:
+        batch_stats = add_farm_knowledge_bulk(
+            (entry.dict() for entry in request.entries),
+            batch_size=max(1, request.batch_size)
+        )
+        answer_cache.invalidate("bulk knowledge import")
+        
+        return {
+            "success": True,
+            "added": sum(batch["added"] for batch in batch_stats),
+            "batches": batch_stats,
+            "knowledge_count": len(farm_rag.knowledge_base)
+        }
+        
+    except Exception as e:
+        logger.error(f"❌ Error adding knowledge in bulk: {e}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
 @app.get("/training-stats")
 async def get_training_stats():
     """Get training data collection statistics"""
@@ -404,20 +569,33 @@ async def get_training_stats():
         return {
             "success": True,
             "training_data": stats,
+            "few_shot_library": enhanced_prompts.example_library.get_stats(),
             "message": "Training data collection status"
         }
     except Exception as e:
         logger.error(f"Error getting training stats: {e}")
         return {"success": False, "error": str(e)}
 
+@app.post("/few-shot/harvest")
+async def harvest_few_shot(request: HarvestRequest):
+    """Add well-rated logged conversations to the few-shot example library"""
+    try:
+        result = await asyncio.to_thread(
+            harvest_few_shot_examples, conversation_logger.log_file, min_quality=request.min_quality,
+            include_unscored=request.include_unscored, max_new=request.max_new)
+        return {"success": "error" not in result, **result}
+    except Exception as e:
+        logger.error(f"❌ Error harvesting few-shot examples: {e}")
+        return {"success": False, "error": str(e)}
+
 @app.get("/health")
 async def health_check():
     """Health check with Ollama and farmOS connection status"""
     
     # Test Ollama connection
     try:
-        test_response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=5)
-        ollama_status = "Connected" if test_response.status_code == 200 else "Disconnected"
+        await ollama_client.get_json("/api/tags", timeout=5)
+        ollama_status = "Connected"
     except:
         ollama_status = "Disconnected"
     
@@ -430,6 +608,9 @@ async def health_check():
         "ollama_connection": ollama_status,
         "ollama_url": OLLAMA_URL,
         "model": MODEL_NAME,
+        "ollama_client": ollama_client.get_stats(),
+        "answer_cache": answer_cache.get_stats(),
+        "admission": llm_admission.get_stats(),
         "farmos_connection": farmos_status,
         "farmos_url": FARMOS_CONFIG['url'],
         "rag_system": "Fast Farm Knowledge Base",